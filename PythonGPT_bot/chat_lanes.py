@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Количество обновлений разных чатов, обрабатываемых одновременно
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))
+# Сколько обновлений одного чата может ждать своей очереди, остальные получают ответ «занят»
+CHAT_LANE_DEPTH = int(os.getenv("CHAT_LANE_DEPTH", "3"))
+
+BUSY_TEXT = "⏳ Я еще отвечаю на предыдущие сообщения. Подождите немного и отправьте снова."
+
+# Количество последних ожиданий, по которым считаются перцентили
+WAIT_SAMPLES = 1000
+
+
+class ChatLane:
+    """Очередь обновлений одного чата"""
+    __slots__ = ("lock", "waiting")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Ожидающие обновления и признак того, что к ним можно присоединять тексты
+        self.waiting: List[Tuple[Update, bool]] = []
+
+
+class ChatLaneProcessor(BaseUpdateProcessor):
+    """
+    Обработка обновлений с отдельной очередью для каждого чата.
+
+    Обновления одного чата выполняются строго по порядку (asyncio.Lock
+    выдается в порядке ожидания), а обновления разных чатов — параллельно,
+    не больше workers одновременно. В очереди чата ждут не больше depth
+    обновлений; на остальные сразу отвечает «занят». Если подряд пришло
+    несколько текстов, которые можно объединить, они присоединяются к
+    ожидающему тексту и обрабатываются одним запросом к модели.
+    """
+
+    def __init__(self, workers: int = UPDATE_WORKERS, depth: int = CHAT_LANE_DEPTH):
+        """
+        Args:
+            workers (int): Количество одновременно обрабатываемых чатов
+            depth (int): Количество ожидающих обновлений одного чата
+        """
+        # Семафор PTB ограничивает число принятых обновлений, включая ожидающие в очередях чатов
+        super().__init__(max_concurrent_updates=workers * (depth + 1))
+        self.workers = workers
+        self.depth = depth
+        # Можно ли присоединить текст обновления к ожидающему (задается приложением)
+        self.can_coalesce: Callable[[Update], bool] = lambda update: False
+        # Вызывается для отклоненных обновлений, которые не будут обработаны (задается приложением)
+        self.on_drop: Callable[[Update], Any] = lambda update: None
+        self._running = asyncio.Semaphore(workers)
+        self._lanes: Dict[Hashable, ChatLane] = {}
+        self._extra_texts: Dict[int, List[str]] = {}
+        # update_id присоединенных обновлений по update_id обновления, которое их обработает
+        self._extra_ids: Dict[int, List[int]] = {}
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.processed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def text_of(self, update: Update) -> Optional[str]:
+        """
+        Возвращает текст сообщения вместе с присоединенными к нему текстами
+
+        Args:
+            update (Update): Обновление с текстовым сообщением
+
+        Returns:
+            Optional[str]: Объединенный текст
+        """
+        extra = self._extra_texts.get(update.update_id)
+        if not extra:
+            return update.message.text
+        return "\n".join([update.message.text, *extra])
+
+    def merged_into(self, update_id: int) -> List[int]:
+        """
+        Возвращает update_id обновлений, тексты которых присоединены к обновлению
+
+        Такие обновления считаются обработанными только после обработки
+        обновления, к которому они присоединены.
+
+        Args:
+            update_id (int): update_id обновления
+
+        Returns:
+            List[int]: update_id присоединенных обновлений
+        """
+        return self._extra_ids.get(update_id, [])
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._running:
+                await coroutine
+            return
+
+        lane = self._lanes.get(chat.id)
+        if lane is None:
+            lane = self._lanes[chat.id] = ChatLane()
+
+        coalescible = self.can_coalesce(update)
+        if coalescible and lane.waiting and lane.waiting[-1][1]:
+            # Последнее ожидающее обновление — тоже текст: объединяем, второй запрос к модели не нужен
+            carrier = lane.waiting[-1][0].update_id
+            self._extra_texts.setdefault(carrier, []).append(update.message.text)
+            self._extra_ids.setdefault(carrier, []).append(update.update_id)
+            self.coalesced += 1
+            # Корутина обработки не запускалась, закрываем ее, чтобы не было предупреждения
+            coroutine.close()
+            return
+        if len(lane.waiting) >= self.depth:
+            self.rejected += 1
+            coroutine.close()
+            self.on_drop(update)
+            await self._reply_busy(update)
+            return
+
+        entry = (update, coalescible)
+        lane.waiting.append(entry)
+        queued = time.monotonic()
+        try:
+            async with lane.lock:
+                # Выполняющееся обновление больше не принимает присоединяемые тексты
+                lane.waiting.remove(entry)
+                async with self._running:
+                    self._waits.append(time.monotonic() - queued)
+                    await coroutine
+                    self.processed += 1
+        finally:
+            if entry in lane.waiting:
+                lane.waiting.remove(entry)
+            self._extra_texts.pop(update.update_id, None)
+            self._extra_ids.pop(update.update_id, None)
+            if not lane.waiting and not lane.lock.locked():
+                self._lanes.pop(chat.id, None)
+
+    @staticmethod
+    async def _reply_busy(update: Update):
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(BUSY_TEXT)
+            elif update.effective_message:
+                await update.effective_message.reply_text(BUSY_TEXT)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке ответа «занят»: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает статистику очередей и перцентили ожидания в секундах"""
+        waits = sorted(self._waits)
+
+        def percentile(share: float) -> float:
+            return round(waits[min(len(waits) - 1, int(len(waits) * share))], 3) if waits else 0.0
+
+        return {
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "active_chats": len(self._lanes),
+            "wait_p50": percentile(0.5),
+            "wait_p99": percentile(0.99)
+        }
+
+
+chat_lanes = ChatLaneProcessor()
@@ -5,31 +5,31 @@ QUIZ_TOPICS = {
     'programming': {
         'name': 'Программирование',
         'emoji': '💻',
-        'prompt': 'Создай вопрос о программировании, языках программирования или технологиях. Вопрос должен быть с вариантами ответов A, B, C, D. В конце укажи правильный ответ.'
+        'prompt': 'Создай вопрос о программировании, языках программирования или технологиях.'
     },
     'history': {
         'name': 'История',
         'emoji': '🏛️',
-        'prompt': 'Создай вопрос по истории, историческим событиям или личностям. Вопрос должен быть с вариантами ответов A, B, C, D. В конце укажи правильный ответ.'
+        'prompt': 'Создай вопрос по истории, историческим событиям или личностям.'
     },
     'science': {
         'name': 'Наука',
         'emoji': '🔬',
-        'prompt': 'Создай вопрос по физике, химии или биологии. Вопрос должен быть с вариантами ответов A, B, C, D. В конце укажи правильный ответ.'
+        'prompt': 'Создай вопрос по физике, химии или биологии.'
     },
     'geography': {
         'name': 'География',
         'emoji': '🌍',
-        'prompt': 'Создай вопрос по географии, странам, столицам или природе. Вопрос должен быть с вариантами ответов A, B, C, D. В конце укажи правильный ответ.'
+        'prompt': 'Создай вопрос по географии, странам, столицам или природе.'
     },
     'movies': {
         'name': 'Кино',
         'emoji': '🎬',
-        'prompt': 'Создай вопрос о фильмах, актерах или кинематографе. Вопрос должен быть с вариантами ответов A, B, C, D. В конце укажи правильный ответ.'
+        'prompt': 'Создай вопрос о фильмах, актерах или кинематографе.'
     }
 }
 
-def get_quiz_topics_keyboard() -> InlineKeyboardMarkup:
+def _build_quiz_topics_keyboard() -> InlineKeyboardMarkup:
     """Создает клавиатуру с темами квиза"""
     keyboard = []
     for topic_key, topic_data in QUIZ_TOPICS.items():
@@ -41,11 +41,15 @@ def get_quiz_topics_keyboard() -> InlineKeyboardMarkup:
         ])
     return InlineKeyboardMarkup(keyboard)
 
+def get_quiz_topics_keyboard() -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру с темами квиза"""
+    return QUIZ_TOPICS_KEYBOARD
+
 def get_quiz_topic_data(topic_key: str) -> dict:
     """Возвращает данные о теме квиза"""
     return QUIZ_TOPICS.get(topic_key)
 
-def get_quiz_continue_keyboard(topic_key: str) -> InlineKeyboardMarkup:
+def _build_quiz_continue_keyboard(topic_key: str) -> InlineKeyboardMarkup:
     """Создает клавиатуру для продолжения квиза"""
     keyboard = [
         [
@@ -54,4 +58,15 @@ def get_quiz_continue_keyboard(topic_key: str) -> InlineKeyboardMarkup:
         ],
         [InlineKeyboardButton("🏁 Завершить квиз", callback_data="quiz_finish")]
     ]
-    return InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+    return InlineKeyboardMarkup(keyboard)
+
+def get_quiz_continue_keyboard(topic_key: str) -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру для продолжения квиза"""
+    keyboard = QUIZ_CONTINUE_KEYBOARDS.get(topic_key)
+    if keyboard is None:
+        keyboard = _build_quiz_continue_keyboard(topic_key)
+    return keyboard
+
+# Клавиатуры неизменяемы, поэтому строятся один раз при загрузке модуля
+QUIZ_TOPICS_KEYBOARD = _build_quiz_topics_keyboard()
+QUIZ_CONTINUE_KEYBOARDS = {topic_key: _build_quiz_continue_keyboard(topic_key) for topic_key in QUIZ_TOPICS}
@@ -0,0 +1,148 @@
+import asyncio
+import glob
+import logging
+import os
+import shutil
+from asyncio.subprocess import PIPE
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество одновременных процессов ffmpeg
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", str(os.cpu_count() or 2)))
+# Частота дискретизации PCM для распознавания речи
+PCM_SAMPLE_RATE = 16000
+PCM_SAMPLE_WIDTH = 2
+
+
+def get_ffmpeg_path():
+    """Получает путь к ffmpeg"""
+    # Проверяем локальную установку
+    base_dir = os.path.dirname(os.path.dirname(__file__))
+    local_ffmpeg = os.path.join(base_dir, 'bin', 'ffmpeg-master-latest-win64-gpl', 'bin', 'ffmpeg.exe')
+    if os.path.exists(local_ffmpeg):
+        logger.info(f"ffmpeg найден локально: {local_ffmpeg}")
+        return local_ffmpeg
+
+    # Проверяем системный ffmpeg
+    ffmpeg_path = shutil.which('ffmpeg')
+    if ffmpeg_path:
+        logger.info(f"ffmpeg найден в системе: {ffmpeg_path}")
+        return ffmpeg_path
+
+    # Проверяем стандартные пути установки
+    standard_paths = [
+        r'C:\Program Files\ffmpeg\bin\ffmpeg.exe',
+        r'C:\Program Files (x86)\ffmpeg\bin\ffmpeg.exe',
+        os.path.expanduser('~\\AppData\\Local\\Microsoft\\WinGet\\Packages\\Gyan.FFmpeg_*\\ffmpeg\\bin\\ffmpeg.exe')
+    ]
+
+    for path in standard_paths:
+        if '*' in path:
+            # Для путей с wildcard
+            matches = glob.glob(path)
+            if matches:
+                logger.info(f"ffmpeg найден в стандартном пути: {matches[0]}")
+                return matches[0]
+        elif os.path.exists(path):
+            logger.info(f"ffmpeg найден в стандартном пути: {path}")
+            return path
+
+    logger.error("ffmpeg не найден ни в одном из возможных мест")
+    return None
+
+
+def setup_ffmpeg(ffmpeg_path: Optional[str]):
+    """Настраивает ffmpeg"""
+    try:
+        if ffmpeg_path:
+            # Добавляем путь к ffmpeg в PATH
+            ffmpeg_dir = os.path.dirname(ffmpeg_path)
+            if ffmpeg_dir not in os.environ['PATH']:
+                os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ['PATH']
+            logger.info(f"ffmpeg настроен: {ffmpeg_path}")
+            return True
+
+        logger.error("Не удалось найти ffmpeg")
+        return False
+
+    except Exception as e:
+        logger.error(f"Ошибка при настройке ffmpeg: {e}")
+        return False
+
+
+class AudioTranscoder:
+    """
+    Перекодирование аудио через ffmpeg без временных файлов.
+
+    Путь к ffmpeg определяется один раз, данные передаются через stdin/stdout
+    процесса asyncio, а количество одновременных процессов ограничено семафором.
+    """
+
+    def __init__(self, ffmpeg_path: Optional[str], max_concurrency: int = FFMPEG_CONCURRENCY):
+        """
+        Args:
+            ffmpeg_path (Optional[str]): Путь к ffmpeg
+            max_concurrency (int): Максимальное количество одновременных процессов
+        """
+        self.ffmpeg_path = ffmpeg_path
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def transcode(self, data: bytes, input_format: str, output_args: List[str]) -> bytes:
+        """
+        Перекодирует аудио
+
+        Args:
+            data (bytes): Исходное аудио
+            input_format (str): Формат исходного аудио для ffmpeg (ogg, mp3, ...)
+            output_args (List[str]): Параметры кодирования результата, включая -f
+
+        Returns:
+            bytes: Перекодированное аудио
+        """
+        if not self.ffmpeg_path:
+            raise RuntimeError("ffmpeg не найден")
+
+        cmd = [
+            self.ffmpeg_path,
+            '-hide_banner', '-loglevel', 'error',
+            '-f', input_format,
+            '-i', 'pipe:0',
+            *output_args,
+            'pipe:1'
+        ]
+
+        async with self._semaphore:
+            process = await asyncio.create_subprocess_exec(*cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+            output, error = await process.communicate(data)
+
+        if process.returncode != 0:
+            raise RuntimeError(f"Ошибка ffmpeg: {error.decode('utf-8', errors='replace')}")
+        return output
+
+    async def to_pcm(self, data: bytes, input_format: str = 'ogg') -> bytes:
+        """Перекодирует аудио в PCM 16 бит, 16 кГц, моно"""
+        return await self.transcode(data, input_format, [
+            '-acodec', 'pcm_s16le',
+            '-ac', '1',
+            '-ar', str(PCM_SAMPLE_RATE),
+            '-f', 's16le'
+        ])
+
+    async def to_voice(self, data: bytes, input_format: str = 'mp3') -> bytes:
+        """Перекодирует аудио в OGG/Opus для голосовых сообщений Telegram"""
+        return await self.transcode(data, input_format, [
+            '-acodec', 'libopus',
+            '-ac', '1',
+            '-ar', '48000',
+            '-b:a', '32k',
+            '-f', 'ogg'
+        ])
+
+
+# Определяем ffmpeg один раз при импорте модуля
+FFMPEG_PATH = get_ffmpeg_path()
+if not setup_ffmpeg(FFMPEG_PATH):
+    logger.error("Не удалось настроить ffmpeg. Голосовые функции могут не работать.")
+
+transcoder = AudioTranscoder(FFMPEG_PATH)
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from .engine import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Бюджет токенов на историю, отправляемую в одном запросе
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Модель, которая сворачивает старые сообщения в краткое содержание
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+SUMMARY_MAX_TOKENS = 300
+
+# Служебные токены на каждое сообщение (роль, разделители)
+TOKENS_PER_MESSAGE = 4
+# Примерная стоимость изображения, переданного в content
+TOKENS_PER_IMAGE = 765
+
+SUMMARY_PROMPT = (
+    "Сократи диалог ниже до краткого содержания на русском языке. "
+    "Сохрани факты о пользователе, его вопросы, договоренности и важные детали ответов. "
+    "Не больше 150 слов."
+)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Возвращает токенизатор модели или None, если tiktoken недоступен"""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Токенизатор недоступен, используется приблизительный подсчет: {e}")
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_text_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Считает токены в тексте (результат кэшируется)"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 3 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(message: Dict[str, Any], model: str = "gpt-3.5-turbo") -> int:
+    """Считает токены одного сообщения с учетом служебных"""
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return TOKENS_PER_MESSAGE + count_text_tokens(content, model)
+
+    tokens = TOKENS_PER_MESSAGE
+    for part in content:
+        if part.get("type") == "text":
+            tokens += count_text_tokens(part.get("text", ""), model)
+        else:
+            tokens += TOKENS_PER_IMAGE
+    return tokens
+
+
+class ContextWindow:
+    """
+    Окно истории диалога, ограниченное бюджетом токенов.
+
+    В запрос попадают системный промпт, краткое содержание старой части диалога
+    и столько последних сообщений, сколько помещается в бюджет. Сообщения,
+    выпавшие из окна, сворачиваются в краткое содержание фоновой задачей.
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, model: str = "gpt-3.5-turbo"):
+        """
+        Args:
+            budget (int): Бюджет токенов на историю
+            model (str): Модель, для которой считаются токены
+        """
+        self.budget = budget
+        self.model = model
+
+    def split(self, messages: List[Dict[str, Any]], reserved: int = 0) -> Tuple[int, int]:
+        """
+        Делит историю на части
+
+        Args:
+            messages (List[Dict[str, Any]]): История диалога
+            reserved (int): Токены, уже занятые в бюджете (например, кратким содержанием)
+
+        Returns:
+            Tuple[int, int]: Количество ведущих системных сообщений и индекс
+            первого сообщения, попадающего в окно
+        """
+        head = 0
+        while head < len(messages) and messages[head].get("role") == "system":
+            head += 1
+
+        used = reserved + sum(count_message_tokens(message, self.model) for message in messages[:head])
+        start = len(messages)
+        while start > head:
+            tokens = count_message_tokens(messages[start - 1], self.model)
+            # Последнее сообщение отправляется всегда, даже если не помещается в бюджет
+            if used + tokens > self.budget and start < len(messages):
+                break
+            used += tokens
+            start -= 1
+        return head, start
+
+    def build(self, conversation) -> List[Dict[str, Any]]:
+        """
+        Собирает сообщения для запроса и запускает сворачивание выпавших сообщений
+
+        Args:
+            conversation (Conversation): Диалог чата
+
+        Returns:
+            List[Dict[str, Any]]: Сообщения для отправки модели
+        """
+        messages = conversation.messages
+        summary = None
+        reserved = 0
+        if conversation.summary:
+            summary = {
+                "role": "system",
+                "content": f"Краткое содержание предыдущей части диалога:\n{conversation.summary}"
+            }
+            reserved = count_message_tokens(summary, self.model)
+        head, start = self.split(messages, reserved)
+
+        window = list(messages[:head])
+        if summary:
+            window.append(summary)
+        window.extend(messages[start:])
+
+        if start > head:
+            self.schedule_summary(conversation, head, start)
+        return window
+
+    def schedule_summary(self, conversation, head: int, start: int):
+        """Запускает фоновое сворачивание сообщений messages[head:start]"""
+        task = conversation.summary_task
+        if task is not None and not task.done():
+            return
+        overflow = conversation.messages[head:start]
+        conversation.summary_task = asyncio.create_task(self._summarize(conversation, head, overflow))
+
+    async def _summarize(self, conversation, head: int, overflow: List[Dict[str, Any]]):
+        """Сворачивает сообщения в краткое содержание и удаляет их из истории"""
+        lines = []
+        if conversation.summary:
+            lines.append(f"Ранее: {conversation.summary}")
+        for message in overflow:
+            content = message.get("content")
+            if not isinstance(content, str):
+                content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+            lines.append(f"{message.get('role')}: {content}")
+
+        try:
+            summary = await get_engine().complete(
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": "\n".join(lines)}
+                ],
+                model=SUMMARY_MODEL,
+                temperature=0.3,
+                max_tokens=SUMMARY_MAX_TOKENS
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при сворачивании истории диалога: {e}")
+            return
+
+        # История могла быть сброшена, пока шел запрос
+        current = conversation.messages[head:head + len(overflow)]
+        if len(current) != len(overflow) or any(a is not b for a, b in zip(current, overflow)):
+            return
+
+        del conversation.messages[head:head + len(overflow)]
+        conversation.summary = summary
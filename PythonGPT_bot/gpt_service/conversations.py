@@ -0,0 +1,125 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+# Время простоя, после которого диалог удаляется (секунды)
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "3600"))
+# Максимальное количество диалогов в памяти
+MAX_CONVERSATIONS = int(os.getenv("MAX_CONVERSATIONS", "10000"))
+
+
+class Conversation:
+    """История сообщений одного чата"""
+    __slots__ = ("messages", "summary", "summary_task", "last_access")
+
+    def __init__(self):
+        self.messages: List[Dict[str, Any]] = []
+        # Краткое содержание сообщений, выпавших из окна контекста
+        self.summary = ""
+        self.summary_task = None
+        self.last_access = time.monotonic()
+
+    def set_prompt(self, prompt: Optional[str]):
+        """Очищает историю и устанавливает системный промпт"""
+        self.messages.clear()
+        self.summary = ""
+        if self.summary_task is not None:
+            self.summary_task.cancel()
+            self.summary_task = None
+        if prompt:
+            self.messages.append({"role": "system", "content": prompt})
+
+    def add(self, role: str, content: Any):
+        """Добавляет сообщение в историю"""
+        self.messages.append({"role": role, "content": content})
+
+
+def rollback_request(conversation: Conversation, existing: List[Dict[str, Any]]):
+    """
+    Удаляет из истории сообщения, добавленные запросом, на который не получен ответ
+
+    Args:
+        conversation (Conversation): Диалог чата
+        existing (List[Dict[str, Any]]): Сообщения истории до запроса
+    """
+    # Сравниваем по идентичности: пока шел запрос, начало истории могло быть свернуто
+    known = {id(message) for message in existing}
+    conversation.messages[:] = [message for message in conversation.messages if id(message) in known]
+
+
+class ConversationStore:
+    """
+    Хранилище диалогов по chat_id.
+
+    Диалоги лежат в OrderedDict в порядке последнего обращения: поиск — O(1),
+    а просроченные и лишние диалоги всегда находятся в начале и удаляются
+    без полного обхода.
+    """
+
+    def __init__(self, ttl: float = CONVERSATION_TTL, max_conversations: int = MAX_CONVERSATIONS):
+        """
+        Args:
+            ttl (float): Время простоя до удаления диалога в секундах
+            max_conversations (int): Максимальное количество диалогов в памяти
+        """
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._conversations: "OrderedDict[Hashable, Conversation]" = OrderedDict()
+
+    def get(self, chat_id: Hashable) -> Conversation:
+        """Возвращает диалог чата, создавая его при необходимости"""
+        now = time.monotonic()
+        self._evict(now)
+
+        conversation = self._conversations.get(chat_id)
+        if conversation is None:
+            conversation = Conversation()
+            self._conversations[chat_id] = conversation
+            if len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(chat_id)
+
+        conversation.last_access = now
+        return conversation
+
+    def reset(self, chat_id: Hashable, prompt: Optional[str] = None) -> Conversation:
+        """Начинает диалог чата заново с указанным системным промптом"""
+        conversation = self.get(chat_id)
+        conversation.set_prompt(prompt)
+        return conversation
+
+    def snapshot(self, chat_id: Hashable) -> Optional[Dict[str, Any]]:
+        """Возвращает историю и краткое содержание диалога для сохранения или None, если диалога нет"""
+        conversation = self._conversations.get(chat_id)
+        if conversation is None:
+            return None
+        return {"messages": conversation.messages, "summary": conversation.summary}
+
+    def restore(self, chat_id: Hashable, snapshot: Dict[str, Any]):
+        """Восстанавливает диалог чата из сохраненного снимка"""
+        conversation = self.get(chat_id)
+        if conversation.summary_task is not None:
+            conversation.summary_task.cancel()
+            conversation.summary_task = None
+        conversation.messages = list(snapshot["messages"])
+        conversation.summary = snapshot["summary"]
+
+    def discard(self, chat_id: Hashable):
+        """Удаляет диалог чата"""
+        self._conversations.pop(chat_id, None)
+
+    def _evict(self, now: float):
+        """Удаляет диалоги, простаивающие дольше ttl"""
+        while self._conversations:
+            chat_id, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_access < self.ttl:
+                break
+            self._conversations.popitem(last=False)
+
+    def __contains__(self, chat_id: Hashable) -> bool:
+        return chat_id in self._conversations
+
+    def __len__(self) -> int:
+        return len(self._conversations)
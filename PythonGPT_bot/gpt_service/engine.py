@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+import httpx
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+# Параметры пула соединений к OpenAI
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+REQUEST_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+# Максимум одновременных запросов к модели, остальные ждут своей очереди
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+
+
+def decode_token(token: str) -> str:
+    """Преобразует токен формата 'gpt:...' в ключ OpenAI"""
+    return "sk-proj-" + token[:3:-1] if token.startswith('gpt:') else token
+
+
+class CompletionEngine:
+    """
+    Общий асинхронный движок запросов к OpenAI.
+
+    Использует AsyncOpenAI поверх одного httpx.AsyncClient с пулом соединений,
+    поэтому запросы разных чатов выполняются параллельно и не блокируют event loop.
+    Одновременно выполняется не больше max_in_flight запросов: при всплеске
+    нагрузки запросы ждут в очереди, а не получают ошибки лимита от OpenAI.
+    """
+
+    def __init__(self, api_key: str, proxy: Optional[str] = None, max_in_flight: int = LLM_MAX_IN_FLIGHT):
+        """
+        Args:
+            api_key (str): API ключ OpenAI
+            proxy (Optional[str]): Адрес HTTP прокси
+            max_in_flight (int): Максимум одновременных запросов
+        """
+        if not api_key:
+            raise ValueError("CHATGPT_TOKEN не установлен в переменных окружения")
+
+        transport = None
+        if proxy:
+            try:
+                transport = httpx.AsyncHTTPTransport(proxy=httpx.Proxy(proxy))
+            except Exception as e:
+                logger.error(f"Ошибка при настройке прокси: {e}")
+                transport = None
+
+        self.http_client = httpx.AsyncClient(
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=REQUEST_TIMEOUT
+        )
+        self.client = AsyncOpenAI(api_key=decode_token(api_key), http_client=self.http_client)
+        self._in_flight_limit = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.requests = 0
+        self.waited = 0
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Занимает место среди одновременных запросов на время запроса"""
+        if self._in_flight_limit.locked():
+            self.waited += 1
+        self.queued += 1
+        try:
+            await self._in_flight_limit.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._in_flight_limit.release()
+
+    async def create(self, messages: List[Dict[str, Any]], model: str = "gpt-3.5-turbo",
+                     temperature: float = 0.7, max_tokens: int = 1000, **kwargs):
+        """Выполняет запрос chat completion и возвращает объект ответа"""
+        async with self._slot():
+            return await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+
+    async def complete(self, messages: List[Dict[str, Any]], model: str = "gpt-3.5-turbo",
+                       temperature: float = 0.7, max_tokens: int = 1000, **kwargs) -> str:
+        """
+        Выполняет запрос chat completion
+
+        Args:
+            messages (List[Dict[str, Any]]): Сообщения диалога
+            model (str): Модель
+            temperature (float): Температура
+            max_tokens (int): Максимальное количество токенов ответа
+
+        Returns:
+            str: Текст ответа модели
+        """
+        response = await self.create(messages, model=model, temperature=temperature,
+                                     max_tokens=max_tokens, **kwargs)
+        return response.choices[0].message.content
+
+    async def stream(self, messages: List[Dict[str, Any]], model: str = "gpt-3.5-turbo",
+                     temperature: float = 0.7, max_tokens: int = 1000, **kwargs) -> AsyncIterator[str]:
+        """
+        Выполняет потоковый запрос chat completion
+
+        Yields:
+            str: Очередной фрагмент текста ответа
+        """
+        # Место занято, пока ответ не получен целиком или генератор не закрыт (aclose).
+        # Брошенный без aclose генератор держит место до сборки мусора, поэтому
+        # вызывающий код читает поток внутри contextlib.aclosing
+        async with self._slot():
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **kwargs
+            )
+            try:
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            finally:
+                # Недочитанный ответ закрывается, чтобы соединение вернулось в пул
+                await response.response.aclose()
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает статистику запросов: выполняются, ждут, всего и сколько из них ждали места"""
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "requests": self.requests,
+            "waited": self.waited
+        }
+
+    async def close(self):
+        """Закрывает пул соединений"""
+        await self.http_client.aclose()
+
+
+_engine: Optional[CompletionEngine] = None
+
+
+def get_engine() -> CompletionEngine:
+    """Возвращает общий экземпляр движка, создавая его при первом обращении"""
+    global _engine
+    if _engine is None:
+        _engine = CompletionEngine(os.getenv("CHATGPT_TOKEN"), proxy=os.getenv("CHATGPT_PROXY"))
+    return _engine
+
+
+async def close_engine():
+    """Закрывает общий движок (вызывается при остановке бота)"""
+    global _engine
+    if _engine is not None:
+        logger.info(f"Запросы к модели: {_engine.stats()}")
+        await _engine.close()
+        _engine = None
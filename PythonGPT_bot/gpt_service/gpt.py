@@ -1,14 +1,20 @@
 from util import send_photo, send_text, load_message, load_prompt
-from osnov_servis.shared import dialog, chatgpt
+from osnov_servis.shared import sessions, chatgpt
+from osnov_servis.session import Mode
+import asyncio
 import logging
-from openai import OpenAI
+from contextlib import aclosing
 import os
-from typing import List, Dict, Union
+from typing import List, Dict, Union, AsyncIterator, Any, Optional, Tuple
 from .web_search import search_web, format_search_results
+from .engine import get_engine
+from .conversations import ConversationStore, rollback_request
+from .streaming import EMPTY_ANSWER
+from .context_window import ContextWindow
+from .images import image_pipeline
 import re
 import base64
 from io import BytesIO
-import requests
 import speech_recognition as sr
 from gtts import gTTS
 import tempfile
@@ -19,23 +25,29 @@ logger = logging.getLogger(__name__)
 
 WAITING_FOR_MESSAGE = 1
 
-# Инициализация OpenAI клиента
-client = OpenAI(api_key=os.getenv("CHATGPT_TOKEN"))
-
-# Список для хранения истории сообщений
-message_list = []
-
-
-def set_prompt(prompt: str = None):
-    """Устанавливает системный промпт для GPT"""
-    global message_list
-    message_list = []
+VISION_MODEL = "gpt-4-vision-preview"
+TEXT_MODEL = "gpt-3.5-turbo"
+# Отправлять изображение вместе с текстом одним запросом вместо отдельного анализа.
+# По умолчанию выключено: в этом режиме описание не сохраняется, и в истории
+# остается только отметка о картинке, поэтому на следующие вопросы о ней модель не ответит
+MULTIMODAL_SINGLE_CALL = os.getenv("MULTIMODAL_SINGLE_CALL", "0") == "1"
+# Запрос нейтрального описания, которое кэшируется и используется в любом чате
+DESCRIBE_PROMPT = (
+    "Подробно опиши, что изображено на картинке. Если есть текст, формулы, код, таблицы "
+    "или графики — перепиши их дословно. Не делай выводов и не отвечай на вопросы, только описание."
+)
+
+# История сообщений по chat_id
+conversations = ConversationStore()
+context_window = ContextWindow()
+
+
+def set_prompt(prompt: str = None, chat_id: int = None):
+    """Устанавливает системный промпт для GPT в диалоге чата"""
     if prompt:
-        message_list.append({"role": "system", "content": prompt})
+        conversations.reset(chat_id, prompt)
     else:
-        message_list.append({
-            "role": "system",
-            "content": """Вы - умный ассистент с возможностью анализа изображений и поиска в интернете.
+        conversations.reset(chat_id, """Вы - умный ассистент с возможностью анализа изображений и поиска в интернете.
             При работе с изображениями:
             1. Внимательно анализируйте все детали на изображении
             2. Описывайте то, что видите, максимально подробно
@@ -51,8 +63,7 @@ def set_prompt(prompt: str = None):
             3. Если вопрос о фактах или данных - уточняйте актуальность информации
             4. Всегда указывайте источники информации
             5. Если информация может быть устаревшей - предупреждайте об этом
-            6. Используйте поиск для подтверждения или опровержения информации"""
-        })
+            6. Используйте поиск для подтверждения или опровержения информации""")
 
 
 def should_search_web(text: str) -> bool:
@@ -113,40 +124,39 @@ def extract_search_query(text: str) -> str:
     return text
 
 
-async def get_image_base64(image_url: str) -> str:
+async def get_image_base64(image_url: str, image_key: str = None) -> Tuple[Optional[str], Optional[str]]:
     """
-    Получает base64 представление изображения по URL
+    Получает уменьшенное JPEG изображение по URL в base64
 
     Args:
         image_url (str): URL изображения
+        image_key (str, optional): file_unique_id изображения в Telegram
 
     Returns:
-        str: base64 строка изображения
+        Tuple[Optional[str], Optional[str]]: Ключ кэша и base64 строка изображения
     """
     try:
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            return base64.b64encode(response.content).decode('utf-8')
-        return None
+        return await image_pipeline.load(image_url, image_key)
     except Exception as e:
         logger.error(f"Ошибка при получении изображения: {e}")
-        return None
+        return None, None
 
 
-async def analyze_image(image_url: str, prompt: str = None) -> str:
+async def analyze_image(image_url: str, prompt: str = None, image_key: str = None) -> str:
     """
     Анализирует изображение с помощью GPT-4 Vision
 
     Args:
         image_url (str): URL изображения
         prompt (str, optional): Дополнительный промпт для анализа
+        image_key (str, optional): file_unique_id изображения в Telegram
 
     Returns:
         str: Результат анализа изображения
     """
     try:
         # Получаем base64 изображения
-        image_base64 = await get_image_base64(image_url)
+        image_key, image_base64 = await get_image_base64(image_url, image_key)
         if not image_base64:
             return "Не удалось получить изображение для анализа."
 
@@ -170,53 +180,149 @@ async def analyze_image(image_url: str, prompt: str = None) -> str:
         ]
 
         # Получаем ответ от GPT
-        response = client.chat.completions.create(
-            model="gpt-4-vision-preview",
-            messages=messages,
+        return await get_engine().complete(
+            messages,
+            model=VISION_MODEL,
             max_tokens=1000
         )
-
-        return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Ошибка при анализе изображения: {e}")
         return "Произошла ошибка при анализе изображения."
 
 
-async def gpt(text: str, image_url: str = None) -> str:
+async def describe_image(image_url: str, image_key: str = None) -> Optional[str]:
     """
-    Отправляет запрос к GPT и получает ответ
+    Возвращает нейтральное описание изображения
+
+    Описание не зависит от вопроса пользователя, поэтому кэшируется по
+    изображению и используется в любом чате, где его пришлют снова.
 
     Args:
-        text (str): Текст запроса
-        image_url (str, optional): URL изображения для анализа
+        image_url (str): URL изображения
+        image_key (str, optional): file_unique_id изображения в Telegram
 
     Returns:
-        str: Ответ от GPT
+        Optional[str]: Описание или None, если его не удалось получить
     """
+    description = image_pipeline.get_description(image_key)
+    if description:
+        return description
+
+    image_key, image_base64 = await get_image_base64(image_url, image_key)
+    if not image_base64:
+        return None
     try:
-        # Если есть изображение, анализируем его
-        if image_url:
-            image_analysis = await analyze_image(image_url, text)
-            message_list.append({
+        description = await get_engine().complete(
+            [{
                 "role": "user",
-                "content": f"Запрос: {text}\n\nАнализ изображения:\n{image_analysis}"
-            })
-        else:
-            message_list.append({"role": "user", "content": text})
-
-        # Проверяем, нужен ли поиск в интернете
-        if should_search_web(text):
-            # Извлекаем поисковый запрос
-            search_query = extract_search_query(text)
-
-            # Выполняем поиск
-            search_results = await search_web(search_query, max_results=5)
-            if search_results:
-                # Добавляем результаты поиска в контекст
-                search_context = format_search_results(search_results)
-                message_list.append({
-                    "role": "system",
-                    "content": f"""Вот актуальная информация из интернета:
+                "content": [
+                    {"type": "text", "text": DESCRIBE_PROMPT},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                ]
+            }],
+            model=VISION_MODEL,
+            max_tokens=1000
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при описании изображения: {e}")
+        return None
+    image_pipeline.remember_description(image_key, description)
+    return description
+
+
+async def fetch_search_context(text: str) -> Optional[str]:
+    """
+    Ищет актуальную информацию в интернете, если она нужна для ответа
+
+    Args:
+        text (str): Текст запроса
+
+    Returns:
+        Optional[str]: Отформатированные результаты поиска или None
+    """
+    # Проверяем, нужен ли поиск в интернете
+    if not should_search_web(text):
+        return None
+
+    # Извлекаем поисковый запрос и выполняем поиск
+    search_results = await search_web(extract_search_query(text), max_results=5)
+    if not search_results:
+        return None
+    return format_search_results(search_results)
+
+
+async def fetch_image_stage(text: str, image_url: str,
+                            image_key: str = None) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Подготавливает изображение к запросу
+
+    Если для изображения уже есть нейтральное описание, оно используется и
+    vision-модель не вызывается. В режиме MULTIMODAL_SINGLE_CALL изображение только
+    скачивается и передается в основной запрос, иначе сначала описывается
+    отдельным запросом, а на вопрос отвечает текстовая модель.
+
+    Args:
+        text (str): Текст запроса
+        image_url (str): URL изображения
+        image_key (str, optional): file_unique_id изображения в Telegram
+
+    Returns:
+        Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]: Текст для истории
+        диалога, часть сообщения с изображением и ключ изображения в кэше
+    """
+    if not image_url:
+        return None, None, None
+
+    description = image_pipeline.get_description(image_key)
+    if description:
+        return f"Запрос: {text}\n\nОписание изображения:\n{description}", None, None
+
+    if not MULTIMODAL_SINGLE_CALL:
+        description = await describe_image(image_url, image_key)
+        if not description:
+            return f"Запрос: {text}\n\nНе удалось получить изображение для анализа.", None, None
+        return f"Запрос: {text}\n\nОписание изображения:\n{description}", None, None
+
+    image_key, image_base64 = await get_image_base64(image_url, image_key)
+    if not image_base64:
+        return f"Запрос: {text}\n\nНе удалось получить изображение для анализа.", None, None
+    image_part = {
+        "type": "image_url",
+        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+    }
+    return f"Запрос: {text}\n\n[Пользователь приложил изображение]", image_part, image_key
+
+
+async def prepare_request(conversation, text: str, image_url: str = None,
+                          image_key: str = None) -> Tuple[List[Dict[str, Any]], str, Optional[str]]:
+    """
+    Добавляет запрос пользователя (и найденную информацию) в историю диалога
+    и собирает сообщения для модели.
+
+    Подготовка изображения и поиск в интернете не зависят друг от друга
+    и выполняются параллельно.
+
+    Args:
+        conversation (Conversation): Диалог чата
+        text (str): Текст запроса
+        image_url (str, optional): URL изображения для анализа
+        image_key (str, optional): file_unique_id изображения в Telegram
+
+    Returns:
+        Tuple[List[Dict[str, Any]], str, Optional[str]]: Сообщения для запроса, модель
+        и ключ изображения, отправленного в запросе
+    """
+    (image_text, image_part, image_key), search_context = await asyncio.gather(
+        fetch_image_stage(text, image_url, image_key),
+        fetch_search_context(text)
+    )
+
+    user_message = {"role": "user", "content": image_text or text}
+    conversation.messages.append(user_message)
+
+    if search_context:
+        # Добавляем результаты поиска в контекст
+        conversation.add("system", f"""Вот актуальная информация из интернета:
 
 {search_context}
 
@@ -225,42 +331,118 @@ async def gpt(text: str, image_url: str = None) -> str:
 1. Укажи источники информации
 2. Если информация может быть неактуальной - предупреди об этом
 3. Если нашел противоречивую информацию - укажи это
-4. Если информация неполная - скажи об этом"""
-                })
+4. Если информация неполная - скажи об этом""")
+
+    messages = context_window.build(conversation)
+    if image_part:
+        # Изображение передается только в текущем запросе, в истории остается текст
+        messages = [
+            {"role": "user", "content": [{"type": "text", "text": text}, image_part]}
+            if message is user_message else message
+            for message in messages
+        ]
+
+    return messages, VISION_MODEL if image_part else TEXT_MODEL, image_key
+
+
+async def gpt(text: str, image_url: str = None, chat_id: int = None, image_key: str = None) -> str:
+    """
+    Отправляет запрос к GPT и получает ответ
+
+    Args:
+        text (str): Текст запроса
+        image_url (str, optional): URL изображения для анализа
+        chat_id (int, optional): ID чата, историю которого нужно использовать
+        image_key (str, optional): file_unique_id изображения в Telegram
+
+    Returns:
+        str: Ответ от GPT
+    """
+    conversation = conversations.get(chat_id)
+    existing = list(conversation.messages)
+    try:
+        messages, model, image_key = await prepare_request(conversation, text, image_url, image_key)
 
         # Получаем ответ от GPT
-        response = client.chat.completions.create(
-            model="gpt-4-vision-preview" if image_url else "gpt-3.5-turbo",
-            messages=message_list,
+        answer = await get_engine().complete(
+            messages,
+            model=model,
             temperature=0.7,
             max_tokens=1000
         )
 
-        # Получаем ответ
-        answer = response.choices[0].message.content
+        if not answer:
+            # Пустой ответ не сохраняется, иначе следующий запрос понесет пустую реплику
+            rollback_request(conversation, existing)
+            return EMPTY_ANSWER
 
         # Добавляем ответ в историю
-        message_list.append({"role": "assistant", "content": answer})
+        conversation.add("assistant", answer)
 
         return answer
     except Exception as e:
         logger.error(f"Ошибка при работе с GPT: {e}")
+        rollback_request(conversation, existing)
         return "Извините, произошла ошибка при обработке вашего запроса."
 
 
+async def gpt_stream(text: str, image_url: str = None, chat_id: int = None,
+                     image_key: str = None) -> AsyncIterator[str]:
+    """
+    Отправляет запрос к GPT и возвращает ответ по частям по мере генерации.
+    Ошибки пробрасываются вызывающему обработчику, а запрос удаляется из истории.
+
+    Args:
+        text (str): Текст запроса
+        image_url (str, optional): URL изображения для анализа
+        chat_id (int, optional): ID чата, историю которого нужно использовать
+        image_key (str, optional): file_unique_id изображения в Telegram
+
+    Yields:
+        str: Очередной фрагмент ответа
+    """
+    conversation = conversations.get(chat_id)
+    existing = list(conversation.messages)
+    parts = []
+    try:
+        messages, model, image_key = await prepare_request(conversation, text, image_url, image_key)
+        async with aclosing(get_engine().stream(
+                messages,
+                model=model,
+                temperature=0.7,
+                max_tokens=1000
+        )) as chunks:
+            async for delta in chunks:
+                parts.append(delta)
+                yield delta
+    except BaseException:
+        # Без ответа вопрос пользователя в истории остался бы без пары
+        rollback_request(conversation, existing)
+        raise
+
+    answer = "".join(parts)
+    if not answer:
+        # Пустой ответ не сохраняется, StreamingMessage покажет EMPTY_ANSWER
+        rollback_request(conversation, existing)
+        return
+
+    # Добавляем ответ в историю
+    conversation.add("assistant", answer)
+
+
 async def gpt_command(update, context):
     """Обработчик команды /gpt"""
-    dialog.mode = "gpt"
+    sessions.enter(update.effective_chat.id, Mode.GPT)
     text = load_message("gpt")
     await send_photo(update, context, "gpt")
     await send_text(update, context, text)
     # Устанавливаем промпт для GPT
-    set_prompt(load_prompt("gpt"))
+    set_prompt(load_prompt("gpt"), update.effective_chat.id)
 
 
 async def gpt_dialog(update, context):
     """Обработчик диалога с GPT"""
-    if dialog.mode != "gpt":
+    if sessions.get(update.effective_chat.id).mode is not Mode.GPT:
         return
 
     text = update.message.text
@@ -271,33 +453,53 @@ async def gpt_dialog(update, context):
 
     try:
         # Получаем ответ от GPT
-        answer = await gpt(text)
+        answer = await gpt(text, chat_id=update.effective_chat.id)
         await my_message.edit_text(answer)
     except Exception as e:
         logger.error(f"Error in GPT dialog: {e}")
         await my_message.edit_text("Извините, произошла ошибка при генерации ответа. Попробуйте еще раз.")
 
 
-async def get_personality_response(prompt: str, system_prompt: str = None) -> str:
+async def get_personality_response(prompt: str, system_prompt: str = None, chat_id: int = None) -> str:
     """
     Получает ответ от ChatGPT с учетом личности.
 
     Args:
         prompt (str): Запрос пользователя
         system_prompt (str, optional): Системный промпт для определения личности
+        chat_id (int, optional): ID чата, историю которого нужно использовать
 
     Returns:
         str: Ответ от ChatGPT
     """
     try:
         if system_prompt:
-            set_prompt(system_prompt)
-        return await gpt(prompt)
+            set_prompt(system_prompt, chat_id)
+        return await gpt(prompt, chat_id=chat_id)
     except Exception as e:
         logger.error(f"Ошибка при получении ответа от ChatGPT: {e}")
         return "Извините, произошла ошибка при обработке запроса."
 
 
+async def get_personality_response_stream(prompt: str, system_prompt: str = None,
+                                          chat_id: int = None) -> AsyncIterator[str]:
+    """
+    Потоковый вариант get_personality_response
+
+    Args:
+        prompt (str): Запрос пользователя
+        system_prompt (str, optional): Системный промпт для определения личности
+        chat_id (int, optional): ID чата, историю которого нужно использовать
+
+    Yields:
+        str: Очередной фрагмент ответа
+    """
+    if system_prompt:
+        set_prompt(system_prompt, chat_id)
+    async for delta in gpt_stream(prompt, chat_id=chat_id):
+        yield delta
+
+
 async def speech_to_text(audio_data: bytes) -> str:
     """
     Конвертирует голосовое сообщение в текст
@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from io import BytesIO
+from typing import Optional, Tuple
+
+import httpx
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Длина длинной стороны изображения, отправляемого модели (пиксели)
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+# Качество JPEG при перекодировании
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+# Количество изображений и описаний в кэше
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "256"))
+
+
+def prepare_image(data: bytes, max_edge: int = IMAGE_MAX_EDGE, quality: int = IMAGE_JPEG_QUALITY) -> bytes:
+    """
+    Уменьшает изображение до max_edge по длинной стороне и перекодирует в JPEG
+
+    Args:
+        data (bytes): Исходное изображение
+        max_edge (int): Максимальная длина длинной стороны
+        quality (int): Качество JPEG
+
+    Returns:
+        bytes: Изображение в формате JPEG
+    """
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+
+
+class ImagePipeline:
+    """
+    Загрузка и подготовка изображений для vision-модели.
+
+    Изображения скачиваются через общий httpx.AsyncClient, уменьшаются и
+    перекодируются в пуле потоков. Готовые изображения и их нейтральные
+    описания кэшируются по file_unique_id Telegram (или хэшу содержимого),
+    поэтому повторно присланная картинка не скачивается и не описывается заново.
+    Ответы на вопросы пользователей здесь не хранятся: кэш общий для всех чатов.
+    """
+
+    def __init__(self, max_edge: int = IMAGE_MAX_EDGE, quality: int = IMAGE_JPEG_QUALITY,
+                 cache_size: int = IMAGE_CACHE_SIZE):
+        """
+        Args:
+            max_edge (int): Максимальная длина длинной стороны
+            quality (int): Качество JPEG
+            cache_size (int): Количество записей в каждом кэше
+        """
+        self.max_edge = max_edge
+        self.quality = quality
+        self.cache_size = cache_size
+        self._images: "OrderedDict[str, str]" = OrderedDict()
+        self._descriptions: "OrderedDict[str, str]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                timeout=30
+            )
+        return self._client
+
+    def _remember(self, cache: OrderedDict, key: str, value: str):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _lookup(self, cache: OrderedDict, key: Optional[str]) -> Optional[str]:
+        if key is None or key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
+
+    async def load(self, image_url: str, image_key: str = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Возвращает подготовленное изображение в base64
+
+        Args:
+            image_url (str): URL изображения
+            image_key (str, optional): file_unique_id изображения в Telegram
+
+        Returns:
+            Tuple[Optional[str], Optional[str]]: Ключ кэша и base64 строка JPEG
+        """
+        cached = self._lookup(self._images, image_key)
+        if cached is not None:
+            return image_key, cached
+
+        response = await self._get_client().get(image_url)
+        response.raise_for_status()
+        data = response.content
+
+        key = image_key or hashlib.sha256(data).hexdigest()
+        cached = self._lookup(self._images, key)
+        if cached is not None:
+            return key, cached
+
+        jpeg = await asyncio.to_thread(prepare_image, data, self.max_edge, self.quality)
+        logger.info(f"Изображение подготовлено: {len(data)} -> {len(jpeg)} байт")
+
+        image_base64 = base64.b64encode(jpeg).decode('utf-8')
+        self._remember(self._images, key, image_base64)
+        return key, image_base64
+
+    def get_description(self, image_key: Optional[str]) -> Optional[str]:
+        """Возвращает сохраненное описание изображения"""
+        return self._lookup(self._descriptions, image_key)
+
+    def remember_description(self, image_key: Optional[str], description: str):
+        """Сохраняет описание изображения, полученное по DESCRIBE_PROMPT"""
+        if image_key and description:
+            self._remember(self._descriptions, image_key, description)
+
+    async def close(self):
+        """Закрывает пул соединений"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,145 @@
+import asyncio
+import html
+import logging
+import os
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
+
+from telegram import InlineKeyboardMarkup, Message
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import BadRequest, RetryAfter
+
+from send_queue import priority_args, PRIORITY_FINAL, PRIORITY_STATUS
+
+logger = logging.getLogger(__name__)
+
+# Включает постепенное обновление сообщения по мере генерации ответа
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+# Минимальный интервал между правками одного сообщения (секунды)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+# Минимальный прирост текста между правками (символы)
+STREAM_MIN_DELTA = 20
+
+CURSOR = " ▌"
+# Финальный текст, если модель вернула пустой ответ (Telegram не принимает пустое сообщение)
+EMPTY_ANSWER = "Не удалось получить ответ. Попробуйте еще раз."
+
+
+class StreamingMessage:
+    """
+    Постепенно обновляет сообщение Telegram по мере поступления ответа модели.
+
+    Правки объединяются: сообщение редактируется не чаще одного раза за
+    STREAM_EDIT_INTERVAL, поэтому лимит Telegram на правки в чате не превышается.
+    Текст модели экранируется, так что HTML остается валидным после каждой правки.
+    """
+
+    def __init__(self, message: Message, prefix: str = "", suffix: str = "",
+                 parse_mode: Optional[str] = ParseMode.HTML, interval: float = STREAM_EDIT_INTERVAL):
+        """
+        Args:
+            message (Message): Сообщение-заглушка, которое будет редактироваться
+            prefix (str): Текст перед ответом (уже размеченный)
+            suffix (str): Текст после ответа, показывается в финальной версии
+            parse_mode (Optional[str]): Режим разметки (HTML или None)
+            interval (float): Минимальный интервал между правками
+        """
+        self.message = message
+        self.prefix = prefix
+        self.suffix = suffix
+        self.parse_mode = parse_mode
+        self.interval = interval if STREAM_RESPONSES else float("inf")
+        # Первая промежуточная правка не раньше чем через interval, при отключенном стриминге — никогда
+        self._next_edit = time.monotonic() + self.interval
+        self._shown = ""
+
+    def render(self, text: str, final: bool = False) -> str:
+        """Формирует текст сообщения с учетом лимита длины Telegram"""
+        if final and not text.strip():
+            text = EMPTY_ANSWER
+        body = html.escape(text) if self.parse_mode == ParseMode.HTML else text
+        tail = self.suffix if final else CURSOR
+        limit = MessageLimit.MAX_TEXT_LENGTH - len(self.prefix) - len(tail)
+        if len(body) > limit:
+            body = body[:limit - 1]
+            # Не обрезаем HTML-сущность посередине
+            amp = body.rfind("&")
+            if self.parse_mode == ParseMode.HTML and amp != -1 and ";" not in body[amp:]:
+                body = body[:amp]
+            body += "…"
+        return f"{self.prefix}{body}{tail}"
+
+    async def _edit(self, text: str, reply_markup: InlineKeyboardMarkup = None, final: bool = False):
+        rendered = self.render(text, final)
+        if rendered == self._shown and not final:
+            return
+        try:
+            # Промежуточные версии уступают очередь финальным ответам
+            bot = self.message.get_bot()
+            await bot.edit_message_text(
+                rendered,
+                chat_id=self.message.chat_id,
+                message_id=self.message.message_id,
+                parse_mode=self.parse_mode,
+                reply_markup=reply_markup,
+                rate_limit_args=priority_args(bot, PRIORITY_FINAL if final else PRIORITY_STATUS)
+            )
+            self._shown = rendered
+        except RetryAfter as e:
+            # Переносим следующую правку; финальную версию дожидаемся обязательно
+            self._next_edit = time.monotonic() + e.retry_after
+            if final:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, reply_markup, final)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+
+    async def show(self, text: str, reply_markup: InlineKeyboardMarkup = None) -> str:
+        """
+        Показывает готовый ответ одной правкой
+
+        Args:
+            text (str): Полный текст ответа
+            reply_markup (InlineKeyboardMarkup, optional): Клавиатура
+
+        Returns:
+            str: Текст ответа
+        """
+        await self._edit(text, reply_markup=reply_markup, final=True)
+        return text
+
+    async def consume(self, chunks: AsyncIterator[str], reply_markup: InlineKeyboardMarkup = None) -> str:
+        """
+        Читает фрагменты ответа и редактирует сообщение
+
+        Args:
+            chunks (AsyncIterator[str]): Фрагменты ответа модели
+            reply_markup (InlineKeyboardMarkup, optional): Клавиатура для финальной версии
+
+        Returns:
+            str: Полный текст ответа
+        """
+        text = ""
+        shown_length = 0
+        pending: Optional[asyncio.Task] = None
+        # Поток закрывается сразу и при ошибке: до закрытия он занимает место в очереди запросов к модели
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                text += chunk
+                now = time.monotonic()
+                # Пока предыдущая правка ждет очереди отправки, новую не начинаем,
+                # чтобы лимиты Telegram не замедляли чтение ответа модели
+                busy = pending is not None and not pending.done()
+                if not busy and now >= self._next_edit and len(text) - shown_length >= STREAM_MIN_DELTA:
+                    self._next_edit = now + self.interval
+                    shown_length = len(text)
+                    pending = asyncio.create_task(self._edit(text))
+
+        if pending is not None:
+            # Устаревшая промежуточная правка не должна прийти после финальной и вернуть курсор
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await self._edit(text, reply_markup=reply_markup, final=True)
+        return text
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+# Движок распознавания речи: google, vosk (pip install -r requirements-vosk.txt) или fake
+STT_BACKEND = os.getenv("STT_BACKEND", "google")
+STT_LANGUAGE = "ru-RU"
+# Путь к модели Vosk и количество процессов для офлайн-распознавания
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-ru")
+VOSK_WORKERS = int(os.getenv("VOSK_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+
+class SpeechBackend(ABC):
+    """
+    Интерфейс движка распознавания речи.
+
+    Движок получает PCM 16 бит моно и никогда не выполняет распознавание
+    в event loop. Для каждого движка собирается статистика вызовов.
+    """
+    name = "base"
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.audio_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    @abstractmethod
+    async def _recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> Optional[str]:
+        """Распознает речь вне event loop (в потоке или процессе); статистику ведет recognize"""
+
+    async def recognize(self, pcm: bytes, sample_rate: int, sample_width: int,
+                        language: str = STT_LANGUAGE) -> Optional[str]:
+        """
+        Распознает речь
+
+        Args:
+            pcm (bytes): Аудио в формате PCM
+            sample_rate (int): Частота дискретизации
+            sample_width (int): Размер сэмпла в байтах
+            language (str): Язык речи
+
+        Returns:
+            Optional[str]: Распознанный текст или None
+        """
+        started = time.perf_counter()
+        self.calls += 1
+        self.audio_seconds += len(pcm) / (sample_rate * sample_width)
+        try:
+            return await self._recognize(pcm, sample_rate, sample_width, language)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, float]:
+        """Возвращает статистику движка"""
+        return {
+            "backend": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "audio_seconds": round(self.audio_seconds, 2),
+            "busy_seconds": round(self.busy_seconds, 2),
+            # Секунды распознанного аудио за секунду работы движка
+            "realtime_factor": round(self.audio_seconds / self.busy_seconds, 2) if self.busy_seconds else 0.0
+        }
+
+    async def warm_up(self):
+        """Подготавливает движок к первому запросу"""
+
+    def close(self):
+        """Освобождает ресурсы движка"""
+
+
+class GoogleSpeechBackend(SpeechBackend):
+    """Распознавание через Google Web Speech API в пуле потоков"""
+    name = "google"
+
+    def _recognize_sync(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> Optional[str]:
+        recognizer = sr.Recognizer()
+        try:
+            return recognizer.recognize_google(sr.AudioData(pcm, sample_rate, sample_width), language=language)
+        except sr.UnknownValueError:
+            logger.error("Речь не распознана")
+            return None
+
+    async def _recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> Optional[str]:
+        return await asyncio.to_thread(self._recognize_sync, pcm, sample_rate, sample_width, language)
+
+
+_vosk_model = None
+
+
+def _init_vosk_worker(model_path: str):
+    """Загружает модель Vosk один раз при запуске процесса"""
+    global _vosk_model
+    from vosk import Model, SetLogLevel
+    SetLogLevel(-1)
+    _vosk_model = Model(model_path)
+
+
+def _vosk_recognize(pcm: bytes, sample_rate: int) -> str:
+    from vosk import KaldiRecognizer
+    recognizer = KaldiRecognizer(_vosk_model, sample_rate)
+    recognizer.AcceptWaveform(pcm)
+    return json.loads(recognizer.FinalResult()).get("text", "")
+
+
+def _vosk_ping() -> bool:
+    return _vosk_model is not None
+
+
+class VoskSpeechBackend(SpeechBackend):
+    """Офлайн-распознавание Vosk в пуле процессов с заранее загруженной моделью"""
+    name = "vosk"
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH, workers: int = VOSK_WORKERS):
+        """
+        Args:
+            model_path (str): Путь к модели Vosk
+            workers (int): Количество процессов
+        """
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("Для STT_BACKEND=vosk необходимо установить пакет vosk (requirements-vosk.txt)")
+        super().__init__()
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_vosk_worker,
+            initargs=(model_path,)
+        )
+
+    async def warm_up(self):
+        """Запускает все процессы пула, чтобы модель была загружена до первого запроса"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _vosk_ping) for _ in range(self.workers)])
+
+    async def _recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        text = await loop.run_in_executor(self.executor, _vosk_recognize, pcm, sample_rate)
+        return text or None
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FakeSpeechBackend(SpeechBackend):
+    """Детерминированный движок для тестов и замеров"""
+    name = "fake"
+
+    PHRASES = [
+        "привет как дела",
+        "расскажи интересный факт",
+        "какая сегодня погода",
+        "что нового в мире технологий"
+    ]
+
+    def __init__(self, delay: float = 0.0):
+        """
+        Args:
+            delay (float): Искусственная задержка распознавания в секундах
+        """
+        super().__init__()
+        self.delay = delay
+
+    async def _recognize(self, pcm: bytes, sample_rate: int, sample_width: int, language: str) -> Optional[str]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if not pcm:
+            return None
+        return self.PHRASES[zlib.crc32(pcm) % len(self.PHRASES)]
+
+
+BACKENDS = {
+    "google": GoogleSpeechBackend,
+    "vosk": VoskSpeechBackend,
+    "fake": FakeSpeechBackend
+}
+
+_backend: Optional[SpeechBackend] = None
+
+
+def get_speech_backend() -> SpeechBackend:
+    """Возвращает движок распознавания, выбранный в STT_BACKEND"""
+    global _backend
+    if _backend is None:
+        backend_class = BACKENDS.get(STT_BACKEND)
+        if backend_class is None:
+            logger.error(f"Неизвестный движок распознавания {STT_BACKEND}, используется google")
+            backend_class = GoogleSpeechBackend
+        _backend = backend_class()
+    return _backend
+
+
+def close_speech_backend():
+    """Освобождает ресурсы движка распознавания (вызывается при остановке бота)"""
+    global _backend
+    if _backend is not None:
+        logger.info(f"Распознавание речи: {_backend.stats()}")
+        _backend.close()
+        _backend = None
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional
+
+from gtts import gTTS
+
+from .audio import transcoder
+
+logger = logging.getLogger(__name__)
+
+TTS_LANGUAGE = "ru"
+# Количество потоков для одновременного синтеза предложений
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "8"))
+# Количество фраз и готовых ответов в кэше
+TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "512"))
+# Фрагменты короче этого склеиваются с соседними
+MIN_FRAGMENT_LENGTH = 40
+# Фрагменты длиннее этого режутся по запятым и пробелам
+MAX_FRAGMENT_LENGTH = 300
+
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Делит текст на фрагменты для параллельного синтеза
+
+    Короткие предложения объединяются, слишком длинные режутся по запятым и пробелам.
+
+    Args:
+        text (str): Текст для озвучивания
+
+    Returns:
+        List[str]: Фрагменты текста в исходном порядке
+    """
+    fragments = []
+    for sentence in SENTENCE_END.split(' '.join(text.split())):
+        while len(sentence) > MAX_FRAGMENT_LENGTH:
+            cut = sentence.rfind(',', 0, MAX_FRAGMENT_LENGTH)
+            if cut == -1:
+                cut = sentence.rfind(' ', 0, MAX_FRAGMENT_LENGTH)
+            if cut == -1:
+                cut = MAX_FRAGMENT_LENGTH - 1
+            fragments.append(sentence[:cut + 1].strip())
+            sentence = sentence[cut + 1:].strip()
+        if not sentence:
+            continue
+        if fragments and len(fragments[-1]) < MIN_FRAGMENT_LENGTH:
+            fragments[-1] = f"{fragments[-1]} {sentence}"
+        else:
+            fragments.append(sentence)
+    return fragments
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(' '.join(text.split()).lower().encode('utf-8')).hexdigest()
+
+
+class SpeechSynthesizer:
+    """
+    Конвейер синтеза речи.
+
+    Ответ делится на предложения, которые озвучиваются gTTS параллельно в
+    ограниченном пуле потоков. MP3 фрагменты склеиваются и за один проход
+    ffmpeg перекодируются в OGG/Opus. Озвученные фразы и готовые голосовые
+    сообщения кэшируются по хэшу текста.
+    """
+
+    def __init__(self, workers: int = TTS_WORKERS, cache_size: int = TTS_CACHE_SIZE):
+        """
+        Args:
+            workers (int): Количество потоков синтеза
+            cache_size (int): Количество записей в каждом кэше
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self.cache_size = cache_size
+        self._phrases: "OrderedDict[str, bytes]" = OrderedDict()
+        self._voices: "OrderedDict[str, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, cache: OrderedDict, key: str) -> Optional[bytes]:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return value
+
+    def _remember(self, cache: OrderedDict, key: str, value: bytes):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    @staticmethod
+    def _synthesize_sync(text: str) -> bytes:
+        buffer = BytesIO()
+        gTTS(text=text, lang=TTS_LANGUAGE, slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
+
+    async def synthesize_phrase(self, text: str) -> bytes:
+        """Озвучивает один фрагмент в MP3 (с кэшем)"""
+        key = _text_key(text)
+        cached = self._lookup(self._phrases, key)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        mp3 = await loop.run_in_executor(self.executor, self._synthesize_sync, text)
+        self._remember(self._phrases, key, mp3)
+        return mp3
+
+    async def synthesize(self, text: str) -> bytes:
+        """
+        Озвучивает текст в голосовое сообщение
+
+        Args:
+            text (str): Текст для озвучивания
+
+        Returns:
+            bytes: Голосовое сообщение в формате OGG/Opus
+        """
+        key = _text_key(text)
+        cached = self._lookup(self._voices, key)
+        if cached is not None:
+            return cached
+
+        fragments = split_sentences(text)
+        if not fragments:
+            raise ValueError("Нет текста для озвучивания")
+
+        mp3_parts = await asyncio.gather(*[self.synthesize_phrase(fragment) for fragment in fragments])
+        voice = await transcoder.to_voice(b"".join(mp3_parts), input_format='mp3')
+        self._remember(self._voices, key, voice)
+        return voice
+
+    def close(self):
+        """Останавливает пул потоков"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+synthesizer = SpeechSynthesizer()
@@ -1,37 +1,204 @@
 from duckduckgo_search import DDGS
 import asyncio
-from typing import List, Dict
+import logging
+import os
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Время жизни результатов поиска в кэше (секунды)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+# Максимальное количество запросов в кэше
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+# Таймаут одного поискового запроса (секунды)
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "8"))
+
+
+def normalize_query(query: str) -> str:
+    """
+    Приводит поисковый запрос к каноническому виду для кэширования
+
+    Args:
+        query (str): Поисковый запрос
+
+    Returns:
+        str: Нормализованный запрос
+    """
+    query = query.casefold().replace('ё', 'е')
+    query = re.sub(r'[^\w\s-]', ' ', query)
+    return ' '.join(query.split())
+
+
+class SearchBackend(ABC):
+    """Интерфейс поискового движка. Метод search вызывается вне event loop."""
+
+    @abstractmethod
+    def search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        """
+        Выполняет поиск
+
+        Args:
+            query (str): Нормализованный поисковый запрос
+            max_results (int): Максимальное количество результатов
+
+        Returns:
+            List[Dict[str, str]]: Результаты с ключами title, link и snippet
+        """
+
+
+class DuckDuckGoBackend(SearchBackend):
+    """Поиск через DuckDuckGo"""
+
+    def search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        with DDGS() as ddgs:
+            results = list(ddgs.text(query, max_results=max_results))
+
+        # Форматируем результаты
+        formatted_results = []
+        for result in results:
+            formatted_results.append({
+                'title': result.get('title', ''),
+                'link': result.get('href', result.get('link', '')),
+                'snippet': result.get('body', '')
+            })
+        return formatted_results
+
+
+class FakeSearchBackend(SearchBackend):
+    """Детерминированный локальный движок для тестов и замеров"""
+
+    def __init__(self, delay: float = 0.0):
+        """
+        Args:
+            delay (float): Искусственная задержка ответа в секундах
+        """
+        self.delay = delay
+        self.calls = 0
+
+    def search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return [
+            {
+                'title': f'{query} — результат {i}',
+                'link': f'https://example.com/{i}?q={query.replace(" ", "+")}',
+                'snippet': f'Описание результата {i} по запросу «{query}»'
+            }
+            for i in range(1, max_results + 1)
+        ]
+
+
+class SearchService:
+    """
+    Асинхронный поиск с кэшем и объединением одинаковых запросов.
+
+    Движок выполняется в пуле потоков с таймаутом. Результаты хранятся в LRU-кэше
+    с ограниченным временем жизни, а одновременные одинаковые запросы ждут
+    один общий вызов движка.
+    """
+
+    def __init__(self, backend: SearchBackend = None, ttl: float = SEARCH_CACHE_TTL,
+                 max_entries: int = SEARCH_CACHE_SIZE, timeout: float = SEARCH_TIMEOUT):
+        """
+        Args:
+            backend (SearchBackend): Поисковый движок
+            ttl (float): Время жизни записи кэша в секундах
+            max_entries (int): Максимальное количество записей кэша
+            timeout (float): Таймаут одного запроса к движку в секундах
+        """
+        self.backend = backend or DuckDuckGoBackend()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_cached(self, key: Tuple[str, int]) -> Optional[List[Dict[str, str]]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, results = entry
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return results
+
+    def _store(self, key: Tuple[str, int], results: List[Dict[str, str]]):
+        self._cache[key] = (time.monotonic() + self.ttl, results)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, key: Tuple[str, int]) -> List[Dict[str, str]]:
+        query, max_results = key
+        try:
+            results = await asyncio.wait_for(
+                asyncio.to_thread(self.backend.search, query, max_results),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Поиск по запросу '{query}' превысил таймаут {self.timeout} с")
+            return []
+        except Exception as e:
+            logger.error(f"Ошибка при поиске: {e}")
+            return []
+
+        if results:
+            self._store(key, results)
+        return results
+
+    async def search(self, query: str, max_results: int = 3) -> List[Dict[str, str]]:
+        """
+        Выполняет поиск
+
+        Args:
+            query (str): Поисковый запрос
+            max_results (int): Максимальное количество результатов
+
+        Returns:
+            List[Dict[str, str]]: Список результатов поиска
+        """
+        key = (normalize_query(query), max_results)
+        if not key[0]:
+            return []
+
+        cached = self._get_cached(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+
+search_service = SearchService()
+
 
 async def search_web(query: str, max_results: int = 3) -> List[Dict[str, str]]:
     """
     Выполняет поиск в интернете с помощью DuckDuckGo
-    
+
     Args:
         query (str): Поисковый запрос
         max_results (int): Максимальное количество результатов
-        
+
     Returns:
         List[Dict[str, str]]: Список результатов поиска
     """
-    try:
-        # Создаем экземпляр DDGS
-        with DDGS() as ddgs:
-            # Выполняем поиск
-            results = list(ddgs.text(query, max_results=max_results))
-            
-            # Форматируем результаты
-            formatted_results = []
-            for result in results:
-                formatted_results.append({
-                    'title': result.get('title', ''),
-                    'link': result.get('link', ''),
-                    'snippet': result.get('body', '')
-                })
-            
-            return formatted_results
-    except Exception as e:
-        print(f"Ошибка при поиске: {e}")
-        return []
+    return await search_service.search(query, max_results)
 
 def format_search_results(results: List[Dict[str, str]]) -> str:
     """
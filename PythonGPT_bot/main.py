@@ -6,21 +6,37 @@ from dotenv import load_dotenv
 from util import (
     send_photo, send_text, load_message, show_main_menu
 )
-from gpt_service.gpt import gpt, gpt_dialog
+from gpt_service.gpt import gpt, gpt_stream, conversations
+from gpt_service.streaming import StreamingMessage
+from gpt_service.engine import close_engine
+from gpt_service.images import image_pipeline, IMAGE_MAX_EDGE
+from gpt_service.stt import get_speech_backend, close_speech_backend
+from gpt_service.tts import synthesizer
+from registry import resource_registry
+from media import media_registry
+from send_queue import send_queue, priority_args, PRIORITY_STATUS
+from update_log import update_log, DurableUpdateQueue, DurableApplication
+from chat_lanes import chat_lanes
+from persistence import SQLitePersistence
+from state_backend import SharedState, StateSlot, ConversationStates, get_state_backend, chat_key, user_key, STATE_BACKEND
 from gpt_service.gpt_class import speech_to_text, text_to_speech
-from osnov_servis.random_facts import get_random_fact
+from osnov_servis.random_facts import get_random_fact, generate_facts, fact_store
 from osnov_servis.talk import talk, talk_dialog, load_character_prompt
-from osnov_servis.shared import dialog, chatgpt
+from osnov_servis.shared import sessions, chatgpt
+from osnov_servis.session import Mode
+from osnov_servis.router import ModeRouter, ModeFilter
 from osnov_servis.quiz import (
     quiz_command, quiz_start, topic_selected,
-    handle_quiz_answer, handle_quiz_callback,
+    handle_quiz_answer, handle_quiz_callback, question_bank, prefetcher,
     SELECTING_TOPIC, ANSWERING_QUESTION
 )
+from data.quiz_topics import QUIZ_TOPICS
 from osnov_servis.business_ideas import (
     business_command, business_start, category_selected,
-    handle_business_callback, SELECTING_CATEGORY, GENERATING_IDEA
+    handle_business_callback, idea_pool, BUSINESS_CATEGORIES, SELECTING_CATEGORY, GENERATING_IDEA
 )
 
+import asyncio
 import httpx
 import logging
 import html
@@ -43,19 +59,173 @@ missing_vars = [var for var in required_env_vars if not os.getenv(var)]
 if missing_vars:
     raise ValueError(f"Отсутствуют необходимые переменные окружения: {', '.join(missing_vars)}")
 
+
+async def on_startup(application):
+    """Подготавливает общие ресурсы при запуске бота"""
+    await get_speech_backend().warm_up()
+    resource_registry.start_watching()
+    media_registry.start_watching()
+    question_bank.warm_up(QUIZ_TOPICS)
+    idea_pool.warm_up(BUSINESS_CATEGORIES)
+    fact_store.start_growing(generate_facts)
+    update_log.replay(application)
+
+
+async def on_shutdown(application):
+    """Освобождает общие ресурсы при остановке бота"""
+    resource_registry.stop_watching()
+    media_registry.stop_watching()
+    await close_engine()
+    await image_pipeline.close()
+    close_speech_backend()
+    synthesizer.close()
+    logger.info(f"Предзагрузка вопросов квиза: {prefetcher.stats()}")
+    prefetcher.close()
+    question_bank.close()
+    logger.info(f"Пул бизнес-идей: {idea_pool.stats()}")
+    idea_pool.close()
+    fact_store.close()
+    logger.info(f"Очереди чатов: {chat_lanes.stats()}")
+    logger.info(f"Журнал обновлений: {update_log.stats()}")
+    logger.info(f"Общее состояние: {shared_state.stats()}")
+    await shared_state.close()
+    update_log.close()
+
+
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес вебхука, например https://bot.example.com
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Адрес и порт, на которых слушает HTTP сервер вебхука
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Максимум одновременных соединений Telegram с вебхуком
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Использовать uvloop, если он установлен
+USE_UVLOOP = os.getenv("USE_UVLOOP", "1") == "1"
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"Неизвестный режим BOT_MODE: {BOT_MODE}")
+if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    raise ValueError("Для режима webhook необходимо задать WEBHOOK_URL и WEBHOOK_SECRET")
+
+# Состояния разговоров, user_data и сессии чатов переживают перезапуск
+persistence = SQLitePersistence(sessions=sessions)
+
+# Общее состояние чатов: при STATE_BACKEND=redis его видят все реплики бота
+shared_state = SharedState(get_state_backend())
+shared_state.register(StateSlot("session", chat_key, sessions.snapshot, sessions.restore))
+shared_state.register(StateSlot("gpt", chat_key, conversations.snapshot, conversations.restore))
+shared_state.register(StateSlot("talk", chat_key, chatgpt.conversations.snapshot, chatgpt.conversations.restore))
+
+
+def user_data_snapshot(user_id):
+    """Возвращает user_data пользователя (счет и вопрос квиза) для общего хранилища"""
+    data = application.user_data.get(user_id)
+    return dict(data) if data else None
+
+
+def user_data_restore(user_id, snapshot):
+    """Восстанавливает user_data пользователя из общего хранилища"""
+    data = application.user_data[user_id]
+    data.clear()
+    data.update(snapshot)
+
+
+shared_state.register(StateSlot("user", user_key, user_data_snapshot, user_data_restore))
+
+
+def can_coalesce(update):
+    """Можно ли объединить текст с предыдущим ожидающим: обычный текст в режимах GPT и диалога"""
+    message = update.message
+    if message is None or not message.text or message.text.startswith("/"):
+        return False
+    # snapshot не создает сессию для нового чата
+    session = sessions.snapshot(update.effective_chat.id)
+    return session is not None and session[0] in (Mode.GPT.value, Mode.TALK.value)
+
+
+# Обновления одного чата выполняются по порядку, лишние получают ответ «занят»
+chat_lanes.can_coalesce = can_coalesce
+# Отклоненные обновления не обрабатываются, но в журнале считаются обработанными;
+# присоединенные отмечаются DurableApplication после обработки общего обновления
+chat_lanes.on_drop = lambda update: update_log.mark_processed(update.update_id)
+
 # Инициализируем приложение Telegram
 try:
-    application = Application.builder().token(os.getenv("TG_BOT_TOKEN")).build()
+    application = (
+        Application.builder()
+        .token(os.getenv("TG_BOT_TOKEN"))
+        .application_class(DurableApplication, kwargs={
+            "update_log": update_log,
+            # В одном процессе локальные хранилища и есть общее состояние, синхронизировать нечего
+            "shared_state": shared_state if STATE_BACKEND != "memory" else None
+        })
+        .update_queue(DurableUpdateQueue(update_log))
+        .concurrent_updates(chat_lanes)
+        .rate_limiter(send_queue)
+        .persistence(persistence)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 except Exception as e:
     raise RuntimeError(f"Ошибка при инициализации Telegram бота: {e}")
 
 # Состояния для GPT диалога
 CHATTING = 0
 
+# Клавиатуры неизменяемы, поэтому строятся один раз при запуске
+GPT_TOPIC_ROWS = [
+    [
+        InlineKeyboardButton("💭 Общие вопросы", callback_data="gpt_topic_general"),
+        InlineKeyboardButton("💻 Программирование", callback_data="gpt_topic_programming")
+    ],
+    [
+        InlineKeyboardButton("🔬 Наука", callback_data="gpt_topic_science"),
+        InlineKeyboardButton("🎨 Искусство", callback_data="gpt_topic_art")
+    ],
+    [
+        InlineKeyboardButton("📚 Образование", callback_data="gpt_topic_education"),
+        InlineKeyboardButton("💼 Бизнес", callback_data="gpt_topic_business")
+    ]
+]
+GPT_TOPICS_KEYBOARD = InlineKeyboardMarkup(GPT_TOPIC_ROWS + [
+    [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
+])
+GPT_TOPICS_VOICE_KEYBOARD = InlineKeyboardMarkup(GPT_TOPIC_ROWS + [
+    [InlineKeyboardButton("🎤 Голосовой режим", callback_data="gpt_voice_mode")],
+    [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
+])
+GPT_TOPIC_SELECTED_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("❓ Задать вопрос", callback_data="gpt_ask_question")],
+    [InlineKeyboardButton("🔄 Сменить тему", callback_data="gpt_change_topic")],
+    [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
+])
+GPT_ANSWER_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("❓ Задать еще вопрос", callback_data="gpt_ask_question")],
+    [InlineKeyboardButton("🔄 Сменить тему", callback_data="gpt_change_topic")],
+    [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
+])
+GPT_RETRY_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Попробовать снова", callback_data="gpt_retry")],
+    [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
+])
+FACT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎲 Еще факт", callback_data="new_fact")],
+    [InlineKeyboardButton("📚 Еще факт (без картинки)", callback_data="new_fact_no_photo")]
+])
+FACT_SHORT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎲 Еще факт", callback_data="new_fact")]
+])
+
 
 async def start(update, context):
     """Обработчик команды /start"""
-    dialog.mode = "main"
+    sessions.enter(update.effective_chat.id, Mode.MAIN)
     text = load_message("main")
     await send_photo(update, context, "main")
     await send_text(update, context, text)
@@ -75,20 +245,17 @@ async def talk_button(update, context):
     await query.answer()
     await send_photo(update, context, query.data)
     await send_text(update, context, "отличный выбор! Можете начать общаться!")
+    session = sessions.enter(update.effective_chat.id, Mode.TALK)
+    session.persona = query.data
     prompt = load_character_prompt(query.data)
-    chatgpt.set_prompt(prompt)
+    chatgpt.set_prompt(update.effective_chat.id, prompt)
 
 
 async def random_fact(update, context):
     """Обработчик команды случайного факта"""
-    fact = get_random_fact()
+    fact = html.escape(get_random_fact(update.effective_user.id))
 
-    # Создаем клавиатуру с кнопками
-    keyboard = [
-        [InlineKeyboardButton("🎲 Еще факт", callback_data="new_fact")],
-        [InlineKeyboardButton("📚 Еще факт (без картинки)", callback_data="new_fact_no_photo")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = FACT_KEYBOARD
 
     # Если это первый вызов (через команду /fact)
     if update.message:
@@ -103,13 +270,10 @@ async def random_fact(update, context):
         query = update.callback_query
         await query.answer()
 
-        # Получаем новый факт
-        new_fact = get_random_fact()
-
         try:
             # Пытаемся обновить сообщение
             await query.edit_message_text(
-                f"📚 <b>Интересный факт:</b>\n\n{new_fact}",
+                f"📚 <b>Интересный факт:</b>\n\n{fact}",
                 reply_markup=reply_markup,
                 parse_mode='HTML'
             )
@@ -117,7 +281,7 @@ async def random_fact(update, context):
             logger.error(f"Ошибка при обновлении факта: {e}")
             # Если ошибка, отправляем новое сообщение
             await query.message.reply_text(
-                f"📚 <b>Интересный факт:</b>\n\n{new_fact}",
+                f"📚 <b>Интересный факт:</b>\n\n{fact}",
                 reply_markup=reply_markup,
                 parse_mode='HTML'
             )
@@ -130,12 +294,8 @@ async def fact_button(update, context):
 
     if query.data == "new_fact_no_photo":
         # Получаем новый факт без картинки
-        fact = get_random_fact()
-        keyboard = [
-            [InlineKeyboardButton("🎲 Еще факт", callback_data="new_fact")],
-
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        fact = html.escape(get_random_fact(update.effective_user.id))
+        reply_markup = FACT_SHORT_KEYBOARD
 
         try:
             await query.edit_message_text(
@@ -154,6 +314,22 @@ async def fact_button(update, context):
         return await random_fact(update, context)
 
 
+async def unknown_message(update, context):
+    """Отвечает на сообщения, которые текущий режим не обрабатывает"""
+    await update.message.reply_text(
+        "🤔 Сейчас не выбран режим, который может ответить на это сообщение.\n"
+        "Выберите режим в главном меню: /start"
+    )
+
+
+async def quiz_without_question(update, context):
+    """Отвечает на текст в режиме квиза, когда разговор квиза не ждет ответа"""
+    await update.message.reply_text(
+        "❓ Сейчас нет вопроса, на который нужно ответить.\n"
+        "Чтобы продолжить квиз, выберите тему: /quiz"
+    )
+
+
 async def business_button(update, context):
     """Обработчик кнопки генератора идей"""
     query = update.callback_query
@@ -173,7 +349,8 @@ quiz_handler = ConversationHandler(
             CallbackQueryHandler(handle_quiz_callback, pattern=r'^quiz_')
         ],
         ANSWERING_QUESTION: [
-            MessageHandler(filters.TEXT & ~filters.COMMAND, handle_quiz_answer),
+            # Ответ обрабатывается внутри разговора, чтобы END из handle_quiz_answer завершал его
+            MessageHandler(filters.TEXT & ~filters.COMMAND & ModeFilter(sessions, Mode.QUIZ), handle_quiz_answer),
             CallbackQueryHandler(handle_quiz_callback, pattern=r'^quiz_')
         ]
     },
@@ -183,7 +360,8 @@ quiz_handler = ConversationHandler(
     ],
     per_chat=True,
     per_message=False,
-    name="quiz_conversation"
+    name="quiz_conversation",
+    persistent=True
 )
 
 # Создаем обработчики для генератора идей
@@ -209,38 +387,23 @@ business_handler = ConversationHandler(
     ],
     per_chat=True,
     per_message=False,
-    name="business_conversation"
+    name="business_conversation",
+    persistent=True
 )
 
 
 async def gpt_command(update, context):
     """Обработчик команды /gpt"""
+    sessions.enter(update.effective_chat.id, Mode.GPT)
     await send_photo(update, context, "gpt")
     await send_text(update, context, "🤖 <b>Добро пожаловать в чат с GPT!</b>\n\n"
                                      "Я могу помочь вам с различными темами. "
                                      "Выберите интересующую вас категорию ниже:")
 
-    keyboard = [
-        [
-            InlineKeyboardButton("💭 Общие вопросы", callback_data="gpt_topic_general"),
-            InlineKeyboardButton("💻 Программирование", callback_data="gpt_topic_programming")
-        ],
-        [
-            InlineKeyboardButton("🔬 Наука", callback_data="gpt_topic_science"),
-            InlineKeyboardButton("🎨 Искусство", callback_data="gpt_topic_art")
-        ],
-        [
-            InlineKeyboardButton("📚 Образование", callback_data="gpt_topic_education"),
-            InlineKeyboardButton("💼 Бизнес", callback_data="gpt_topic_business")
-        ],
-        [InlineKeyboardButton("🎤 Голосовой режим", callback_data="gpt_voice_mode")],
-        [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text(
         "🎯 <b>Выберите тему для общения:</b>\n\n"
         "💡 <i>Каждая тема имеет свои особенности и специализацию</i>",
-        reply_markup=reply_markup,
+        reply_markup=GPT_TOPICS_VOICE_KEYBOARD,
         parse_mode='HTML'
     )
     return CHATTING
@@ -250,31 +413,16 @@ async def gpt_start(update, context):
     """Обработчик начала диалога с GPT"""
     query = update.callback_query
     await query.answer()
+    sessions.enter(update.effective_chat.id, Mode.GPT)
     await send_photo(update, context, "gpt")
     await send_text(update, context, "🤖 <b>Добро пожаловать в чат с GPT!</b>\n\n"
                                      "Я могу помочь вам с различными темами. "
                                      "Выберите интересующую вас категорию ниже:")
 
-    keyboard = [
-        [
-            InlineKeyboardButton("💭 Общие вопросы", callback_data="gpt_topic_general"),
-            InlineKeyboardButton("💻 Программирование", callback_data="gpt_topic_programming")
-        ],
-        [
-            InlineKeyboardButton("🔬 Наука", callback_data="gpt_topic_science"),
-            InlineKeyboardButton("🎨 Искусство", callback_data="gpt_topic_art")
-        ],
-        [
-            InlineKeyboardButton("📚 Образование", callback_data="gpt_topic_education"),
-            InlineKeyboardButton("💼 Бизнес", callback_data="gpt_topic_business")
-        ],
-        [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await query.message.reply_text(
         "🎯 <b>Выберите тему для общения:</b>\n\n"
         "💡 <i>Каждая тема имеет свои особенности и специализацию</i>",
-        reply_markup=reply_markup,
+        reply_markup=GPT_TOPICS_KEYBOARD,
         parse_mode='HTML'
     )
     return CHATTING
@@ -286,6 +434,8 @@ async def gpt_topic_selected(update, context):
     await query.answer()
 
     topic = query.data.split('_')[-1]
+    session = sessions.enter(update.effective_chat.id, Mode.GPT)
+    session.topic = topic
     topics = {
         'general': "💭 общие вопросы",
         'programming': "💻 программирование",
@@ -305,21 +455,13 @@ async def gpt_topic_selected(update, context):
     }
 
     try:
-        # Создаем клавиатуру с кнопками
-        keyboard = [
-            [InlineKeyboardButton("❓ Задать вопрос", callback_data="gpt_ask_question")],
-            [InlineKeyboardButton("🔄 Сменить тему", callback_data="gpt_change_topic")],
-            [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
         await query.message.reply_text(
             f"✅ <b>Вы выбрали тему: {topics.get(topic, topic)}</b>\n\n"
             f"<i>{topic_descriptions.get(topic, '')}</i>\n\n"
             "💡 Теперь вы можете задавать вопросы. Я постараюсь дать вам подробный и полезный ответ.\n\n"
             "🔙 Для возврата в меню используйте кнопку ниже:",
             parse_mode='HTML',
-            reply_markup=reply_markup
+            reply_markup=GPT_TOPIC_SELECTED_KEYBOARD
         )
         return CHATTING
     except Exception as e:
@@ -341,56 +483,47 @@ async def handle_gpt_message(update, context):
     """Обработчик сообщений для GPT"""
     try:
         # Отправляем индикатор набора текста с анимацией
-        status_message = await update.message.reply_text(
+        status_message = await context.bot.send_message(
+            update.effective_chat.id,
             "💭 <i>Думаю над ответом</i>",
-            parse_mode='HTML'
+            parse_mode='HTML',
+            rate_limit_args=priority_args(context.bot, PRIORITY_STATUS)
         )
 
         # Проверяем, есть ли фото в сообщении
         image_url = None
+        image_key = None
         if update.message.photo:
-            # Получаем URL самого большого фото
-            photo = update.message.photo[-1]
+            # Берем наименьший размер фото, которого достаточно для модели
+            photo = next(
+                (size for size in update.message.photo if max(size.width, size.height) >= IMAGE_MAX_EDGE),
+                update.message.photo[-1]
+            )
+            image_key = photo.file_unique_id
             file = await context.bot.get_file(photo.file_id)
             image_url = file.file_path
 
         # Получаем текст сообщения
-        text = update.message.text or update.message.caption or "Проанализируй это изображение"
-
-        # Получаем ответ от GPT
-        response = await gpt(text, image_url)
-
-        # Создаем клавиатуру с кнопками
-        keyboard = [
-            [InlineKeyboardButton("❓ Задать еще вопрос", callback_data="gpt_ask_question")],
-            [InlineKeyboardButton("🔄 Сменить тему", callback_data="gpt_change_topic")],
-            [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
-        # Удаляем сообщение о статусе
-        await status_message.delete()
-
-        # Отправляем ответ с красивым форматированием
-        await update.message.reply_text(
-            f"🤖 <b>Ответ GPT:</b>\n\n{response}\n\n"
-            "💡 <i>Вы можете задать новый вопрос, сменить тему или вернуться в меню</i>",
-            parse_mode='HTML',
-            reply_markup=reply_markup
+        # Тексты, отправленные подряд, пока бот отвечал, приходят одним запросом
+        text = chat_lanes.text_of(update) or update.message.caption or "Проанализируй это изображение"
+
+        # Получаем ответ от GPT и показываем его по мере генерации в сообщении о статусе
+        streamer = StreamingMessage(
+            status_message,
+            prefix="🤖 <b>Ответ GPT:</b>\n\n",
+            suffix="\n\n💡 <i>Вы можете задать новый вопрос, сменить тему или вернуться в меню</i>"
+        )
+        await streamer.consume(
+            gpt_stream(text, image_url, chat_id=update.effective_chat.id, image_key=image_key),
+            reply_markup=GPT_ANSWER_KEYBOARD
         )
     except Exception as e:
         # В случае ошибки отправляем сообщение об ошибке
-        keyboard = [
-            [InlineKeyboardButton("🔄 Попробовать снова", callback_data="gpt_retry")],
-            [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
         await update.message.reply_text(
             "😔 <b>Произошла ошибка при обработке запроса</b>\n\n"
             "Пожалуйста, попробуйте еще раз или вернитесь в меню.",
             parse_mode='HTML',
-            reply_markup=reply_markup
+            reply_markup=GPT_RETRY_KEYBOARD
         )
         logger.error(f"Ошибка в handle_gpt_message: {e}")
 
@@ -427,7 +560,8 @@ async def handle_gpt_callback(update, context):
     elif query.data == "gpt_main_menu":
         try:
             # Очищаем историю сообщений GPT
-            chatgpt.message_list.clear()
+            conversations.discard(update.effective_chat.id)
+            sessions.enter(update.effective_chat.id, Mode.MAIN)
 
             # Отправляем сообщение о возврате в меню
             await query.message.reply_text(
@@ -462,29 +596,11 @@ async def handle_gpt_callback(update, context):
                                              "Я могу помочь вам с различными темами. "
                                              "Выберите интересующую вас категорию ниже:")
 
-            # Создаем клавиатуру с темами
-            keyboard = [
-                [
-                    InlineKeyboardButton("💭 Общие вопросы", callback_data="gpt_topic_general"),
-                    InlineKeyboardButton("💻 Программирование", callback_data="gpt_topic_programming")
-                ],
-                [
-                    InlineKeyboardButton("🔬 Наука", callback_data="gpt_topic_science"),
-                    InlineKeyboardButton("🎨 Искусство", callback_data="gpt_topic_art")
-                ],
-                [
-                    InlineKeyboardButton("📚 Образование", callback_data="gpt_topic_education"),
-                    InlineKeyboardButton("💼 Бизнес", callback_data="gpt_topic_business")
-                ],
-                [InlineKeyboardButton("🏠 Вернуться в меню", callback_data="gpt_main_menu")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
             # Отправляем сообщение с темами
             await query.message.reply_text(
                 "🎯 <b>Выберите тему для общения:</b>\n\n"
                 "💡 <i>Каждая тема имеет свои особенности и специализацию</i>",
-                reply_markup=reply_markup,
+                reply_markup=GPT_TOPICS_KEYBOARD,
                 parse_mode='HTML'
             )
             return CHATTING
@@ -538,9 +654,11 @@ async def handle_voice_message(update, context):
     """Обработчик голосовых сообщений"""
     try:
         # Отправляем индикатор набора текста
-        status_message = await update.message.reply_text(
+        status_message = await context.bot.send_message(
+            update.effective_chat.id,
             "🎤 <i>Обрабатываю голосовое сообщение...</i>",
-            parse_mode='HTML'
+            parse_mode='HTML',
+            rate_limit_args=priority_args(context.bot, PRIORITY_STATUS)
         )
 
         # Получаем голосовое сообщение
@@ -561,7 +679,7 @@ async def handle_voice_message(update, context):
             return CHATTING
 
         # Получаем ответ от GPT
-        response = await gpt(text)
+        response = await gpt(text, chat_id=update.effective_chat.id)
 
         # Конвертируем ответ в голос
         voice_response = await text_to_speech(response)
@@ -604,8 +722,6 @@ gpt_handler = ConversationHandler(
     ],
     states={
         CHATTING: [
-            MessageHandler(filters.TEXT & ~filters.COMMAND, handle_gpt_message),
-            MessageHandler(filters.VOICE, handle_voice_message),
             CallbackQueryHandler(gpt_topic_selected, pattern=r'^gpt_topic_'),
             CallbackQueryHandler(handle_gpt_callback, pattern=r'^gpt_')
         ]
@@ -617,9 +733,15 @@ gpt_handler = ConversationHandler(
     ],
     per_chat=True,
     per_message=False,
-    name="gpt_conversation"
+    name="gpt_conversation",
+    persistent=True
 )
 
+# Кнопка, нажатая на другой реплике, должна попасть в то же состояние разговора
+conversation_states = ConversationStates([quiz_handler, business_handler, gpt_handler])
+shared_state.register(StateSlot("conversation", ConversationStates.key_of,
+                                conversation_states.snapshot, conversation_states.restore))
+
 # Добавляем обработчики в правильном порядке
 # Сначала добавляем ConversationHandler'ы
 application.add_handler(gpt_handler)
@@ -633,9 +755,17 @@ application.add_handler(CommandHandler("talk", talk))
 application.add_handler(CommandHandler("fact", random_fact))
 application.add_handler(CommandHandler("business", business_command))
 
-# Добавляем обработчики для диалогов
-application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, talk_dialog))
-application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, gpt_dialog))
+# Текст, голос и фото передаются обработчику текущего режима чата
+router = ModeRouter(sessions)
+router.register(Mode.GPT, text=handle_gpt_message, voice=handle_voice_message, photo=handle_gpt_message)
+router.register(Mode.TALK, text=talk_dialog)
+# Ответы на вопросы квиза обрабатывает quiz_handler, сюда попадает текст вне вопроса
+router.register(Mode.QUIZ, text=quiz_without_question)
+router.set_default(unknown_message)
+application.add_handler(MessageHandler(
+    (filters.TEXT & ~filters.COMMAND) | filters.VOICE | filters.PHOTO,
+    router.dispatch
+))
 
 # Добавляем обработчики для кнопок
 application.add_handler(CallbackQueryHandler(talk_button, pattern="^talk_.*"))
@@ -662,12 +792,38 @@ async def error_handler(update, context):
 
 application.add_error_handler(error_handler)
 
+def install_uvloop():
+    """Включает uvloop в качестве event loop, если он установлен"""
+    if not USE_UVLOOP:
+        return
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("uvloop не установлен, используется стандартный event loop")
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Используется uvloop")
+
+
 # Запускаем бота
 if __name__ == '__main__':
-    # Добавляем параметры для предотвращения конфликтов
-    application.run_polling(
-        allowed_updates=Update.ALL_TYPES,
-        drop_pending_updates=True,
-        close_loop=False
-    )
+    install_uvloop()
+    if BOT_MODE == "webhook":
+        # Очередь необработанных обновлений сохраняется на стороне Telegram между перезапусками
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES,
+            close_loop=False
+        )
+    else:
+        # Накопившиеся обновления не отбрасываются: повторы отсеивает журнал обновлений
+        application.run_polling(
+            allowed_updates=Update.ALL_TYPES,
+            close_loop=False
+        )
 
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot, Message
+from telegram.error import BadRequest
+
+from registry import RESOURCE_RELOAD_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = "resources/images"
+# Файл с file_id уже загруженных изображений
+MEDIA_INDEX_PATH = os.getenv("MEDIA_INDEX_PATH", "resources/media_index.json")
+
+
+def file_hash(path: str) -> str:
+    """Считает sha1 содержимого файла"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaRegistry:
+    """
+    Реестр file_id статических изображений.
+
+    Каждое изображение загружается в Telegram один раз, после чего
+    отправляется по file_id. Индекс хранится в JSON-файле и проверяется
+    по времени изменения и размеру файла; если они изменились, сравнивается
+    хэш содержимого и при отличии изображение загружается заново. Проверка
+    выполняется при запуске и в фоновой задаче, а не при каждой отправке.
+    """
+
+    def __init__(self, index_path: str = MEDIA_INDEX_PATH, images_dir: str = IMAGES_DIR):
+        """
+        Args:
+            index_path (str): Путь к файлу индекса
+            images_dir (str): Папка с изображениями
+        """
+        self.index_path = index_path
+        self.images_dir = images_dir
+        self._index: Dict[str, Dict] = self._load()
+        self._watch_task: Optional[asyncio.Task] = None
+        self.validate()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Ошибка при чтении индекса изображений: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf8") as file:
+                json.dump(self._index, file, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении индекса изображений: {e}")
+
+    def _check(self, index: Dict[str, Dict]) -> Tuple[List[str], Dict[str, int]]:
+        """
+        Сверяет записи индекса с файлами на диске, ничего не изменяя
+
+        Выполняется в пуле потоков, поэтому получает копию индекса.
+
+        Args:
+            index (Dict[str, Dict]): Копия индекса
+
+        Returns:
+            Tuple[List[str], Dict[str, int]]: Ключи устаревших записей и новое
+            время изменения файлов, перезаписанных тем же содержимым
+        """
+        stale = []
+        touched = {}
+        for key, entry in index.items():
+            name = key.split(":", 1)[1]
+            path = os.path.join(self.images_dir, name + ".jpg")
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stale.append(key)
+                continue
+
+            if entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                continue
+
+            # Файл мог быть перезаписан тем же содержимым
+            if entry["size"] == stat.st_size and entry["sha1"] == file_hash(path):
+                touched[key] = stat.st_mtime_ns
+            else:
+                stale.append(key)
+        return stale, touched
+
+    def _apply(self, index: Dict[str, Dict], stale: List[str], touched: Dict[str, int]) -> int:
+        """
+        Применяет результат проверки к индексу и сохраняет его
+
+        Записи, замененные после снятия копии (например, при повторной загрузке
+        в send_photo), не трогаются.
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        removed = 0
+        for key in stale:
+            if key in self._index and self._index[key] is index[key]:
+                del self._index[key]
+                removed += 1
+        changed = False
+        for key, mtime in touched.items():
+            if key in self._index and self._index[key] is index[key]:
+                self._index[key]["mtime"] = mtime
+                changed = True
+
+        if changed or removed:
+            self._save()
+        return removed
+
+    def validate(self) -> int:
+        """
+        Сверяет индекс с файлами на диске и забывает file_id измененных изображений
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        index = dict(self._index)
+        return self._apply(index, *self._check(index))
+
+    async def watch(self, interval: float = RESOURCE_RELOAD_INTERVAL):
+        """
+        Периодически проверяет изменения изображений
+
+        Обращения к диску выполняются в пуле потоков, а индекс изменяется и
+        сохраняется только в event loop, как и в send_photo.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                index = dict(self._index)
+                stale, touched = await asyncio.to_thread(self._check, index)
+                removed = self._apply(index, stale, touched)
+                if removed:
+                    logger.info(f"Изображения изменились, file_id сброшены: {removed}")
+            except Exception as e:
+                logger.error(f"Ошибка при проверке изображений: {e}")
+
+    def start_watching(self):
+        """Запускает фоновую проверку изображений"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self.watch())
+
+    def stop_watching(self):
+        """Останавливает фоновую проверку изображений"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+    async def send_photo(self, bot: Bot, chat_id: int, name: str, **kwargs) -> Message:
+        """
+        Отправляет изображение из resources/images по имени
+
+        Args:
+            bot (Bot): Бот
+            chat_id (int): ID чата
+            name (str): Имя изображения без расширения
+
+        Returns:
+            Message: Отправленное сообщение
+        """
+        path = os.path.join(self.images_dir, name + ".jpg")
+        # file_id действителен только для бота, который загрузил файл
+        key = f"{bot.id}:{name}"
+
+        # Актуальность индекса проверяет фоновая задача, здесь нет обращений к диску
+        entry = self._index.get(key)
+        if entry:
+            file_id = entry["file_id"]
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except BadRequest as e:
+                logger.warning(f"file_id изображения {name} недействителен, загружаем заново: {e}")
+                self._index.pop(key, None)
+
+        stat = os.stat(path)
+        with open(path, 'rb') as photo:
+            message = await bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+
+        self._index[key] = {
+            "file_id": message.photo[-1].file_id,
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": file_hash(path)
+        }
+        self._save()
+        return message
+
+
+media_registry = MediaRegistry()
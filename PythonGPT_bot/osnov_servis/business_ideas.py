@@ -1,7 +1,13 @@
 import logging
+from contextlib import aclosing
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from gpt_service.gpt import get_personality_response
+from gpt_service.gpt import TEXT_MODEL
+from gpt_service.engine import get_engine
+from gpt_service.streaming import StreamingMessage
+from osnov_servis.idea_pool import IdeaPool
+from osnov_servis.shared import sessions
+from osnov_servis.session import Mode
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +35,34 @@ BUSINESS_CATEGORIES = {
 }
 
 
-def get_business_categories_keyboard():
+IDEA_REQUEST = "Создай детальную бизнес-идею"
+
+
+def _idea_messages(category_id: str) -> list:
+    """Формирует запрос идеи для категории без истории чата"""
+    return [
+        {"role": "system", "content": BUSINESS_CATEGORIES[category_id]['prompt']},
+        {"role": "user", "content": IDEA_REQUEST}
+    ]
+
+
+async def generate_idea(category_id: str) -> str:
+    """Генерирует идею для пула категории"""
+    return await get_engine().complete(_idea_messages(category_id), model=TEXT_MODEL, temperature=1.0)
+
+
+async def stream_idea(category_id: str):
+    """Генерирует идею потоком, когда в пуле нет новых идей для пользователя"""
+    async with aclosing(get_engine().stream(_idea_messages(category_id), model=TEXT_MODEL, temperature=1.0)) as chunks:
+        async for delta in chunks:
+            yield delta
+
+
+# Идеи не зависят от пользователя, поэтому генерируются заранее и выдаются из пула
+idea_pool = IdeaPool(generate_idea, stream_idea)
+
+
+def _build_business_categories_keyboard():
     """Создает клавиатуру с категориями бизнеса"""
     keyboard = []
     for category_id, category_data in BUSINESS_CATEGORIES.items():
@@ -40,13 +73,28 @@ def get_business_categories_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 
+# Клавиатуры неизменяемы, поэтому строятся один раз при загрузке модуля
+BUSINESS_CATEGORIES_KEYBOARD = _build_business_categories_keyboard()
+
+BUSINESS_CONTINUE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Новая идея", callback_data="business_new_idea")],
+    [InlineKeyboardButton("🏠 В главное меню", callback_data="main_menu")]
+])
+
+BUSINESS_MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🧠 Квиз", callback_data="quiz_interface")],
+    [InlineKeyboardButton("💡 Генератор идей", callback_data="business_interface")]
+])
+
+
+def get_business_categories_keyboard():
+    """Возвращает клавиатуру с категориями бизнеса"""
+    return BUSINESS_CATEGORIES_KEYBOARD
+
+
 def get_business_continue_keyboard():
-    """Создает клавиатуру для продолжения или завершения"""
-    keyboard = [
-        [InlineKeyboardButton("🔄 Новая идея", callback_data="business_new_idea")],
-        [InlineKeyboardButton("🏠 В главное меню", callback_data="main_menu")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    """Возвращает клавиатуру для продолжения или завершения"""
+    return BUSINESS_CONTINUE_KEYBOARD
 
 
 async def business_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -74,6 +122,7 @@ async def business_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         keyboard = get_business_categories_keyboard()
+        sessions.enter(update.effective_chat.id, Mode.BUSINESS)
 
         if update.callback_query:
             await update.callback_query.edit_message_text(
@@ -118,32 +167,26 @@ async def category_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         context.user_data['current_category'] = category_id
         context.user_data['category_data'] = category_data
+        session = sessions.enter(update.effective_chat.id, Mode.BUSINESS)
+        session.topic = category_id
 
-        processing_text = f"💭 Генерирую идею для {category_data['name']}... ⏳"
-        await query.edit_message_text(processing_text, parse_mode='HTML')
+        streamer = StreamingMessage(query.message, prefix=f"💡 <b>Идея для {category_data['name']}</b>\n\n")
+        idea = idea_pool.next_idea(category_id, update.effective_user.id)
+        if idea is not None:
+            await streamer.show(idea, reply_markup=get_business_continue_keyboard())
+        else:
+            processing_text = f"💭 Генерирую идею для {category_data['name']}... ⏳"
+            await query.edit_message_text(processing_text, parse_mode='HTML')
 
-        # Получаем идею от GPT
-        idea = await get_personality_response(
-            "Создай детальную бизнес-идею",
-            category_data['prompt']
-        )
+            # Новых идей в пуле нет: генерируем и показываем по мере генерации
+            idea = await streamer.consume(
+                idea_pool.stream_new(category_id, update.effective_user.id),
+                reply_markup=get_business_continue_keyboard()
+            )
 
         if not idea:
             raise Exception("Не удалось получить идею от GPT")
 
-        # Форматируем и отправляем результат
-        result_text = (
-            f"💡 <b>Идея для {category_data['name']}</b>\n\n"
-            f"{idea}"
-        )
-
-        keyboard = get_business_continue_keyboard()
-        await query.edit_message_text(
-            result_text,
-            parse_mode='HTML',
-            reply_markup=keyboard
-        )
-
         return GENERATING_IDEA
 
     except Exception as e:
@@ -166,19 +209,13 @@ async def handle_business_callback(update: Update, context: ContextTypes.DEFAULT
         elif query.data == "main_menu":
             # Очищаем данные
             context.user_data.clear()
-
-            # Создаем кнопки главного меню
-            keyboard = [
-                [InlineKeyboardButton("🧠 Квиз", callback_data="quiz_interface")],
-                [InlineKeyboardButton("💡 Генератор идей", callback_data="business_interface")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            sessions.enter(update.effective_chat.id, Mode.MAIN)
 
             # Отправляем сообщение с главным меню
             await query.edit_message_text(
                 "🏠 <b>Главное меню</b>\n\nВыберите действие:",
                 parse_mode='HTML',
-                reply_markup=reply_markup
+                reply_markup=BUSINESS_MAIN_MENU_KEYBOARD
             )
             return ConversationHandler.END
 
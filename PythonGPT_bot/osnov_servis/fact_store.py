@@ -0,0 +1,350 @@
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Iterable, List, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Файл с текстами фактов подряд в UTF-8
+FACTS_DATA_PATH = os.getenv("FACTS_DATA_PATH", "resources/facts.bin")
+# Файл смещений фактов в FACTS_DATA_PATH
+FACTS_INDEX_PATH = os.getenv("FACTS_INDEX_PATH", "resources/facts.idx")
+# Исходный список фактов (по одному на строку), из которого собирается хранилище
+FACTS_SEED_PATH = os.getenv("FACTS_SEED_PATH", "resources/facts.txt")
+# Максимальное количество пользователей, для которых помнятся показанные факты
+MAX_FACT_USERS = int(os.getenv("MAX_FACT_USERS", "100000"))
+# Интервал пополнения корпуса фактами от модели (секунды, 0 — отключено)
+FACT_GROW_INTERVAL = float(os.getenv("FACT_GROW_INTERVAL", "0"))
+# Количество фактов, запрашиваемых у модели за одно пополнение
+FACT_GROW_BATCH = int(os.getenv("FACT_GROW_BATCH", "20"))
+
+# Смещения хранятся как uint64 little-endian; в индексе count + 1 смещение, первое равно 0
+OFFSET = struct.Struct("<Q")
+# Сколько раз пробуем случайный индекс, прежде чем искать непоказанный факт по битовой маске
+RANDOM_ATTEMPTS = 8
+# Байт битовой маски, в котором есть хотя бы один непоказанный факт
+_UNSEEN_BYTE = re.compile(rb"[^\xff]")
+# Маска просматривается блоками: сравнение блока с заполненным идет со скоростью memcmp
+SCAN_BLOCK = 4096
+_FULL_BLOCK = b"\xff" * SCAN_BLOCK
+# Примерный размер одного номера во множестве показанных фактов (байты);
+# когда множество становится больше битовой маски корпуса, оно заменяется маской
+SPARSE_ENTRY_BYTES = 64
+
+# Генератор возвращает список новых фактов
+FactGenerator = Callable[[int], Awaitable[List[str]]]
+
+
+def _fact_hash(text: str) -> bytes:
+    return hashlib.blake2b(' '.join(text.casefold().split()).encode('utf-8'), digest_size=8).digest()
+
+
+def build_store(facts: Iterable[str], data_path: str = FACTS_DATA_PATH,
+                index_path: str = FACTS_INDEX_PATH) -> int:
+    """
+    Собирает хранилище фактов из списка строк
+
+    Args:
+        facts (Iterable[str]): Тексты фактов
+        data_path (str): Путь к файлу текстов
+        index_path (str): Путь к файлу смещений
+
+    Returns:
+        int: Количество записанных фактов (без пустых строк и дублей)
+    """
+    seen: Set[bytes] = set()
+    offset = 0
+    count = 0
+    with open(data_path, "wb") as data, open(index_path, "wb") as index:
+        index.write(OFFSET.pack(0))
+        for fact in facts:
+            fact = fact.strip()
+            digest = _fact_hash(fact)
+            if not fact or digest in seen:
+                continue
+            seen.add(digest)
+            encoded = fact.encode("utf-8")
+            data.write(encoded)
+            offset += len(encoded)
+            index.write(OFFSET.pack(offset))
+            count += 1
+    return count
+
+
+class FactStore:
+    """
+    Корпус фактов с произвольным доступом за O(1).
+
+    Тексты лежат подряд в одном файле UTF-8, а отдельный индекс хранит
+    смещения фактов. Оба файла отображаются в память через mmap, поэтому
+    факт читается по номеру без загрузки корпуса в RAM. Для каждого
+    пользователя хранятся показанные факты, так что они не повторяются, пока
+    пользователь не увидит все: пока их немного — множеством номеров, а когда
+    множество становится больше битовой маски (бит на факт) — маской. Поэтому
+    память на пользователя растет с числом показанных ему фактов, а не с
+    размером корпуса.
+    """
+
+    def __init__(self, data_path: str = FACTS_DATA_PATH, index_path: str = FACTS_INDEX_PATH,
+                 seed_path: str = FACTS_SEED_PATH, max_users: int = MAX_FACT_USERS):
+        """
+        Args:
+            data_path (str): Путь к файлу текстов
+            index_path (str): Путь к файлу смещений
+            seed_path (str): Исходный список фактов, если хранилище еще не собрано
+            max_users (int): Максимальное количество пользователей, для которых помнятся показанные факты
+        """
+        self.data_path = data_path
+        self.index_path = index_path
+        self.max_users = max_users
+        if not os.path.exists(index_path) or not os.path.exists(data_path):
+            with open(seed_path, encoding="utf-8") as seed:
+                count = build_store(seed, data_path, index_path)
+            logger.info(f"Хранилище фактов собрано из {seed_path}: {count} фактов")
+
+        self._data: Optional[mmap.mmap] = None
+        self._index: Optional[mmap.mmap] = None
+        self._seen: "OrderedDict[Hashable, Union[Set[int], bytearray]]" = OrderedDict()
+        self._hashes: Optional[Set[bytes]] = None
+        self._grow_task: Optional[asyncio.Task] = None
+        self._remap()
+
+    def _remap(self):
+        """Заново отображает файлы в память (после добавления фактов)"""
+        for mapped in (self._data, self._index):
+            if mapped is not None:
+                mapped.close()
+        self.count = os.path.getsize(self.index_path) // OFFSET.size - 1
+        self._index = self._map(self.index_path)
+        self._data = self._map(self.data_path)
+
+    @staticmethod
+    def _map(path: str) -> Optional[mmap.mmap]:
+        with open(path, "rb") as file:
+            # Пустой файл отобразить нельзя
+            if os.fstat(file.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, number: int) -> str:
+        """Возвращает факт по номеру"""
+        if not 0 <= number < self.count:
+            raise IndexError(number)
+        start, = OFFSET.unpack_from(self._index, number * OFFSET.size)
+        end, = OFFSET.unpack_from(self._index, (number + 1) * OFFSET.size)
+        return self._data[start:end].decode("utf-8")
+
+    def _user_seen(self, user_id: Hashable) -> Union[Set[int], bytearray]:
+        seen = self._seen.get(user_id)
+        if seen is None:
+            seen = self._seen[user_id] = set()
+            if len(self._seen) > self.max_users:
+                self._seen.popitem(last=False)
+        else:
+            self._seen.move_to_end(user_id)
+        if isinstance(seen, bytearray):
+            # Корпус мог вырасти, поэтому маска дополняется нулями
+            size = (self.count + 7) // 8
+            if len(seen) < size:
+                seen.extend(bytes(size - len(seen)))
+        return seen
+
+    def _to_bits(self, user_id: Hashable, numbers: Set[int]) -> bytearray:
+        """Заменяет множество показанных фактов пользователя битовой маской"""
+        bits = bytearray((self.count + 7) // 8)
+        for number in numbers:
+            bits[number >> 3] |= 1 << (number & 7)
+        self._seen[user_id] = bits
+        return bits
+
+    def _pick_unseen(self, bits: bytearray) -> Optional[int]:
+        """Выбирает непоказанный факт по битовой маске"""
+        for _ in range(RANDOM_ATTEMPTS):
+            number = random.randrange(self.count)
+            if not bits[number >> 3] & (1 << (number & 7)):
+                return number
+
+        # Почти все факты показаны: ищем незаполненный блок маски, начиная со случайного
+        blocks = (len(bits) + SCAN_BLOCK - 1) // SCAN_BLOCK
+        first = random.randrange(blocks)
+        for block in range(first, first + blocks):
+            start = (block % blocks) * SCAN_BLOCK
+            chunk = bits[start:start + SCAN_BLOCK]
+            if chunk == _FULL_BLOCK[:len(chunk)]:
+                continue
+            for match in _UNSEEN_BYTE.finditer(chunk):
+                byte_number = start + match.start()
+                # Свободные биты последнего байта могут лежать за концом корпуса
+                free = [bit for bit in range(8) if not bits[byte_number] & (1 << bit)
+                        and byte_number * 8 + bit < self.count]
+                if free:
+                    return byte_number * 8 + random.choice(free)
+        return None
+
+    def random_fact(self, user_id: Hashable = None) -> Optional[str]:
+        """
+        Возвращает случайный факт, который пользователь еще не видел
+
+        Args:
+            user_id (Hashable, optional): ID пользователя; без него повторы возможны
+
+        Returns:
+            Optional[str]: Текст факта или None, если корпус пуст
+        """
+        if not self.count:
+            return None
+        if user_id is None:
+            return self.get(random.randrange(self.count))
+
+        seen = self._user_seen(user_id)
+        if isinstance(seen, set):
+            for _ in range(RANDOM_ATTEMPTS):
+                number = random.randrange(self.count)
+                if number not in seen:
+                    seen.add(number)
+                    if len(seen) * SPARSE_ENTRY_BYTES > (self.count + 7) // 8:
+                        self._to_bits(user_id, seen)
+                    return self.get(number)
+            # Случайные попытки не удались только при маленьком корпусе: дальше ищем по маске
+            seen = self._to_bits(user_id, seen)
+
+        number = self._pick_unseen(seen)
+        if number is None:
+            # Пользователь видел все факты: начинаем круг заново
+            number = random.randrange(self.count)
+            self._seen[user_id] = {number}
+            return self.get(number)
+        seen[number >> 3] |= 1 << (number & 7)
+        return self.get(number)
+
+    def _corpus_hashes(self) -> Set[bytes]:
+        """Считает хэши всех фактов корпуса (долго для большого корпуса, вызывается в потоке)"""
+        return {_fact_hash(self.get(number)) for number in range(self.count)}
+
+    def _new_facts(self, facts: Iterable[str]) -> Tuple[List[bytes], Set[bytes]]:
+        """Отбирает факты, которых еще нет в корпусе, и возвращает их тексты и хэши"""
+        encoded = []
+        digests: Set[bytes] = set()
+        for fact in facts:
+            fact = fact.strip()
+            digest = _fact_hash(fact)
+            if fact and digest not in self._hashes and digest not in digests:
+                digests.add(digest)
+                encoded.append(fact.encode("utf-8"))
+        return encoded, digests
+
+    def _append(self, encoded: List[bytes]):
+        """Дописывает тексты и смещения в файлы корпуса"""
+        with open(self.index_path, "r+b") as index:
+            # Смещение, записанное не полностью, отбрасывается
+            entries = os.fstat(index.fileno()).st_size // OFFSET.size
+            index.seek((entries - 1) * OFFSET.size)
+            offset, = OFFSET.unpack(index.read(OFFSET.size))
+            index.truncate(entries * OFFSET.size)
+            offsets = bytearray()
+            end = offset
+            for item in encoded:
+                end += len(item)
+                offsets += OFFSET.pack(end)
+            # Сначала тексты, потом смещения: индекс никогда не ссылается на недописанные данные
+            with open(self.data_path, "r+b") as data:
+                if os.fstat(data.fileno()).st_size > offset:
+                    # Тексты, дописанные до сбоя без смещений в индексе, отбрасываются
+                    data.truncate(offset)
+                data.seek(offset)
+                data.write(b"".join(encoded))
+            index.seek(entries * OFFSET.size)
+            index.write(offsets)
+
+    def add(self, facts: Iterable[str]) -> int:
+        """
+        Дописывает новые факты в конец корпуса (синхронно, для сборки вне бота)
+
+        Args:
+            facts (Iterable[str]): Тексты фактов
+
+        Returns:
+            int: Количество добавленных фактов (без дублей)
+        """
+        if self._hashes is None:
+            self._hashes = self._corpus_hashes()
+        encoded, digests = self._new_facts(facts)
+        if not encoded:
+            return 0
+        self._append(encoded)
+        # Хэши запоминаются только после записи, иначе при ошибке факты больше не добавились бы
+        self._hashes |= digests
+        self._remap()
+        return len(encoded)
+
+    async def grow(self, generator: FactGenerator, batch: int = FACT_GROW_BATCH) -> int:
+        """
+        Пополняет корпус фактами от генератора
+
+        Хэши корпуса считаются и файлы дописываются в пуле потоков, а
+        отображения файлов обновляются в event loop, где из них читают факты.
+
+        Args:
+            generator (FactGenerator): Генератор фактов
+            batch (int): Количество запрашиваемых фактов
+
+        Returns:
+            int: Количество добавленных фактов
+        """
+        try:
+            facts = await generator(batch)
+        except Exception as e:
+            logger.error(f"Ошибка при генерации фактов: {e}")
+            return 0
+        if self._hashes is None:
+            self._hashes = await asyncio.to_thread(self._corpus_hashes)
+        encoded, digests = self._new_facts(facts)
+        if encoded:
+            try:
+                await asyncio.to_thread(self._append, encoded)
+            except OSError as e:
+                logger.error(f"Ошибка при записи фактов: {e}")
+                return 0
+            self._hashes |= digests
+            self._remap()
+        logger.info(f"Корпус фактов пополнен: {len(encoded)} новых, всего {self.count}")
+        return len(encoded)
+
+    def start_growing(self, generator: FactGenerator, interval: float = FACT_GROW_INTERVAL):
+        """Запускает периодическое пополнение корпуса, если задан интервал"""
+        if interval <= 0 or self._grow_task is not None:
+            return
+
+        async def grow_forever():
+            while True:
+                await self.grow(generator)
+                await asyncio.sleep(interval)
+
+        self._grow_task = asyncio.create_task(grow_forever())
+
+    def close(self):
+        """Останавливает пополнение и освобождает отображения файлов"""
+        if self._grow_task is not None:
+            self._grow_task.cancel()
+            self._grow_task = None
+        for mapped in (self._data, self._index):
+            if mapped is not None:
+                mapped.close()
+        self._data = self._index = None
+
+
+if __name__ == "__main__":
+    # Сборка хранилища из большого списка: python osnov_servis/fact_store.py facts.txt
+    source = sys.argv[1] if len(sys.argv) > 1 else FACTS_SEED_PATH
+    with open(source, encoding="utf-8") as lines:
+        print(f"Записано фактов: {build_store(lines)}")
@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Количество идей, которое поддерживается в каждой категории
+IDEA_POOL_SIZE = int(os.getenv("IDEA_POOL_SIZE", "20"))
+# Если непросмотренных пользователем идей меньше этого числа, пул пополняется
+IDEA_POOL_LOW_WATER = int(os.getenv("IDEA_POOL_LOW_WATER", "5"))
+# Возраст, после которого идея считается устаревшей и удаляется (секунды)
+IDEA_MAX_AGE = float(os.getenv("IDEA_MAX_AGE", "86400"))
+# Количество одновременных запросов к модели при пополнении
+IDEA_REFILL_CONCURRENCY = int(os.getenv("IDEA_REFILL_CONCURRENCY", "3"))
+# Максимальное количество запоминаемых позиций пользователей
+MAX_IDEA_CURSORS = int(os.getenv("MAX_IDEA_CURSORS", "100000"))
+
+# Количество последних выдач идей, по которым считаются перцентили задержки
+LATENCY_SAMPLES = 1000
+
+IdeaGenerator = Callable[[str], Awaitable[Optional[str]]]
+IdeaStreamer = Callable[[str], AsyncIterator[str]]
+
+
+def _idea_hash(text: str) -> str:
+    return hashlib.sha1(' '.join(text.casefold().split()).encode('utf-8')).hexdigest()
+
+
+class Idea:
+    """Сгенерированная идея"""
+    __slots__ = ("seq", "text", "created")
+
+    def __init__(self, seq: int, text: str):
+        self.seq = seq
+        self.text = text
+        self.created = time.monotonic()
+
+
+class IdeaPool:
+    """
+    Пулы заранее сгенерированных бизнес-идей по категориям.
+
+    Идеи каждой категории лежат в очереди в порядке генерации и получают
+    возрастающий номер. Пользователь проходит пул по кругу: для него
+    запоминается номер последней выданной идеи, поэтому идеи не повторяются.
+    Идеи старше max_age удаляются из начала очереди, а когда пользователю
+    остается мало новых идей, фоновая задача догенерирует пул. При промахе
+    идею генерирует stream_new, и пул пополняется уже после нее, чтобы
+    нажатие не запускало две генерации одновременно.
+    """
+
+    def __init__(self, generator: IdeaGenerator, streamer: IdeaStreamer = None,
+                 size: int = IDEA_POOL_SIZE, low_water: int = IDEA_POOL_LOW_WATER,
+                 max_age: float = IDEA_MAX_AGE, concurrency: int = IDEA_REFILL_CONCURRENCY,
+                 max_cursors: int = MAX_IDEA_CURSORS):
+        """
+        Args:
+            generator (IdeaGenerator): Генерирует идею по ключу категории
+            streamer (IdeaStreamer, optional): Потоковая генерация идеи по ключу категории
+            size (int): Количество идей в каждой категории
+            low_water (int): Порог непросмотренных идей для пополнения
+            max_age (float): Время жизни идеи в секундах
+            concurrency (int): Количество одновременных запросов к модели
+            max_cursors (int): Максимальное количество запоминаемых позиций пользователей
+        """
+        self.generator = generator
+        self.streamer = streamer
+        self.size = size
+        self.low_water = low_water
+        self.max_age = max_age
+        self.concurrency = concurrency
+        self.max_cursors = max_cursors
+        self._pools: Dict[str, Deque[Idea]] = {}
+        self._hashes: Dict[str, Set[str]] = {}
+        self._cursors: "OrderedDict[Tuple[int, str], int]" = OrderedDict()
+        self._refills: Dict[str, asyncio.Task] = {}
+        self._seq = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.hits = 0
+        self.misses = 0
+
+    def _pool(self, category: str) -> Deque[Idea]:
+        pool = self._pools.get(category)
+        if pool is None:
+            pool = self._pools[category] = deque()
+            self._hashes[category] = set()
+        return pool
+
+    def _evict_stale(self, category: str):
+        pool = self._pool(category)
+        deadline = time.monotonic() - self.max_age
+        while pool and pool[0].created < deadline:
+            self._hashes[category].discard(_idea_hash(pool.popleft().text))
+
+    def _set_cursor(self, user_id: int, category: str, seq: int):
+        key = (user_id, category)
+        self._cursors[key] = max(seq, self._cursors.get(key, 0))
+        self._cursors.move_to_end(key)
+        while len(self._cursors) > self.max_cursors:
+            self._cursors.popitem(last=False)
+
+    def add(self, category: str, text: str) -> Optional[Idea]:
+        """
+        Добавляет идею в пул категории
+
+        Returns:
+            Optional[Idea]: Добавленная идея или None, если такая уже есть
+        """
+        text = text.strip()
+        pool = self._pool(category)
+        digest = _idea_hash(text)
+        if not text or digest in self._hashes[category]:
+            return None
+        self._seq += 1
+        idea = Idea(self._seq, text)
+        pool.append(idea)
+        self._hashes[category].add(digest)
+        # Пул не растет бесконечно: самые старые идеи вытесняются
+        while len(pool) > self.size * 2:
+            self._hashes[category].discard(_idea_hash(pool.popleft().text))
+        return idea
+
+    def next_idea(self, category: str, user_id: int) -> Optional[str]:
+        """
+        Выдает пользователю следующую непросмотренную идею категории
+
+        Args:
+            category (str): Ключ категории
+            user_id (int): ID пользователя
+
+        Returns:
+            Optional[str]: Текст идеи или None, если новых идей для пользователя нет
+        """
+        started = time.perf_counter()
+        self._evict_stale(category)
+        pool = self._pool(category)
+        cursor = self._cursors.get((user_id, category), 0)
+
+        # Номера идей возрастают, поэтому первая идея новее курсора ищется с конца очереди
+        unseen = 0
+        idea = None
+        for candidate in reversed(pool):
+            if candidate.seq <= cursor:
+                break
+            idea = candidate
+            unseen += 1
+
+        if idea is None:
+            # Идею сгенерирует stream_new, пополнение запустится после нее
+            self.misses += 1
+            return None
+
+        if unseen - 1 < self.low_water:
+            self.schedule_refill(category)
+        self.hits += 1
+        self._set_cursor(user_id, category, idea.seq)
+        self._latencies.append(time.perf_counter() - started)
+        return idea.text
+
+    async def stream_new(self, category: str, user_id: int) -> AsyncIterator[str]:
+        """
+        Генерирует идею для пользователя потоком и добавляет ее в пул
+
+        Args:
+            category (str): Ключ категории
+            user_id (int): ID пользователя
+
+        Yields:
+            str: Очередной фрагмент идеи
+        """
+        started = time.perf_counter()
+        parts = []
+        try:
+            async with aclosing(self.streamer(category)) as chunks:
+                async for delta in chunks:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            self.schedule_refill(category)
+
+        self._latencies.append(time.perf_counter() - started)
+        idea = self.add(category, "".join(parts))
+        if idea is not None:
+            self._set_cursor(user_id, category, idea.seq)
+
+    async def refill(self, category: str) -> int:
+        """
+        Догенерирует идеи категории до размера пула
+
+        Returns:
+            int: Количество добавленных идей
+        """
+        self._evict_stale(category)
+        missing = self.size - len(self._pool(category))
+        if missing <= 0:
+            missing = self.low_water
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def generate_one() -> bool:
+            async with semaphore:
+                try:
+                    text = await self.generator(category)
+                except Exception as e:
+                    logger.error(f"Ошибка при генерации идеи для категории {category}: {e}")
+                    return False
+            return bool(text) and self.add(category, text) is not None
+
+        added = sum(await asyncio.gather(*[generate_one() for _ in range(missing)]))
+        logger.info(f"Пул идей категории {category} пополнен: {added} новых, всего {len(self._pool(category))}")
+        return added
+
+    def schedule_refill(self, category: str):
+        """Запускает фоновое пополнение категории, если оно еще не идет"""
+        task = self._refills.get(category)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self.refill(category))
+        task.add_done_callback(lambda _: self._refills.pop(category, None))
+        self._refills[category] = task
+
+    def warm_up(self, categories: Iterable[str]):
+        """Запускает заполнение всех категорий"""
+        for category in categories:
+            self.schedule_refill(category)
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает статистику пулов, долю попаданий и перцентили задержки выдачи в секундах"""
+        latencies = sorted(self._latencies)
+
+        def percentile(share: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * share))], 3) if latencies else 0.0
+
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 3) if requests else 0.0,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+            "ideas": sum(len(pool) for pool in self._pools.values())
+        }
+
+    def close(self):
+        """Останавливает пополнение"""
+        for task in self._refills.values():
+            task.cancel()
+        self._refills.clear()
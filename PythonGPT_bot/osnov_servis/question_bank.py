@@ -0,0 +1,319 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Файл базы вопросов квиза
+QUIZ_DB_PATH = os.getenv("QUIZ_DB_PATH", "resources/quiz_bank.sqlite3")
+# Если непросмотренных пользователем вопросов темы меньше этого числа, банк пополняется
+QUIZ_LOW_WATER = int(os.getenv("QUIZ_LOW_WATER", "10"))
+# Количество вопросов, генерируемых за одно пополнение
+QUIZ_REFILL_BATCH = int(os.getenv("QUIZ_REFILL_BATCH", "10"))
+# Количество одновременных запросов к модели при пополнении
+QUIZ_REFILL_CONCURRENCY = int(os.getenv("QUIZ_REFILL_CONCURRENCY", "3"))
+
+# Версия схемы базы; при изменении старые таблицы пересоздаются
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    topic TEXT NOT NULL,
+    content_hash TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_topic ON questions (topic, id);
+CREATE TABLE IF NOT EXISTS seen (
+    user_id INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, question_id)
+) WITHOUT ROWID;
+"""
+
+ANSWER_LETTERS = "ABCD"
+
+# JSON-схема вопроса, которую модель заполняет через вызов функции
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string", "description": "Текст вопроса без вариантов ответа"},
+        "options": {
+            "type": "array",
+            "items": {"type": "string"},
+            "minItems": 4,
+            "maxItems": 4,
+            "description": "Четыре варианта ответа без букв"
+        },
+        "correct": {"type": "integer", "minimum": 0, "maximum": 3, "description": "Индекс правильного варианта"},
+        "explanation": {"type": "string", "description": "Почему правильный ответ верен, 2-3 предложения"},
+        "fun_fact": {"type": "string", "description": "Интересный факт по теме вопроса"}
+    },
+    "required": ["question", "options", "correct", "explanation", "fun_fact"]
+}
+
+# Генератор возвращает проверенный вопрос или None
+QuestionGenerator = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def validate_question(data: Any) -> Dict[str, Any]:
+    """
+    Проверяет вопрос по QUESTION_SCHEMA
+
+    Args:
+        data (Any): Разобранный JSON от модели
+
+    Returns:
+        Dict[str, Any]: Вопрос только с полями схемы, строки без лишних пробелов
+
+    Raises:
+        ValueError: Если вопрос не соответствует схеме
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Вопрос должен быть объектом")
+    missing = [key for key in QUESTION_SCHEMA["required"] if key not in data]
+    if missing:
+        raise ValueError(f"Нет полей: {', '.join(missing)}")
+
+    record = {}
+    for key in ("question", "explanation", "fun_fact"):
+        if not isinstance(data[key], str) or not data[key].strip():
+            raise ValueError(f"Поле {key} должно быть непустой строкой")
+        record[key] = data[key].strip()
+
+    options = data["options"]
+    if (not isinstance(options, list) or len(options) != len(ANSWER_LETTERS)
+            or not all(isinstance(option, str) and option.strip() for option in options)):
+        raise ValueError("Поле options должно содержать четыре непустые строки")
+    record["options"] = [option.strip() for option in options]
+    if len({option.casefold() for option in record["options"]}) != len(ANSWER_LETTERS):
+        raise ValueError("Варианты ответа повторяются")
+
+    correct = data["correct"]
+    if isinstance(correct, bool) or not isinstance(correct, int) or not 0 <= correct < len(ANSWER_LETTERS):
+        raise ValueError("Поле correct должно быть индексом от 0 до 3")
+    record["correct"] = correct
+    return record
+
+
+def content_hash(record: Dict[str, Any]) -> str:
+    """Хэш вопроса и вариантов без учета регистра и пробелов, используется для удаления дублей"""
+    text = "\n".join([record["question"], *sorted(record["options"])])
+    return hashlib.sha1(' '.join(text.casefold().split()).encode('utf-8')).hexdigest()
+
+
+def format_question(record: Dict[str, Any]) -> str:
+    """Формирует текст вопроса с вариантами ответа"""
+    options = "\n".join(f"{letter}) {option}" for letter, option in zip(ANSWER_LETTERS, record["options"]))
+    return f"{record['question']}\n\n{options}"
+
+
+class QuestionBank:
+    """
+    Банк заранее сгенерированных вопросов квиза в SQLite.
+
+    Вопрос выдается локальным запросом по индексу (topic, id) с проверкой по
+    таблице просмотренных пользователем вопросов. Одинаковые вопросы
+    отбрасываются по уникальному хэшу содержимого. Когда у пользователя
+    остается мало непросмотренных вопросов темы, фоновая задача догенерирует
+    новые; для каждой темы одновременно работает не больше одной такой задачи.
+    """
+
+    def __init__(self, path: str = QUIZ_DB_PATH, generator: QuestionGenerator = None,
+                 low_water: int = QUIZ_LOW_WATER, batch: int = QUIZ_REFILL_BATCH,
+                 concurrency: int = QUIZ_REFILL_CONCURRENCY):
+        """
+        Args:
+            path (str): Путь к файлу базы
+            generator (QuestionGenerator): Функция генерации вопроса по ключу темы
+            low_water (int): Порог непросмотренных вопросов для пополнения
+            batch (int): Количество вопросов за одно пополнение
+            concurrency (int): Количество одновременных запросов к модели
+        """
+        self.path = path
+        self.generator = generator
+        self.low_water = low_water
+        self.batch = batch
+        self.concurrency = concurrency
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._refills: Dict[str, asyncio.Task] = {}
+
+    def _migrate(self):
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            # Вопросы старого формата нельзя проверить без модели, поэтому банк собирается заново
+            self._db.executescript("DROP TABLE IF EXISTS seen; DROP TABLE IF EXISTS questions;")
+            if version:
+                logger.info(f"Схема банка вопросов обновлена с версии {version} до {SCHEMA_VERSION}")
+        self._db.executescript(SCHEMA)
+        self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def add(self, topic: str, record: Dict[str, Any]) -> Optional[int]:
+        """
+        Добавляет вопрос в банк
+
+        Args:
+            topic (str): Ключ темы
+            record (Dict[str, Any]): Проверенный вопрос
+
+        Returns:
+            Optional[int]: ID вопроса или None, если такой вопрос уже есть
+        """
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO questions (topic, content_hash, payload, created) VALUES (?, ?, ?, ?)",
+            (topic, content_hash(record), json.dumps(record, ensure_ascii=False), time.time())
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def find(self, record: Dict[str, Any]) -> Optional[int]:
+        """
+        Ищет в банке такой же вопрос
+
+        Args:
+            record (Dict[str, Any]): Проверенный вопрос
+
+        Returns:
+            Optional[int]: ID вопроса или None, если его нет
+        """
+        row = self._db.execute("SELECT id FROM questions WHERE content_hash = ?", (content_hash(record),)).fetchone()
+        return row[0] if row else None
+
+    def count(self, topic: str) -> int:
+        """Возвращает количество вопросов темы"""
+        return self._db.execute("SELECT COUNT(*) FROM questions WHERE topic = ?", (topic,)).fetchone()[0]
+
+    def unseen_count(self, topic: str, user_id: int) -> int:
+        """Возвращает количество вопросов темы, которые пользователь еще не видел"""
+        return self._db.execute(
+            "SELECT COUNT(*) FROM questions q WHERE q.topic = ? AND NOT EXISTS "
+            "(SELECT 1 FROM seen s WHERE s.user_id = ? AND s.question_id = q.id)",
+            (topic, user_id)
+        ).fetchone()[0]
+
+    def has_unseen(self, topic: str, user_id: int) -> bool:
+        """Проверяет, есть ли в теме вопрос, который пользователь еще не видел"""
+        return self._db.execute(
+            "SELECT EXISTS (SELECT 1 FROM questions q WHERE q.topic = ? AND NOT EXISTS "
+            "(SELECT 1 FROM seen s WHERE s.user_id = ? AND s.question_id = q.id))",
+            (topic, user_id)
+        ).fetchone()[0] == 1
+
+    def mark_seen(self, user_id: int, question_id: int) -> bool:
+        """
+        Отмечает вопрос как просмотренный пользователем
+
+        Returns:
+            bool: False, если пользователь уже видел этот вопрос
+        """
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO seen (user_id, question_id) VALUES (?, ?)", (user_id, question_id)
+        )
+        return cursor.rowcount == 1
+
+    def next_question(self, topic: str, user_id: int) -> Optional[Dict]:
+        """
+        Выдает пользователю непросмотренный вопрос темы из банка
+
+        Args:
+            topic (str): Ключ темы
+            user_id (int): ID пользователя
+
+        Returns:
+            Optional[Dict]: Вопрос с полем id или None, если банк пуст
+        """
+        rows = self._db.execute(
+            "SELECT q.id, q.payload FROM questions q WHERE q.topic = ? AND NOT EXISTS "
+            "(SELECT 1 FROM seen s WHERE s.user_id = ? AND s.question_id = q.id) ORDER BY q.id LIMIT ?",
+            (topic, user_id, self.low_water + 1)
+        ).fetchall()
+        # Выбираем первый вопрос, а по количеству остальных решаем, пора ли пополнять банк
+        if len(rows) <= self.low_water:
+            self.schedule_refill(topic)
+        if not rows:
+            return None
+
+        question_id, payload = rows[0]
+        self.mark_seen(user_id, question_id)
+        return {"id": question_id, **json.loads(payload)}
+
+    async def take(self, topic: str, user_id: int) -> Optional[Dict]:
+        """
+        Выдает вопрос из банка, а если банк пуст — генерирует его сразу
+
+        Args:
+            topic (str): Ключ темы
+            user_id (int): ID пользователя
+
+        Returns:
+            Optional[Dict]: Вопрос с полем id или None при ошибке генерации
+        """
+        record = self.next_question(topic, user_id)
+        if record is not None:
+            return record
+
+        generated = await self.generator(topic)
+        if not generated:
+            return None
+        question_id = self.add(topic, generated)
+        if question_id is not None:
+            self.mark_seen(user_id, question_id)
+        return {"id": question_id, **generated}
+
+    async def refill(self, topic: str, count: int = None) -> int:
+        """
+        Генерирует новые вопросы темы
+
+        Args:
+            topic (str): Ключ темы
+            count (int, optional): Количество вопросов, по умолчанию batch
+
+        Returns:
+            int: Количество добавленных вопросов (без дублей)
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def generate_one() -> bool:
+            async with semaphore:
+                try:
+                    generated = await self.generator(topic)
+                except Exception as e:
+                    logger.error(f"Ошибка при генерации вопроса для темы {topic}: {e}")
+                    return False
+            return bool(generated) and self.add(topic, generated) is not None
+
+        results = await asyncio.gather(*[generate_one() for _ in range(count or self.batch)])
+        added = sum(results)
+        logger.info(f"Банк вопросов темы {topic} пополнен: {added} новых, всего {self.count(topic)}")
+        return added
+
+    def schedule_refill(self, topic: str):
+        """Запускает фоновое пополнение темы, если оно еще не идет"""
+        if self.generator is None:
+            return
+        task = self._refills.get(topic)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self.refill(topic))
+        task.add_done_callback(lambda _: self._refills.pop(topic, None))
+        self._refills[topic] = task
+
+    def warm_up(self, topics: Iterable[str]):
+        """Запускает пополнение тем, в которых меньше low_water вопросов"""
+        for topic in topics:
+            if self.count(topic) < self.low_water:
+                self.schedule_refill(topic)
+
+    def close(self):
+        """Останавливает пополнение и закрывает базу"""
+        for task in self._refills.values():
+            task.cancel()
+        self._refills.clear()
+        self._db.close()
@@ -1,20 +1,123 @@
+import html
+import json
 import logging
 import os
-import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from gpt_service.gpt import get_personality_response
+from gpt_service.gpt import TEXT_MODEL
+from gpt_service.engine import get_engine
+from osnov_servis.shared import sessions
+from osnov_servis.session import Mode
 from data.quiz_topics import get_quiz_topics_keyboard, get_quiz_topic_data, get_quiz_continue_keyboard
+from osnov_servis.quiz_prefetch import QuizPrefetcher
+from osnov_servis.question_bank import (
+    QuestionBank, QUESTION_SCHEMA, ANSWER_LETTERS, validate_question, format_question
+)
 
 logger = logging.getLogger(__name__)
 
 # Состояния разговора
 SELECTING_TOPIC, ANSWERING_QUESTION = range(2)
 
+# Инструкция для генерации вопроса в структурированном виде
+QUESTION_FORMAT_PROMPT = (
+    "Вопрос должен иметь четыре варианта ответа, ровно один из которых правильный. "
+    "Не указывай правильный ответ в тексте вопроса. "
+    "Верни результат только через функцию save_quiz_question."
+)
+QUESTION_FUNCTION = {
+    "type": "function",
+    "function": {
+        "name": "save_quiz_question",
+        "description": "Сохраняет вопрос квиза",
+        "parameters": QUESTION_SCHEMA
+    }
+}
+
 # Константы для обработки ошибок
 ERROR_MESSAGE = "😔 Произошла ошибка. Попробуйте позже или используйте /quiz для перезапуска."
 
 
+async def generate_quiz_question(topic_key: str):
+    """
+    Генерирует вопрос квиза по теме без использования истории чата
+
+    Args:
+        topic_key (str): Ключ темы
+
+    Returns:
+        Optional[Dict[str, Any]]: Вопрос, прошедший проверку по схеме, или None
+    """
+    topic_data = get_quiz_topic_data(topic_key)
+    response = await get_engine().create(
+        [
+            {"role": "system", "content": f"{topic_data['prompt']} {QUESTION_FORMAT_PROMPT}"},
+            {"role": "user", "content": "Создай вопрос для квиза"}
+        ],
+        model=TEXT_MODEL,
+        temperature=1.0,
+        max_tokens=700,
+        tools=[QUESTION_FUNCTION],
+        tool_choice={"type": "function", "function": {"name": "save_quiz_question"}}
+    )
+    tool_calls = response.choices[0].message.tool_calls
+    if not tool_calls:
+        logger.warning(f"Модель не вернула вопрос для темы {topic_key}")
+        return None
+    try:
+        return validate_question(json.loads(tool_calls[0].function.arguments))
+    except ValueError as e:
+        # json.JSONDecodeError тоже наследуется от ValueError
+        logger.warning(f"Вопрос для темы {topic_key} отклонен: {e}")
+        return None
+
+
+question_bank = QuestionBank(generator=generate_quiz_question)
+prefetcher = QuizPrefetcher(question_bank)
+
+
+async def get_question(query, topic_key: str, topic_data: dict) -> dict:
+    """
+    Выдает пользователю предзагруженный вопрос или вопрос из банка; сообщение о генерации
+    показывается, только если готового вопроса нет. Сразу после этого начинается
+    предзагрузка следующего вопроса.
+
+    Args:
+        query (CallbackQuery): Нажатие кнопки, сообщение которого будет обновлено
+        topic_key (str): Ключ темы
+        topic_data (dict): Данные темы
+
+    Returns:
+        dict: Вопрос из банка
+    """
+    chat_id = query.message.chat_id
+    user_id = query.from_user.id
+
+    record = await prefetcher.claim(chat_id, topic_key)
+    if record is not None:
+        # Такой вопрос уже мог быть в банке: тогда используется его строка
+        question_id = question_bank.add(topic_key, record) or question_bank.find(record)
+        if question_id is not None and question_bank.mark_seen(user_id, question_id):
+            record = {"id": question_id, **record}
+        else:
+            # Пользователь уже видел этот вопрос, берем другой
+            record = None
+    if record is None:
+        record = question_bank.next_question(topic_key, user_id)
+    if record is None:
+        processing_text = f"{topic_data['emoji']} Генерирую вопрос по теме {topic_data['name']}... ⏳"
+        if query.message.photo:
+            await query.edit_message_caption(processing_text, parse_mode='HTML')
+        else:
+            await query.edit_message_text(processing_text, parse_mode='HTML')
+        record = await question_bank.take(topic_key, user_id)
+
+    if not record:
+        raise Exception("Не удалось получить вопрос от GPT")
+    prefetcher.schedule(chat_id, user_id, topic_key)
+    return record
+
+
 async def quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка команды /quiz"""
     try:
@@ -45,6 +148,9 @@ async def quiz_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         keyboard = get_quiz_topics_keyboard()
 
+        sessions.enter(update.effective_chat.id, Mode.QUIZ)
+        prefetcher.cancel(update.effective_chat.id)
+
         # Инициализируем счетчики
         context.user_data['quiz_score'] = 0
         context.user_data['quiz_total'] = 0
@@ -115,19 +221,11 @@ async def topic_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         context.user_data['current_quiz_topic'] = topic_key
         context.user_data['quiz_topic_data'] = topic_data
-        processing_text = f"{topic_data['emoji']} Генерирую вопрос по теме {topic_data['name']}... ⏳"
-        if query.message.photo:
-            await query.edit_message_caption(processing_text, parse_mode='HTML')
-        else:
-            await query.edit_message_text(processing_text, parse_mode='HTML')
-
-        question = await get_personality_response("Создай вопрос для квиза", topic_data['prompt'])
-        if not question:
-            raise Exception("Не удалось получить вопрос от GPT")
-
-        context.user_data['current_question'] = question
-        correct_answer = extract_correct_answer(question)
-        context.user_data['correct_answer'] = correct_answer
+        session = sessions.enter(update.effective_chat.id, Mode.QUIZ)
+        session.topic = topic_key
+        record = await get_question(query, topic_key, topic_data)
+        question = html.escape(format_question(record))
+        context.user_data['current_question'] = record
 
         message_text = (
             f"{topic_data['emoji']} <b>Квиз: {topic_data['name']}</b>\n\n"
@@ -173,17 +271,17 @@ async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
             return ANSWERING_QUESTION
 
-        correct_answer = context.user_data.get('correct_answer', '').upper()
+        record = context.user_data.get('current_question')
         topic_data = context.user_data.get('quiz_topic_data')
-        current_question = context.user_data.get('current_question', '')
 
-        if not topic_data or not correct_answer:
+        if not topic_data or not record:
             await update.message.reply_text(
                 "❌ Произошла ошибка: данные квиза не найдены. Используйте /quiz для начала."
             )
             return ConversationHandler.END
 
-        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
+        # Ответ проверяется локально: правильный вариант и объяснение пришли вместе с вопросом
+        correct_answer = ANSWER_LETTERS[record['correct']]
         is_correct = user_answer == correct_answer
 
         # Обновляем счетчик
@@ -191,33 +289,24 @@ async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if is_correct:
             context.user_data['quiz_score'] += 1
 
-        # Отправляем сообщение о том, что проверяем ответ
-        processing_msg = await update.message.reply_text(
-            f"{topic_data['emoji']} Проверяю ответ... ⏳"
+        explanation = (
+            f"{html.escape(record['explanation'])}\n\n"
+            f"💡 <i>{html.escape(record['fun_fact'])}</i>"
         )
 
-        # Получаем детальный анализ ответа от ChatGPT
-        analysis_prompt = f"""Пользователь ответил '{user_answer}' на вопрос:
-        {current_question}
-
-        Правильный ответ: {correct_answer}
-
-        Дай краткое объяснение (2-3 предложения), почему ответ правильный или неправильный, и интересный факт по теме."""
-
-        detailed_response = await get_personality_response(analysis_prompt,
-                                                           "Ты эксперт по квизам, объясняешь ответы понятно и интересно.")
-
         # Формируем результат
         if is_correct:
-            result_text = f"✅ <b>Правильно!</b>\n\n{detailed_response}"
+            result_text = f"✅ <b>Правильно!</b>\n\n{explanation}"
         else:
-            result_text = f"❌ <b>Неправильно!</b>\n\nПравильный ответ: <b>{correct_answer}</b>\n\n{detailed_response}"
+            correct_option = html.escape(record['options'][record['correct']])
+            result_text = (
+                f"❌ <b>Неправильно!</b>\n\n"
+                f"Правильный ответ: <b>{correct_answer}) {correct_option}</b>\n\n{explanation}"
+            )
 
         # Кнопки для продолжения
         keyboard = get_quiz_continue_keyboard(context.user_data['current_quiz_topic'])
 
-        # Удаляем сообщение об обработке и отправляем результат
-        await processing_msg.delete()
         await update.message.reply_text(
             f"{topic_data['emoji']} <b>Результат квиза</b>\n\n"
             f"{result_text}\n\n"
@@ -247,23 +336,14 @@ async def handle_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             topic_key = query.data.replace("quiz_continue_", "")
             context.user_data['current_quiz_topic'] = topic_key
             context.user_data['quiz_topic_data'] = get_quiz_topic_data(topic_key)
+            session = sessions.enter(update.effective_chat.id, Mode.QUIZ)
+            session.topic = topic_key
 
             # Генерируем новый вопрос
             topic_data = context.user_data['quiz_topic_data']
-            processing_text = f"{topic_data['emoji']} Генерирую вопрос по теме {topic_data['name']}... ⏳"
-
-            if query.message.photo:
-                await query.edit_message_caption(processing_text, parse_mode='HTML')
-            else:
-                await query.edit_message_text(processing_text, parse_mode='HTML')
-
-            question = await get_personality_response("Создай вопрос для квиза", topic_data['prompt'])
-            if not question:
-                raise Exception("Не удалось получить вопрос от GPT")
-
-            context.user_data['current_question'] = question
-            correct_answer = extract_correct_answer(question)
-            context.user_data['correct_answer'] = correct_answer
+            record = await get_question(query, topic_key, topic_data)
+            question = html.escape(format_question(record))
+            context.user_data['current_question'] = record
 
             message_text = (
                 f"{topic_data['emoji']} <b>Квиз: {topic_data['name']}</b>\n\n"
@@ -323,6 +403,8 @@ async def handle_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 
             # Очищаем данные квиза
             context.user_data.clear()
+            sessions.enter(update.effective_chat.id, Mode.MAIN)
+            prefetcher.cancel(update.effective_chat.id)
 
             # Создаем кнопки главного меню
             keyboard = [
@@ -347,23 +429,3 @@ async def handle_quiz_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         return ConversationHandler.END
 
     return ANSWERING_QUESTION
-
-
-def extract_correct_answer(question_text):
-    """Извлекает правильный ответ из текста вопроса"""
-    try:
-        lines = question_text.split('\n')
-        for line in lines:
-            if 'правильный ответ' in line.lower():
-                match = re.search(r'[ABCD]', line.upper())
-                if match:
-                    return match.group()
-
-        match = re.search(r'ответ:\s*([ABCD])', question_text.upper())
-        if match:
-            return match.group(1)
-
-        return 'A'  # Fallback
-    except Exception as e:
-        logger.error(f"Ошибка при извлечении правильного ответа: {e}")
-        return 'A'
\ No newline at end of file
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Hashable, Optional
+
+from gpt_service.context_window import count_text_tokens
+from osnov_servis.question_bank import QuestionBank
+
+logger = logging.getLogger(__name__)
+
+# Время жизни заранее сгенерированного вопроса (секунды)
+QUIZ_PREFETCH_TTL = float(os.getenv("QUIZ_PREFETCH_TTL", "600"))
+
+
+class PrefetchSlot:
+    """Заранее генерируемый вопрос одного чата"""
+    __slots__ = ("topic", "task", "created", "timer")
+
+    def __init__(self, topic: str, task: asyncio.Task, timer: asyncio.TimerHandle):
+        self.topic = topic
+        self.task = task
+        self.created = time.monotonic()
+        self.timer = timer
+
+
+class QuizPrefetcher:
+    """
+    Спекулятивная генерация следующего вопроса квиза.
+
+    Пока пользователь отвечает, для его чата и темы генерируется следующий
+    вопрос, если банку нечего выдать пользователю мгновенно. Результат хранится
+    в слоте чата ограниченное время; при смене темы или завершении квиза
+    готовый вопрос переходит в банк, а незавершенная генерация отменяется.
+    Считается доля использованных предзагрузок, количество отмененных или
+    неудачных предзагрузок и токены вопросов, которые не удалось сохранить.
+    """
+
+    def __init__(self, bank: QuestionBank, ttl: float = QUIZ_PREFETCH_TTL):
+        """
+        Args:
+            bank (QuestionBank): Банк вопросов, генератор которого используется
+            ttl (float): Время жизни предзагруженного вопроса в секундах
+        """
+        self.bank = bank
+        self.ttl = ttl
+        self._slots: Dict[Hashable, PrefetchSlot] = {}
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.banked = 0
+        self.wasted = 0
+        self.wasted_tokens = 0
+
+    def schedule(self, chat_id: Hashable, user_id: int, topic: str):
+        """
+        Начинает генерацию следующего вопроса для чата
+
+        Args:
+            chat_id (Hashable): ID чата
+            user_id (int): ID пользователя
+            topic (str): Ключ темы
+        """
+        slot = self._slots.get(chat_id)
+        if slot is not None:
+            if slot.topic == topic:
+                return
+            self.cancel(chat_id)
+
+        # Из банка вопрос выдается мгновенно, генерировать заранее незачем
+        if self.bank.generator is None or self.bank.has_unseen(topic, user_id):
+            return
+
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self.bank.generator(topic))
+        timer = loop.call_later(self.ttl, self._expire, chat_id, task)
+        self._slots[chat_id] = PrefetchSlot(topic, task, timer)
+        self.started += 1
+
+    async def claim(self, chat_id: Hashable, topic: str) -> Optional[Dict[str, Any]]:
+        """
+        Забирает предзагруженный вопрос чата
+
+        Args:
+            chat_id (Hashable): ID чата
+            topic (str): Ключ темы
+
+        Returns:
+            Optional[Dict[str, Any]]: Вопрос или None, если предзагрузки нет
+        """
+        slot = self._slots.get(chat_id)
+        if slot is None:
+            return None
+        if slot.topic != topic:
+            self.cancel(chat_id)
+            return None
+
+        del self._slots[chat_id]
+        slot.timer.cancel()
+        try:
+            # Если генерация еще идет, ждать ее все равно быстрее, чем начинать заново
+            record = await slot.task
+        except Exception as e:
+            logger.error(f"Ошибка при предзагрузке вопроса для темы {topic}: {e}")
+            record = None
+
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return record
+
+    def cancel(self, chat_id: Hashable):
+        """Отбрасывает предзагрузку чата (смена темы, завершение квиза)"""
+        slot = self._slots.pop(chat_id, None)
+        if slot is not None:
+            slot.timer.cancel()
+            self._discard(slot)
+
+    def _expire(self, chat_id: Hashable, task: asyncio.Task):
+        slot = self._slots.get(chat_id)
+        if slot is not None and slot.task is task:
+            del self._slots[chat_id]
+            self._discard(slot)
+
+    def _discard(self, slot: PrefetchSlot):
+        task = slot.task
+        if not task.done():
+            # Уже потраченные токены неизвестны, поэтому не учитываются
+            task.cancel()
+            self.wasted += 1
+            return
+        if task.cancelled() or task.exception() is not None or not task.result():
+            self.wasted += 1
+            return
+
+        record = task.result()
+        # Готовый вопрос не выбрасывается: его получит следующий пользователь темы
+        if self.bank.add(slot.topic, record) is not None:
+            self.banked += 1
+            return
+        # Такой вопрос уже есть в банке, токены на него потрачены зря
+        self.wasted += 1
+        self.wasted_tokens += count_text_tokens(json.dumps(record, ensure_ascii=False))
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает статистику предзагрузки"""
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "banked": self.banked,
+            "wasted": self.wasted,
+            "wasted_tokens": self.wasted_tokens,
+            "hit_rate": round(self.hits / self.started, 3) if self.started else 0.0,
+            "pending": len(self._slots)
+        }
+
+    def close(self):
+        """Отменяет все предзагрузки"""
+        for chat_id in list(self._slots):
+            self.cancel(chat_id)
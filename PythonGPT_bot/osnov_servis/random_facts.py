@@ -1,16 +1,53 @@
-import random
-
-def get_random_fact():
-    facts = [
-        "Пчелы могут распознавать человеческие лица.",
-        "Крокодилы не могут высовывать язык.",
-        "Сердце креветки находится в голове.",
-        "Стрекозы могут летать в любом направлении, включая назад.",
-        "У осьминога три сердца.",
-        "Муравьи никогда не спят и не имеют легких.",
-        "Бабочки пробуют пищу ногами.",
-        "У улитки может быть до 25,000 зубов.",
-        "Колибри - единственные птицы, которые могут летать задом наперед.",
-        "У жирафа такой же размер шейных позвонков, как у человека."
-    ]
-    return random.choice(facts) 
\ No newline at end of file
+import logging
+import re
+from typing import List
+
+from gpt_service.gpt import TEXT_MODEL
+from gpt_service.engine import get_engine
+from osnov_servis.fact_store import FactStore
+
+logger = logging.getLogger(__name__)
+
+FACTS_PROMPT = (
+    "Ты составляешь сборник удивительных, но достоверных фактов о природе, науке и истории. "
+    "Каждый факт — одно короткое предложение на русском языке."
+)
+
+# Маркеры списка, которые модель ставит в начале строк
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+fact_store = FactStore()
+
+
+async def generate_facts(count: int) -> List[str]:
+    """
+    Запрашивает у модели новые факты для корпуса
+
+    Args:
+        count (int): Количество фактов
+
+    Returns:
+        List[str]: Факты по одному на строку
+    """
+    text = await get_engine().complete(
+        [
+            {"role": "system", "content": FACTS_PROMPT},
+            {"role": "user", "content": f"Напиши {count} разных фактов, каждый с новой строки, без нумерации."}
+        ],
+        model=TEXT_MODEL,
+        temperature=1.0
+    )
+    return [_LIST_MARKER.sub("", line) for line in (text or "").splitlines() if line.strip()]
+
+
+def get_random_fact(user_id: int = None) -> str:
+    """
+    Возвращает случайный факт, который пользователь еще не видел
+
+    Args:
+        user_id (int, optional): ID пользователя
+
+    Returns:
+        str: Текст факта
+    """
+    return fact_store.random_fact(user_id) or "Факты закончились, но скоро появятся новые."
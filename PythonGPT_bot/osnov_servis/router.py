@@ -0,0 +1,114 @@
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Message, Update
+from telegram.ext import ContextTypes, filters
+
+from osnov_servis.session import Mode, SessionStore
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[object]]
+
+# Виды сообщений, которые маршрутизируются по режиму чата
+MESSAGE_KINDS = ("text", "voice", "photo")
+
+
+def message_kind(message: Message) -> Optional[str]:
+    """
+    Определяет вид сообщения
+
+    Args:
+        message (Message): Входящее сообщение
+
+    Returns:
+        Optional[str]: text, voice, photo или None
+    """
+    if message.photo:
+        return "photo"
+    if message.voice:
+        return "voice"
+    if message.text:
+        return "text"
+    return None
+
+
+class ModeRouter:
+    """
+    Маршрутизатор сообщений по режиму чата.
+
+    Вместо нескольких обработчиков текста, каждый из которых проверяет режим,
+    используется один обработчик: обработчик режима выбирается из словаря
+    по паре (режим, вид сообщения), поэтому стоимость маршрутизации не
+    зависит от количества режимов.
+
+    Значение, которое возвращает обработчик, не используется, поэтому сюда
+    не регистрируются обработчики, меняющие состояние ConversationHandler:
+    они остаются в состояниях разговора с фильтром ModeFilter.
+    """
+
+    def __init__(self, sessions: SessionStore):
+        """
+        Args:
+            sessions (SessionStore): Хранилище сессий чатов
+        """
+        self.sessions = sessions
+        self._routes: Dict[Tuple[Mode, str], Handler] = {}
+        self._default: Optional[Handler] = None
+
+    def register(self, mode: Mode, text: Handler = None, voice: Handler = None, photo: Handler = None):
+        """
+        Регистрирует обработчики режима
+
+        Args:
+            mode (Mode): Режим чата
+            text (Handler, optional): Обработчик текстовых сообщений
+            voice (Handler, optional): Обработчик голосовых сообщений
+            photo (Handler, optional): Обработчик фотографий
+        """
+        for kind, handler in zip(MESSAGE_KINDS, (text, voice, photo)):
+            if handler is not None:
+                self._routes[(mode, kind)] = handler
+
+    def set_default(self, handler: Handler):
+        """Задает обработчик сообщений, для которых у режима нет обработчика"""
+        self._default = handler
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Передает сообщение обработчику активного режима чата"""
+        kind = message_kind(update.message)
+        if kind is None:
+            return
+        mode = self.sessions.get(update.effective_chat.id).mode
+        handler = self._routes.get((mode, kind), self._default)
+        if handler is None:
+            logger.debug(f"Нет обработчика для {kind} в режиме {mode.value}")
+            return
+        await handler(update, context)
+
+
+class ModeFilter(filters.UpdateFilter):
+    """
+    Фильтр обновлений чатов, находящихся в указанном режиме.
+
+    Нужен обработчикам внутри ConversationHandler: состояние разговора может
+    остаться от режима, из которого пользователь уже вышел, и тогда сообщение
+    должно перейти к маршрутизатору, а не к обработчику старого режима.
+    """
+
+    def __init__(self, sessions: SessionStore, mode: Mode):
+        """
+        Args:
+            sessions (SessionStore): Хранилище сессий чатов
+            mode (Mode): Режим, в котором обновление проходит фильтр
+        """
+        super().__init__(name=f"ModeFilter({mode.value})")
+        self.sessions = sessions
+        self.mode = mode
+
+    def filter(self, update: Update) -> bool:
+        if update.effective_chat is None:
+            return False
+        # snapshot не создает сессию для чата, который еще не выбирал режим
+        session = self.sessions.snapshot(update.effective_chat.id)
+        return session is not None and session[0] == self.mode.value
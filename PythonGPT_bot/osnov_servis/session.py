@@ -0,0 +1,114 @@
+import os
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Hashable, Optional, Tuple
+
+# Время простоя, после которого чат возвращается в главное меню (секунды)
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+# Максимальное количество сессий в памяти
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "100000"))
+
+
+class Mode(Enum):
+    """Режим работы бота в чате"""
+    MAIN = "main"
+    GPT = "gpt"
+    TALK = "talk"
+    QUIZ = "quiz"
+    BUSINESS = "business"
+
+
+class ChatSession:
+    """Состояние одного чата"""
+    __slots__ = ("mode", "persona", "topic", "last_access")
+
+    def __init__(self):
+        self.mode = Mode.MAIN
+        # Персонаж в режиме диалога со звездами
+        self.persona: Optional[str] = None
+        # Тема в режимах GPT, квиза и генератора идей
+        self.topic: Optional[str] = None
+        self.last_access = time.monotonic()
+
+    def enter(self, mode: Mode):
+        """Переключает чат в режим, сбрасывая персонажа и тему"""
+        self.mode = mode
+        self.persona = None
+        self.topic = None
+
+
+class SessionStore:
+    """
+    Хранилище сессий по chat_id.
+
+    Устроено так же, как хранилище диалогов: OrderedDict в порядке последнего
+    обращения, поэтому поиск — O(1), а устаревшие сессии удаляются с начала.
+    Отсутствующая сессия равносильна главному меню.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        """
+        Args:
+            ttl (float): Время простоя до удаления сессии в секундах
+            max_sessions (int): Максимальное количество сессий в памяти
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Hashable, ChatSession]" = OrderedDict()
+
+    def get(self, chat_id: Hashable) -> ChatSession:
+        """Возвращает сессию чата, создавая ее при необходимости"""
+        now = time.monotonic()
+        self._evict(now)
+
+        session = self._sessions.get(chat_id)
+        if session is None:
+            session = ChatSession()
+            self._sessions[chat_id] = session
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(chat_id)
+
+        session.last_access = now
+        return session
+
+    def enter(self, chat_id: Hashable, mode: Mode) -> ChatSession:
+        """Переключает чат в указанный режим"""
+        session = self.get(chat_id)
+        session.enter(mode)
+        return session
+
+    def snapshot(self, chat_id: Hashable) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """Возвращает режим, персонажа и тему чата для сохранения или None, если сессии нет"""
+        session = self._sessions.get(chat_id)
+        if session is None:
+            return None
+        return session.mode.value, session.persona, session.topic
+
+    def restore(self, chat_id: Hashable, snapshot: Tuple[str, Optional[str], Optional[str]]):
+        """Восстанавливает сессию чата из сохраненного снимка"""
+        mode, persona, topic = snapshot
+        session = self.get(chat_id)
+        session.mode = Mode(mode)
+        session.persona = persona
+        session.topic = topic
+
+    def discard(self, chat_id: Hashable):
+        """Удаляет сессию чата"""
+        self._sessions.pop(chat_id, None)
+
+    def _evict(self, now: float):
+        """Удаляет сессии, простаивающие дольше ttl"""
+        while self._sessions:
+            chat_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+    def __contains__(self, chat_id: Hashable) -> bool:
+        return chat_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
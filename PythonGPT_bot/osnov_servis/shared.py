@@ -1,8 +1,8 @@
 import os
 
-from util import Dialog
 from gpt_service.gpt_class import ChatGptService
+from osnov_servis.session import SessionStore
 
 
-dialog = Dialog()
+sessions = SessionStore()
 chatgpt = ChatGptService(os.getenv("CHATGPT_TOKEN"))
\ No newline at end of file
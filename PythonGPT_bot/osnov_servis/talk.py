@@ -1,8 +1,15 @@
-from util import Dialog, send_photo, send_text, send_text_buttons, load_message, load_prompt, send_html
-from osnov_servis.shared import dialog, chatgpt
+from util import send_photo, send_text, send_text_buttons, load_message, load_prompt, send_html
+from chat_lanes import chat_lanes
+from osnov_servis.shared import sessions, chatgpt
+from osnov_servis.session import Mode
+from gpt_service.streaming import StreamingMessage
+from registry import resource_registry
 import json
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 
 def load_character_prompt(character_id: str) -> str:
     """
@@ -11,17 +18,15 @@ def load_character_prompt(character_id: str) -> str:
     :return: Промпт для персонажа
     """
     character_name = character_id.replace('talk_', '')
-    prompt_path = os.path.join('prompts', 'characters', f'{character_name}.txt')
 
     try:
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            return f.read().strip()
+        return resource_registry.get("characters", character_name).strip()
     except FileNotFoundError:
         return f"Ты - {character_name}. Общайся от первого лица, используя характерные фразы и манеру речи."
 
 
 async def talk(update, context):
-    dialog.mode = "talk"
+    sessions.enter(update.effective_chat.id, Mode.TALK)
     text = load_message("talk")
     await send_photo(update, context, "talk")
     await send_text_buttons(update, context, text, {
@@ -34,7 +39,11 @@ async def talk(update, context):
 
 
 async def talk_dialog(update, context):
-    text = update.message.text
+    text = chat_lanes.text_of(update)
     my_message = await send_text(update, context, "пишет...")
-    answer = await chatgpt.add_message(text)
-    await my_message.edit_text(answer)
\ No newline at end of file
+    streamer = StreamingMessage(my_message, parse_mode=None)
+    try:
+        await streamer.consume(chatgpt.stream_message(update.effective_chat.id, text))
+    except Exception as e:
+        logger.error(f"Ошибка в диалоге с персонажем: {e}")
+        await my_message.edit_text("Извините, произошла ошибка при генерации ответа. Попробуйте еще раз.")
\ No newline at end of file
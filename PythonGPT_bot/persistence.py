@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from osnov_servis.session import SessionStore
+
+logger = logging.getLogger(__name__)
+
+# Файл базы с состояниями разговоров и user_data/chat_data
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "resources/state.sqlite3")
+# Интервал, с которым PTB передает измененные данные и они записываются в базу (секунды)
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_data (
+    chat_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL,
+    session BLOB
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+) WITHOUT ROWID;
+"""
+
+
+# Состояния одного ConversationHandler по ключу разговора
+ConversationDict = Dict[Tuple[int, ...], object]
+
+
+def _dump(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Хранение user_data, chat_data и состояний ConversationHandler в SQLite.
+
+    PTB раз в update_interval передает измененные данные; они сразу
+    сериализуются (pickle), чтобы зафиксировать снимок, и накапливаются в
+    буфере. Буфер записывается одной транзакцией в отдельном потоке, так что
+    запросы к базе не блокируют event loop. Вместе с chat_data сохраняется
+    сессия чата (режим, персонаж, тема), иначе после перезапуска сообщения
+    направлялись бы не тому обработчику. При запуске все таблицы читаются
+    одним проходом.
+    """
+
+    def __init__(self, path: str = PERSISTENCE_PATH, update_interval: float = PERSISTENCE_FLUSH_INTERVAL,
+                 sessions: SessionStore = None):
+        """
+        Args:
+            path (str): Путь к файлу базы
+            update_interval (float): Интервал передачи изменений от PTB в секундах
+            sessions (SessionStore, optional): Хранилище сессий, которое сохраняется вместе с chat_data
+        """
+        super().__init__(store_data=PersistenceInput(bot_data=False, callback_data=False),
+                         update_interval=update_interval)
+        self.path = path
+        self.sessions = sessions
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._loaded: Optional[Tuple[dict, dict, dict]] = None
+        # Изменения, ожидающие записи; None означает удаление
+        self._users: Dict[int, Optional[bytes]] = {}
+        self._chats: Dict[int, Optional[Tuple[bytes, Optional[bytes]]]] = {}
+        self._conversations: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.rows_written = 0
+        self.flush_seconds = 0.0
+
+    def _read_all(self) -> Tuple[dict, dict, dict]:
+        users = {user_id: pickle.loads(data) for user_id, data in self._db.execute("SELECT user_id, data FROM user_data")}
+        chats = {}
+        for chat_id, data, session in self._db.execute("SELECT chat_id, data, session FROM chat_data"):
+            chats[chat_id] = (pickle.loads(data), pickle.loads(session) if session else None)
+        conversations: Dict[str, ConversationDict] = {}
+        for name, key, state in self._db.execute("SELECT name, key, state FROM conversations"):
+            conversations.setdefault(name, {})[tuple(json.loads(key))] = pickle.loads(state)
+        return users, chats, conversations
+
+    async def _load(self) -> Tuple[dict, dict, dict]:
+        if self._loaded is None:
+            started = time.perf_counter()
+            self._loaded = await asyncio.to_thread(self._read_all)
+            users, chats, conversations = self._loaded
+            logger.info(f"Загружено состояние: {len(users)} пользователей, {len(chats)} чатов, "
+                        f"{sum(len(states) for states in conversations.values())} разговоров "
+                        f"за {time.perf_counter() - started:.3f} с")
+        return self._loaded
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        users, _, _ = await self._load()
+        return users
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        _, chats, _ = await self._load()
+        if self.sessions is not None:
+            for chat_id, (_, session) in chats.items():
+                if session is not None:
+                    self.sessions.restore(chat_id, session)
+        return {chat_id: data for chat_id, (data, _) in chats.items()}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        _, _, conversations = await self._load()
+        return conversations.get(name, {})
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]):
+        self._conversations[(name, json.dumps(key))] = None if new_state is None else _dump(new_state)
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]):
+        self._users[user_id] = _dump(data)
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]):
+        session = self.sessions.snapshot(chat_id) if self.sessions is not None else None
+        self._chats[chat_id] = (_dump(data), None if session is None else _dump(session))
+        self._schedule_flush()
+
+    async def update_bot_data(self, data: Dict[Any, Any]):
+        pass
+
+    async def update_callback_data(self, data: Any):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._users[user_id] = None
+        self._schedule_flush()
+
+    async def drop_chat_data(self, chat_id: int):
+        self._chats[chat_id] = None
+        self._schedule_flush()
+
+    # Данные в памяти приложения всегда актуальнее базы, поэтому обновлять их из базы не нужно
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]):
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]):
+        pass
+
+    def _schedule_flush(self):
+        # PTB передает все изменения за интервал подряд, поэтому они попадают в одну запись
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    def _write(self, users: dict, chats: dict, conversations: dict):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                [(user_id, data) for user_id, data in users.items() if data is not None]
+            )
+            self._db.executemany(
+                "DELETE FROM user_data WHERE user_id = ?",
+                [(user_id,) for user_id, data in users.items() if data is None]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chat_data (chat_id, data, session) VALUES (?, ?, ?)",
+                [(chat_id, *row) for chat_id, row in chats.items() if row is not None]
+            )
+            self._db.executemany(
+                "DELETE FROM chat_data WHERE chat_id = ?",
+                [(chat_id,) for chat_id, row in chats.items() if row is None]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                [(*name_key, state) for name_key, state in conversations.items() if state is not None]
+            )
+            self._db.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [name_key for name_key, state in conversations.items() if state is None]
+            )
+
+    async def _flush(self) -> int:
+        """
+        Записывает накопленные изменения одной транзакцией
+
+        Returns:
+            int: Количество записанных строк
+        """
+        async with self._flush_lock:
+            users, self._users = self._users, {}
+            chats, self._chats = self._chats, {}
+            conversations, self._conversations = self._conversations, {}
+            rows = len(users) + len(chats) + len(conversations)
+            if not rows:
+                return 0
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, users, chats, conversations)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояния: {e}")
+                # Возвращаем изменения в буфер, не затирая более новые
+                for pending, failed in ((self._users, users), (self._chats, chats),
+                                        (self._conversations, conversations)):
+                    for key, value in failed.items():
+                        pending.setdefault(key, value)
+                return 0
+            self.flush_seconds += time.perf_counter() - started
+            self.flushes += 1
+            self.rows_written += rows
+            return rows
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает статистику записи"""
+        return {
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_per_second": round(self.rows_written / self.flush_seconds) if self.flush_seconds else 0
+        }
+
+    async def flush(self):
+        """Записывает оставшиеся изменения и закрывает базу (вызывается PTB при остановке)"""
+        await self._flush()
+        logger.info(f"Состояние сохранено: {self.stats()}")
+        self._db.close()
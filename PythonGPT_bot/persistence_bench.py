@@ -0,0 +1,80 @@
+"""
+Стенд для хранилища состояний: имитирует активных пользователей квиза,
+передает изменения так же, как PTB раз в интервал, и измеряет скорость
+записи и время загрузки состояния при перезапуске.
+
+Пример:
+    python persistence_bench.py --users 20000 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from persistence import SQLitePersistence
+
+
+def make_user_data(user_id: int, round_number: int) -> dict:
+    """Создает user_data, похожие на данные активного квиза"""
+    return {
+        "quiz_score": round_number,
+        "quiz_total": round_number + 1,
+        "current_quiz_topic": "science",
+        "current_question": {
+            "id": user_id * 100 + round_number,
+            "question": f"Вопрос номер {round_number} для пользователя {user_id}?",
+            "options": ["Первый", "Второй", "Третий", "Четвертый"],
+            "correct": round_number % 4,
+            "explanation": "Объяснение правильного ответа в двух-трех предложениях.",
+            "fun_fact": "Интересный факт по теме вопроса."
+        }
+    }
+
+
+async def run(users: int, rounds: int, path: str):
+    persistence = SQLitePersistence(path)
+    await persistence.get_user_data()
+
+    for round_number in range(rounds):
+        started = time.perf_counter()
+        # Так PTB передает изменения за интервал: по вызову на каждого пользователя и разговор
+        await asyncio.gather(*(
+            coroutine
+            for user_id in range(users)
+            for coroutine in (
+                persistence.update_user_data(user_id, make_user_data(user_id, round_number)),
+                persistence.update_chat_data(user_id, {}),
+                persistence.update_conversation("quiz_conversation", (user_id,), 1)
+            )
+        ))
+        staged = time.perf_counter()
+        await persistence._flush_task
+        written = time.perf_counter() - staged
+        print(f"Раунд {round_number + 1}: передача изменений {(staged - started) * 1000:.0f} мс, "
+              f"запись {3 * users} строк за {written:.2f} с ({3 * users / written:.0f} строк/с)")
+
+    await persistence.flush()
+    print(f"Размер базы: {os.path.getsize(path) / 1024 / 1024:.1f} МБ")
+
+    restarted = SQLitePersistence(path)
+    started = time.perf_counter()
+    await restarted.get_user_data()
+    await restarted.get_chat_data()
+    await restarted.get_conversations("quiz_conversation")
+    print(f"Загрузка при перезапуске: {time.perf_counter() - started:.2f} с")
+    await restarted.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стенд для хранилища состояний бота")
+    parser.add_argument("--users", type=int, default=10000, help="Количество активных пользователей")
+    parser.add_argument("--rounds", type=int, default=3, help="Количество интервалов записи")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(args.users, args.rounds, os.path.join(directory, "state.sqlite3")))
+
+
+if __name__ == '__main__':
+    main()
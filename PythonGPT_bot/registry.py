@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Папки с текстовыми ресурсами
+RESOURCE_DIRS = {
+    "messages": "resources/messages",
+    "prompts": "resources/prompts",
+    "characters": "prompts/characters"
+}
+# Интервал проверки изменений файлов (секунды)
+RESOURCE_RELOAD_INTERVAL = float(os.getenv("RESOURCE_RELOAD_INTERVAL", "2"))
+
+
+class ResourceRegistry:
+    """
+    Реестр текстовых ресурсов в памяти.
+
+    Сообщения и промпты читаются с диска один раз при запуске, обработчики
+    получают их из словаря. Фоновая задача следит за временем изменения
+    файлов и перечитывает измененные, поэтому правки промптов применяются
+    без перезапуска бота.
+    """
+
+    def __init__(self, dirs: Dict[str, str] = None):
+        """
+        Args:
+            dirs (Dict[str, str]): Тип ресурса -> папка с .txt файлами
+        """
+        self.dirs = dirs or RESOURCE_DIRS
+        self._texts: Dict[Tuple[str, str], str] = {}
+        self._mtimes: Dict[Tuple[str, str], int] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        self.reload_changed()
+
+    def _scan(self) -> Dict[Tuple[str, str], Tuple[str, int]]:
+        files = {}
+        for kind, directory in self.dirs.items():
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".txt"):
+                    files[(kind, entry.name[:-4])] = (entry.path, entry.stat().st_mtime_ns)
+        return files
+
+    def reload_changed(self) -> List[Tuple[str, str]]:
+        """
+        Перечитывает новые и измененные файлы, забывает удаленные
+
+        Returns:
+            List[Tuple[str, str]]: Ключи измененных ресурсов
+        """
+        files = self._scan()
+        changed = []
+        for key, (path, mtime) in files.items():
+            if self._mtimes.get(key) == mtime:
+                continue
+            try:
+                with open(path, "r", encoding="utf8") as file:
+                    self._texts[key] = file.read()
+                self._mtimes[key] = mtime
+                changed.append(key)
+            except Exception as e:
+                logger.error(f"Ошибка при чтении ресурса {path}: {e}")
+
+        for key in set(self._texts) - set(files):
+            del self._texts[key]
+            self._mtimes.pop(key, None)
+            changed.append(key)
+        return changed
+
+    def get(self, kind: str, name: str) -> str:
+        """
+        Возвращает текст ресурса
+
+        Raises:
+            FileNotFoundError: Если ресурс не найден
+        """
+        try:
+            return self._texts[(kind, name)]
+        except KeyError:
+            raise FileNotFoundError(f"{self.dirs.get(kind, kind)}/{name}.txt")
+
+    async def watch(self, interval: float = RESOURCE_RELOAD_INTERVAL):
+        """Периодически перечитывает измененные файлы"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changed = await asyncio.to_thread(self.reload_changed)
+                if changed:
+                    logger.info(f"Ресурсы перезагружены: {', '.join('/'.join(key) for key in changed)}")
+            except Exception as e:
+                logger.error(f"Ошибка при перезагрузке ресурсов: {e}")
+
+    def start_watching(self):
+        """Запускает фоновое отслеживание изменений"""
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self.watch())
+
+    def stop_watching(self):
+        """Останавливает отслеживание изменений"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+
+resource_registry = ResourceRegistry()
@@ -0,0 +1,313 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит исходящих запросов бота (запросов в секунду)
+GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+# Лимит сообщений в личный чат (в секунду) и допустимый всплеск
+CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+# Лимит сообщений в группу (в секунду)
+GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", str(20 / 60)))
+# Количество повторов запроса после RetryAfter
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+
+# Приоритеты запросов: меньшее значение отправляется раньше
+PRIORITY_FINAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_STATUS = 2
+
+# Правки, из которых в Telegram попадает только последняя
+MERGEABLE_ENDPOINTS = {"editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup"}
+
+
+class TokenBucket:
+    """
+    Ведро токенов с очередью ожидающих по приоритету.
+
+    Пока в очереди есть ожидающие, новый запрос не может забрать токен вне
+    очереди, поэтому запросы одного приоритета отправляются в порядке поступления.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate (float): Скорость пополнения (токенов в секунду)
+            capacity (float): Размер ведра
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _wake(self):
+        self._timer = None
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+            elif self._take():
+                heapq.heappop(self._waiters)
+                future.set_result(None)
+            else:
+                break
+        self._schedule()
+
+    def _schedule(self):
+        if not self._waiters or self._timer is not None:
+            return
+        now = time.monotonic()
+        delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        """Ждет токен с учетом приоритета"""
+        if not self._waiters and self._take():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._schedule()
+        await future
+
+    def refund(self):
+        """Возвращает неиспользованный токен"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+        if self._waiters and self._timer is None:
+            self._wake()
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов на указанное время"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    async def wait_unpaused(self):
+        """Ждет окончания паузы, не забирая токен"""
+        delay = self.blocked_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @property
+    def idle(self) -> bool:
+        """Ведро полное и никто не ждет"""
+        self._refill(time.monotonic())
+        return not self._waiters and self.tokens >= self.capacity and time.monotonic() >= self.blocked_until
+
+
+def _consume_exception(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+class SendQueue(BaseRateLimiter[Dict[str, Any]]):
+    """
+    Очередь исходящих запросов к Telegram.
+
+    Подключается к Application как rate limiter, поэтому через нее проходят все
+    вызовы бота из обработчиков. Каждый запрос в чат ждет токен в ведре чата
+    и в общем ведре бота. RetryAfter не сообщает, какой лимит превышен, поэтому
+    после него на паузу ставятся и чат, и весь бот (как в AIORateLimiter PTB),
+    а запрос повторяется. Запросы не в чат токенов не ждут, но соблюдают паузу. Из нескольких ожидающих правок одного сообщения
+    отправляется только последняя, остальные получают ее результат.
+    Приоритет передается через rate_limit_args={"priority": ...}.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 chat_burst: int = CHAT_BURST, group_rate: float = GROUP_RATE,
+                 max_retries: int = SEND_MAX_RETRIES):
+        """
+        Args:
+            global_rate (float): Общий лимит запросов в секунду
+            chat_rate (float): Лимит сообщений в личный чат в секунду
+            chat_burst (int): Допустимый всплеск сообщений в чат
+            group_rate (float): Лимит сообщений в группу в секунду
+            max_retries (int): Количество повторов после RetryAfter
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.global_bucket: Optional[TokenBucket] = None
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        # Ключ правки -> [последняя правка, количество незавершенных правок, блокировка отправки]
+        self._edits: Dict[Tuple, list] = {}
+        self.sent = 0
+        self.merged = 0
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        self.global_bucket = TokenBucket(self.global_rate, self.global_rate)
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                # Полные ведра без ожидающих ничем не отличаются от новых
+                for key in [key for key, value in self._chats.items() if value.idle]:
+                    del self._chats[key]
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            if is_group:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], None]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], None]:
+        if self.global_bucket is None:
+            await self.initialize()
+
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_NORMAL)
+        chat_id = data.get("chat_id")
+        # Запросы не в чат (ответы на callback, getFile и т.п.) не ограничиваются по скорости
+        if chat_id is None:
+            return await self._process_unlimited(callback, args, kwargs, endpoint)
+
+        chat_bucket = self._chat_bucket(chat_id)
+        edit = None
+        mine = None
+        if endpoint in MERGEABLE_ENDPOINTS and data.get("message_id") is not None:
+            edit_key = (endpoint, chat_id, data["message_id"])
+            mine = asyncio.get_running_loop().create_future()
+            mine.add_done_callback(_consume_exception)
+            edit = self._edits.setdefault(edit_key, [None, 0, asyncio.Lock()])
+            edit[0] = mine
+            edit[1] += 1
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                await chat_bucket.acquire(priority)
+                if edit is not None and edit[0] is not mine:
+                    # Пока правка ждала очереди, пришла более новая: старая уже не нужна
+                    chat_bucket.refund()
+                    return await self._merge(edit, mine)
+
+                await self.global_bucket.acquire(priority)
+                try:
+                    if edit is None:
+                        result = await callback(*args, **kwargs)
+                    else:
+                        # Правки одного сообщения уходят строго по очереди, чтобы старая
+                        # версия не могла прийти в Telegram после новой
+                        async with edit[2]:
+                            superseded = edit[0] is not mine
+                            if not superseded:
+                                result = await callback(*args, **kwargs)
+                        if superseded:
+                            return await self._merge(edit, mine)
+                except RetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    logger.warning(f"RetryAfter {e.retry_after} с для чата {chat_id} ({endpoint}), повтор {attempt + 1}")
+                    chat_bucket.pause(float(e.retry_after))
+                    self.global_bucket.pause(float(e.retry_after))
+                    continue
+
+                self.sent += 1
+                if mine is not None:
+                    mine.set_result(result)
+                return result
+        except BaseException as e:
+            if mine is not None and not mine.done():
+                if isinstance(e, Exception):
+                    mine.set_exception(e)
+                else:
+                    mine.cancel()
+            raise
+        finally:
+            if edit is not None:
+                edit[1] -= 1
+                if edit[1] == 0:
+                    del self._edits[edit_key]
+
+    async def _process_unlimited(self, callback: Callable[..., Coroutine], args: Any, kwargs: Dict[str, Any],
+                                 endpoint: str) -> Union[bool, Dict[str, Any], None]:
+        for attempt in range(self.max_retries + 1):
+            await self.global_bucket.wait_unpaused()
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(f"RetryAfter {e.retry_after} с ({endpoint}), бот на паузе, повтор {attempt + 1}")
+                self.global_bucket.pause(float(e.retry_after))
+                continue
+            self.sent += 1
+            return result
+
+    async def _merge(self, edit: list, mine: asyncio.Future):
+        self.merged += 1
+        result = await asyncio.shield(edit[0])
+        mine.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает статистику очереди"""
+        return {
+            "sent": self.sent,
+            "merged": self.merged,
+            "retries": self.retries,
+            "chats": len(self._chats)
+        }
+
+
+def priority_args(bot: Bot, priority: int) -> Optional[Dict[str, int]]:
+    """
+    Формирует rate_limit_args с приоритетом запроса
+
+    Args:
+        bot (Bot): Бот, через который отправляется запрос
+        priority (int): Приоритет запроса
+
+    Returns:
+        Optional[Dict[str, int]]: Аргументы для очереди или None, если очередь не подключена
+    """
+    if getattr(bot, "rate_limiter", None) is None:
+        return None
+    return {"priority": priority}
+
+
+send_queue = SendQueue()
@@ -0,0 +1,116 @@
+"""
+Нагрузочный стенд для многопроцессного режима: распределяет синтетические
+обновления по процессам так же, как sharding.py, а каждый процесс выполняет
+CPU-нагрузку, похожую на обработку фото (base64) и текста (регулярные
+выражения). Показывает, как пропускная способность растет с числом процессов.
+
+Пример:
+    python shard_bench.py --count 4000 --workers 1 2 4
+"""
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import re
+import time
+
+from telegram import Update
+
+from sharding import ShardRouter, STOP
+
+# Размер синтетического изображения, кодируемого в base64 для каждого обновления
+IMAGE_SIZE = 256 * 1024
+SEARCH_PATTERN = re.compile(r"\b(найди|поищи|новости|курс|погода)\b", re.IGNORECASE)
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    """Создает синтетическое обновление с текстовым сообщением"""
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": f"Поищи новости про сообщение {update_id} " * 20
+        }
+    }, None)
+
+
+def bench_worker(source: multiprocessing.Queue, results: multiprocessing.Queue):
+    """Обрабатывает обновления из очереди и сообщает количество и порядок по чатам"""
+    image = os.urandom(IMAGE_SIZE)
+    processed = 0
+    last_seen = {}
+    ordered = True
+    while True:
+        payload = source.get()
+        if payload is STOP:
+            break
+        update = Update.de_json(json.loads(payload), None)
+        base64.b64encode(image)
+        SEARCH_PATTERN.findall(update.message.text)
+        chat_id = update.effective_chat.id
+        ordered = ordered and last_seen.get(chat_id, 0) < update.update_id
+        last_seen[chat_id] = update.update_id
+        processed += 1
+    results.put((processed, ordered))
+
+
+async def feed(router: ShardRouter, count: int, chats: int):
+    router.start()
+    for update_id in range(1, count + 1):
+        await router.route(make_update(update_id, update_id % chats + 1))
+    await router.drain()
+    await router.close()
+
+
+def run(workers: int, count: int, chats: int) -> float:
+    """
+    Прогоняет обновления через указанное количество процессов
+
+    Returns:
+        float: Обновлений в секунду
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(1000) for _ in range(workers)]
+    results = context.Queue()
+    processes = [context.Process(target=bench_worker, args=(queues[index], results)) for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    router = ShardRouter(queues)
+    started = time.perf_counter()
+    asyncio.run(feed(router, count, chats))
+    router.stop()
+    totals = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    processed = sum(total for total, _ in totals)
+    ordered = all(flag for _, flag in totals)
+    rate = processed / elapsed
+    print(f"Процессов: {workers}, обработано: {processed}, {rate:.0f} обн/с, "
+          f"по процессам: {router.routed}, порядок в чатах сохранен: {ordered}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд для многопроцессного режима")
+    parser.add_argument("--count", type=int, default=2000, help="Количество обновлений")
+    parser.add_argument("--chats", type=int, default=100, help="Количество разных чатов")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Варианты числа процессов")
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        rate = run(workers, args.count, args.chats)
+        baseline = baseline or rate
+        print(f"  ускорение относительно {args.workers[0]} процессов: {rate / baseline:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,419 @@
+"""
+Многопроцессный режим: один процесс получает обновления (polling или webhook)
+и распределяет их по процессам-обработчикам по chat_id, каждый процесс
+запускает полноценное приложение из main.py. Процесс приема записывает
+обновления в свой журнал и перезапускает завершившиеся обработчики.
+
+Пример:
+    SHARD_WORKERS=4 python sharding.py
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from typing import Callable, List, Set
+
+from dotenv import load_dotenv
+from telegram import Bot, Update
+from telegram.ext import Application, Updater
+
+logger = logging.getLogger(__name__)
+
+# Переменные из .env нужны до чтения настроек и передаются процессам-обработчикам
+load_dotenv()
+
+# Количество процессов-обработчиков
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1)))
+# Максимум обновлений, ожидающих в очереди одного обработчика
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "10000"))
+# Сколько обновлений одного обработчика процесс приема держит в памяти, остальные дочитываются из журнала
+SHARD_BUFFER_SIZE = int(os.getenv("SHARD_BUFFER_SIZE", "1000"))
+# Журнал процесса приема: обновление отмечается в нем, когда обработчик запишет его в свой журнал
+SHARD_INGRESS_LOG_PATH = os.getenv("SHARD_INGRESS_LOG_PATH", "resources/ingress.sqlite3")
+# Период проверки процессов-обработчиков (секунды)
+SHARD_SUPERVISE_INTERVAL = float(os.getenv("SHARD_SUPERVISE_INTERVAL", "1"))
+
+# Настройки получения обновлений — те же переменные окружения, что и в main.py
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Сигнал остановки для процесса-обработчика
+STOP = None
+
+
+def shard_for(update: Update, shards: int) -> int:
+    """
+    Определяет обработчик обновления
+
+    Все обновления одного чата попадают в один процесс, поэтому порядок
+    их обработки сохраняется.
+
+    Args:
+        update (Update): Обновление
+        shards (int): Количество обработчиков
+
+    Returns:
+        int: Номер обработчика
+    """
+    if update.effective_chat is not None:
+        key = update.effective_chat.id
+    elif update.effective_user is not None:
+        key = update.effective_user.id
+    else:
+        key = update.update_id
+    return key % shards
+
+
+class ShardRouter:
+    """
+    Передает обновления в очереди процессов-обработчиков.
+
+    У каждого обработчика своя ограниченная очередь в памяти и своя задача
+    передачи, поэтому медленный обработчик не задерживает остальные. Если
+    задан журнал, обновление записывается в него до постановки в очередь
+    и отмечается обработанным, только когда обработчик подтвердит запись
+    в свой журнал. Пока очередь обработчика заполнена, его новые обновления
+    остаются только в журнале и потом дочитываются из него по порядку.
+    """
+
+    def __init__(self, queues: List[multiprocessing.Queue], journal=None, bot: Bot = None,
+                 buffer_size: int = SHARD_BUFFER_SIZE):
+        """
+        Args:
+            queues (List[multiprocessing.Queue]): Очереди обработчиков
+            journal (UpdateLog): Журнал процесса приема; без него route ждет места в очереди обработчика
+            bot (Bot): Бот, к которому привязываются обновления из журнала
+            buffer_size (int): Размер очереди в памяти для каждого обработчика
+        """
+        self.queues = queues
+        self.journal = journal
+        self.bot = bot
+        self.buffer_size = buffer_size
+        self.routed = [0] * len(queues)
+        self.restarts = [0] * len(queues)
+        self._buffers: List[asyncio.Queue] = []
+        self._forwarders: List[asyncio.Task] = []
+        # Обработчики, часть обновлений которых есть только в журнале (после запуска — все)
+        self._backlog = [journal is not None] * len(queues)
+        # Переданные, но еще не подтвержденные обновления каждого обработчика
+        self._unacked: List[Set[int]] = [set() for _ in queues]
+
+    def start(self):
+        """Запускает задачи передачи обновлений, по одной на обработчик"""
+        self._buffers = [asyncio.Queue(self.buffer_size) for _ in self.queues]
+        self._forwarders = [asyncio.create_task(self._forward(shard)) for shard in range(len(self.queues))]
+
+    async def route(self, update: Update):
+        """Записывает обновление в журнал и ставит его в очередь обработчика"""
+        shard = shard_for(update, len(self.queues))
+        if self.journal is not None and not self.journal.append(update, shard):
+            logger.debug(f"Повторное обновление {update.update_id} пропущено")
+            return
+        buffer = self._buffers[shard]
+        if self.journal is None:
+            await buffer.put(update)
+        elif self._backlog[shard] or buffer.full():
+            # Обновление уже в журнале: обработчик получит его, когда разберет очередь
+            self._backlog[shard] = True
+        else:
+            buffer.put_nowait(update)
+
+    def acknowledge(self, update_id: int):
+        """Отмечает обновление, записанное обработчиком в свой журнал"""
+        for unacked in self._unacked:
+            unacked.discard(update_id)
+        self.journal.mark_processed(update_id)
+
+    def restart(self, shard: int):
+        """
+        Передает перезапущенному обработчику заново все его неподтвержденные обновления
+
+        Повторно переданные обновления, которые обработчик уже записал
+        в свой журнал, отсеиваются им по update_id.
+
+        Args:
+            shard (int): Номер обработчика
+        """
+        self.restarts[shard] += 1
+        self._forwarders[shard].cancel()
+        self._unacked[shard].clear()
+        # Обновления из очереди в памяти тоже есть в журнале и будут перечитаны по порядку
+        self._buffers[shard] = asyncio.Queue(self.buffer_size)
+        self._backlog[shard] = True
+        self._forwarders[shard] = asyncio.create_task(self._forward(shard))
+
+    async def drain(self):
+        """Ждет, пока все обновления из очередей в памяти будут переданы обработчикам"""
+        for buffer in self._buffers:
+            await buffer.join()
+
+    async def close(self):
+        """Останавливает задачи передачи"""
+        for forwarder in self._forwarders:
+            forwarder.cancel()
+        await asyncio.gather(*self._forwarders, return_exceptions=True)
+
+    def stop(self):
+        """Отправляет обработчикам сигнал остановки"""
+        for worker_queue in self.queues:
+            worker_queue.put(STOP)
+
+    def _refill(self, shard: int):
+        # Берем из журнала следующие неподтвержденные обновления этого обработчика в порядке update_id
+        pending = self.journal.pending(self.bot, shard=shard, limit=self.buffer_size + 1,
+                                       exclude=self._unacked[shard])
+        for update in pending[:self.buffer_size]:
+            self._buffers[shard].put_nowait(update)
+        self._backlog[shard] = len(pending) > self.buffer_size
+
+    async def _forward(self, shard: int):
+        buffer = self._buffers[shard]
+        worker_queue = self.queues[shard]
+        while True:
+            if buffer.empty() and self._backlog[shard]:
+                self._refill(shard)
+            update = await buffer.get()
+            payload = update.to_json()
+            if self.journal is not None:
+                # Подтверждение может прийти раньше, чем задача продолжит работу после put
+                self._unacked[shard].add(update.update_id)
+            try:
+                worker_queue.put_nowait(payload)
+            except queue.Full:
+                # Обработчик не успевает: ждем места в его очереди, остальные обработчики не ждут
+                await asyncio.to_thread(worker_queue.put, payload)
+            self.routed[shard] += 1
+            buffer.task_done()
+
+
+def start_ack_listener(acks: multiprocessing.Queue, router: ShardRouter,
+                       loop: asyncio.AbstractEventLoop) -> threading.Thread:
+    """
+    Запускает поток, который передает подтверждения обработчиков в ShardRouter
+
+    Args:
+        acks (multiprocessing.Queue): Очередь подтверждений от обработчиков
+        router (ShardRouter): Распределитель обновлений
+        loop (asyncio.AbstractEventLoop): Event loop процесса приема
+
+    Returns:
+        threading.Thread: Запущенный поток
+    """
+    def listen():
+        while True:
+            update_id = acks.get()
+            if update_id is STOP:
+                return
+            try:
+                loop.call_soon_threadsafe(router.acknowledge, update_id)
+            except RuntimeError:
+                # Event loop уже остановлен: неподтвержденные обновления будут переданы при следующем запуске
+                return
+
+    thread = threading.Thread(target=listen, name="shard-acks", daemon=True)
+    thread.start()
+    return thread
+
+
+async def supervise(router: ShardRouter, workers: List[multiprocessing.Process],
+                    start_worker: Callable[[int], multiprocessing.Process],
+                    interval: float = SHARD_SUPERVISE_INTERVAL):
+    """
+    Перезапускает завершившиеся процессы-обработчики
+
+    Args:
+        router (ShardRouter): Распределитель обновлений
+        workers (List[multiprocessing.Process]): Процессы-обработчики, список обновляется на месте
+        start_worker (Callable[[int], multiprocessing.Process]): Запускает обработчик с указанным номером
+        interval (float): Период проверки в секундах
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for index, worker in enumerate(workers):
+            if worker.is_alive():
+                continue
+            logger.error(f"Обработчик {worker.name} завершился с кодом {worker.exitcode}, перезапуск")
+            workers[index] = start_worker(index)
+            router.restart(index)
+
+
+def start_pump(source: multiprocessing.Queue, acks: multiprocessing.Queue, application: Application,
+               loop: asyncio.AbstractEventLoop, stopped: asyncio.Event) -> threading.Thread:
+    """
+    Запускает поток, который переносит обновления из очереди процесса в очередь приложения
+
+    Args:
+        source (multiprocessing.Queue): Очередь от процесса приема
+        acks (multiprocessing.Queue): Очередь подтверждений для процесса приема
+        application (Application): Приложение обработчика
+        loop (asyncio.AbstractEventLoop): Event loop приложения
+        stopped (asyncio.Event): Устанавливается при получении сигнала остановки
+
+    Returns:
+        threading.Thread: Запущенный поток
+    """
+    def pump():
+        while True:
+            payload = source.get()
+            if payload is STOP:
+                loop.call_soon_threadsafe(stopped.set)
+                return
+            update = Update.de_json(json.loads(payload), application.bot)
+            # Обновления ставятся по одному, поэтому порядок сохраняется
+            asyncio.run_coroutine_threadsafe(application.update_queue.put(update), loop).result()
+            # Обновление записано в журнал обработчика, процесс приема может его отметить
+            acks.put(update.update_id)
+
+    thread = threading.Thread(target=pump, name="shard-pump", daemon=True)
+    thread.start()
+    return thread
+
+
+async def serve(application: Application, source: multiprocessing.Queue, acks: multiprocessing.Queue):
+    """Запускает приложение без собственного получения обновлений"""
+    stopped = asyncio.Event()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    start_pump(source, acks, application, asyncio.get_running_loop(), stopped)
+    try:
+        await stopped.wait()
+    finally:
+        await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+
+
+def _worker_path(path: str, index: int) -> str:
+    root, extension = os.path.splitext(path)
+    return f"{root}-{index}{extension}"
+
+
+def worker_main(index: int, shards: int, source: multiprocessing.Queue, acks: multiprocessing.Queue):
+    """
+    Точка входа процесса-обработчика
+
+    Args:
+        index (int): Номер обработчика
+        shards (int): Количество обработчиков
+        source (multiprocessing.Queue): Очередь обновлений этого обработчика
+        acks (multiprocessing.Queue): Очередь подтверждений для процесса приема
+    """
+    # Журнал обновлений у каждого обработчика свой, иначе при запуске повторялись бы чужие обновления
+    os.environ["UPDATE_LOG_PATH"] = _worker_path(os.getenv("UPDATE_LOG_PATH", "resources/updates.sqlite3"), index)
+    # Общий лимит Telegram делится между процессами
+    os.environ["SEND_GLOBAL_RATE"] = str(float(os.getenv("SEND_GLOBAL_RATE", "30")) / shards)
+    if index:
+        # Корпус фактов пополняет только первый обработчик
+        os.environ["FACT_GROW_INTERVAL"] = "0"
+
+    # main.py читает настройки при импорте, поэтому импортируется после их изменения
+    import main
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    main.install_uvloop()
+    asyncio.run(serve(main.application, source, acks))
+
+
+async def run_ingress(router: ShardRouter, acks: multiprocessing.Queue, workers: List[multiprocessing.Process],
+                      start_worker: Callable[[int], multiprocessing.Process]):
+    """Получает обновления от Telegram и распределяет их по обработчикам"""
+    update_queue: asyncio.Queue = asyncio.Queue()
+    updater = Updater(router.bot, update_queue)
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+
+    # Обновления, не подтвержденные до прошлой остановки, дочитываются из журнала
+    router.start()
+    start_ack_listener(acks, router, loop)
+    supervisor = asyncio.create_task(supervise(router, workers, start_worker))
+
+    async with updater:
+        if BOT_MODE == "webhook":
+            await updater.start_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+        async def forward():
+            while True:
+                # С журналом route не ждет обработчиков, поэтому одной задачи приема достаточно
+                await router.route(await update_queue.get())
+
+        forwarder = asyncio.create_task(forward())
+        await stopped.wait()
+        await updater.stop()
+        forwarder.cancel()
+
+    # Обновления, полученные до остановки, записываются в журнал и будут переданы при следующем запуске
+    while not update_queue.empty():
+        await router.route(update_queue.get_nowait())
+    supervisor.cancel()
+    await router.close()
+    logger.info(f"Распределено обновлений по обработчикам: {router.routed}, перезапусков: {router.restarts}")
+    logger.info(f"Журнал процесса приема: {router.journal.stats()}")
+
+
+def run_sharded(shards: int = SHARD_WORKERS, queue_size: int = SHARD_QUEUE_SIZE):
+    """
+    Запускает процессы-обработчики и процесс приема обновлений
+
+    Args:
+        shards (int): Количество обработчиков
+        queue_size (int): Размер очереди каждого обработчика
+    """
+    # Импортируется здесь: модуль создает журнал по UPDATE_LOG_PATH, а обработчики задают его до импорта
+    from update_log import UpdateLog
+
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(queue_size) for _ in range(shards)]
+    acks = context.Queue()
+
+    def start_worker(index: int) -> multiprocessing.Process:
+        worker = context.Process(target=worker_main, args=(index, shards, queues[index], acks), name=f"shard-{index}")
+        worker.start()
+        return worker
+
+    workers = [start_worker(index) for index in range(shards)]
+    logger.info(f"Запущено обработчиков: {shards}")
+
+    journal = UpdateLog(SHARD_INGRESS_LOG_PATH)
+    router = ShardRouter(queues, journal, Bot(os.getenv("TG_BOT_TOKEN")))
+    try:
+        asyncio.run(run_ingress(router, acks, workers, start_worker))
+    finally:
+        router.stop()
+        for worker in workers:
+            worker.join()
+        acks.put(STOP)
+        journal.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+        raise ValueError("Для режима webhook необходимо задать WEBHOOK_URL и WEBHOOK_SECRET")
+    run_sharded()
@@ -0,0 +1,363 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from telegram import Update
+from telegram.ext import ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Хранилище общего состояния чатов: memory (один процесс) или redis (несколько реплик)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+# Адрес Redis для STATE_BACKEND=redis
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+# Префикс ключей, чтобы несколько ботов могли использовать один Redis
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "gptbot")
+# Время жизни состояния чата после последнего изменения (секунды)
+STATE_TTL = int(os.getenv("STATE_TTL", "86400"))
+# Количество ключей, для которых реплика помнит хэш последнего известного значения
+STATE_KNOWN_KEYS = int(os.getenv("STATE_KNOWN_KEYS", "100000"))
+
+
+class StateBackend(ABC):
+    """
+    Интерфейс хранилища состояния.
+
+    Чтение и запись выполняются пачками, чтобы состояние одного обновления
+    передавалось за один запрос к хранилищу.
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """
+        Читает значения ключей
+
+        Args:
+            keys (Sequence[str]): Ключи
+
+        Returns:
+            List[Optional[bytes]]: Значения в порядке ключей, None для отсутствующих
+        """
+
+    @abstractmethod
+    async def set_many(self, values: Dict[str, bytes], ttl: int):
+        """
+        Записывает значения ключей
+
+        Args:
+            values (Dict[str, bytes]): Значения по ключам
+            ttl (int): Время жизни в секундах
+        """
+
+    async def close(self):
+        """Освобождает соединения"""
+
+
+class InMemoryBackend(StateBackend):
+    """Хранилище в памяти процесса с истечением ключей по времени"""
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[bytes, float]] = {}
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        result = []
+        for key in keys:
+            item = self._values.get(key)
+            if item is not None and item[1] <= now:
+                del self._values[key]
+                item = None
+            result.append(None if item is None else item[0])
+        return result
+
+    async def set_many(self, values: Dict[str, bytes], ttl: int):
+        expires = time.monotonic() + ttl
+        for key, value in values.items():
+            self._values[key] = (value, expires)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class RedisBackend(StateBackend):
+    """
+    Хранилище в Redis (или совместимом сервере).
+
+    Чтение — одна команда MGET, запись — пайплайн из SET с EX без транзакции,
+    то есть каждая операция занимает один сетевой обмен.
+    """
+
+    def __init__(self, url: str = STATE_REDIS_URL, client=None):
+        """
+        Args:
+            url (str): Адрес Redis
+            client (redis.asyncio.Redis, optional): Готовый клиент, например fakeredis для проверки
+        """
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("Для STATE_BACKEND=redis необходимо установить пакет redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self.client.mget(list(keys))
+
+    async def set_many(self, values: Dict[str, bytes], ttl: int):
+        if not values:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(key, value, ex=ttl)
+            await pipe.execute()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def get_state_backend(kind: str = STATE_BACKEND) -> StateBackend:
+    """Создает хранилище по названию из STATE_BACKEND"""
+    if kind == "redis":
+        return RedisBackend()
+    if kind == "memory":
+        return InMemoryBackend()
+    raise ValueError(f"Неизвестное хранилище состояния STATE_BACKEND: {kind}")
+
+
+class StateSlot:
+    """Часть состояния, которая хранится в локальном хранилище и синхронизируется с общим"""
+    __slots__ = ("name", "key_of", "snapshot", "restore")
+
+    def __init__(self, name: str, key_of: Callable[[Update], Optional[Hashable]],
+                 snapshot: Callable[[Hashable], Any], restore: Callable[[Hashable, Any], None]):
+        """
+        Args:
+            name (str): Имя части состояния, входит в ключ
+            key_of (Callable): Возвращает идентификатор владельца (чат, пользователь) для обновления
+            snapshot (Callable): Возвращает сериализуемый снимок или None, если сохранять нечего
+            restore (Callable): Восстанавливает локальное состояние из снимка
+        """
+        self.name = name
+        self.key_of = key_of
+        self.snapshot = snapshot
+        self.restore = restore
+
+
+def chat_key(update: Update) -> Optional[int]:
+    """Владелец состояния — чат обновления"""
+    return update.effective_chat.id if update.effective_chat else None
+
+
+def user_key(update: Update) -> Optional[int]:
+    """Владелец состояния — пользователь обновления"""
+    return update.effective_user.id if update.effective_user else None
+
+
+class ConversationStates:
+    """
+    Состояния ConversationHandler'ов одного пользователя в чате.
+
+    PTB держит состояния разговоров в памяти обработчика и читает
+    persistence только при запуске, поэтому состояние разговора, начатого
+    на другой реплике, восстанавливается прямо в обработчик. Ключ владельца —
+    «чат:пользователь», как у обработчиков с per_chat и per_user.
+
+    Используется внутренний словарь ConversationHandler._conversations,
+    поэтому версия python-telegram-bot закреплена в requirements (20.7);
+    при обновлении PTB это место нужно проверить (tests/test_state_backend.py).
+    """
+
+    def __init__(self, handlers: Sequence[ConversationHandler]):
+        """
+        Args:
+            handlers (Sequence[ConversationHandler]): Обработчики с заданным name
+        """
+        for handler in handlers:
+            if not isinstance(getattr(handler, "_conversations", None), dict):
+                # Лучше не запуститься, чем молча терять состояния разговоров между репликами
+                raise RuntimeError("ConversationStates не поддерживает эту версию python-telegram-bot")
+        self.handlers = {handler.name: handler for handler in handlers}
+
+    @staticmethod
+    def key_of(update: Update) -> Optional[str]:
+        """Владелец состояния — пользователь в чате обновления"""
+        if update.effective_chat is None or update.effective_user is None:
+            return None
+        return f"{update.effective_chat.id}:{update.effective_user.id}"
+
+    @staticmethod
+    def _conversation_key(owner: str) -> Tuple[int, ...]:
+        return tuple(int(part) for part in owner.split(":"))
+
+    def snapshot(self, owner: str) -> Dict[str, Any]:
+        """Возвращает состояния разговоров пользователя по именам обработчиков"""
+        key = self._conversation_key(owner)
+        states = {}
+        for name, handler in self.handlers.items():
+            state = handler._conversations.get(key)
+            # Состояние незавершенного неблокирующего обработчика не сериализуется
+            if isinstance(state, (int, str)):
+                states[name] = state
+        # Пустой снимок тоже сохраняется, иначе другие реплики не узнают о завершении разговора
+        return states
+
+    def restore(self, owner: str, snapshot: Dict[str, Any]):
+        """Восстанавливает состояния разговоров пользователя в обработчиках"""
+        key = self._conversation_key(owner)
+        for name, handler in self.handlers.items():
+            if name in snapshot:
+                handler._conversations[key] = snapshot[name]
+            else:
+                handler._conversations.pop(key, None)
+
+
+def _encode(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _digest(value: bytes) -> bytes:
+    return hashlib.blake2b(value, digest_size=16).digest()
+
+
+class SharedState:
+    """
+    Синхронизация состояния чатов между репликами.
+
+    Локальные хранилища (сессии, диалоги) остаются рабочими копиями. Перед
+    обработкой обновления все части его состояния читаются одним запросом;
+    если значение отличается от последнего известного этой реплике, локальная
+    копия восстанавливается. После обработки измененные части записываются
+    одним пайплайном в фоне, а следующее обновление того же владельца
+    дожидается этой записи. Поэтому обработка обновления ожидает только один
+    обмен с хранилищем.
+    """
+
+    def __init__(self, backend: StateBackend, ttl: int = STATE_TTL, prefix: str = STATE_KEY_PREFIX,
+                 max_known: int = STATE_KNOWN_KEYS):
+        """
+        Args:
+            backend (StateBackend): Общее хранилище
+            ttl (int): Время жизни состояния в секундах
+            prefix (str): Префикс ключей
+            max_known (int): Количество ключей, для которых запоминается последнее значение
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.max_known = max_known
+        self.slots: List[StateSlot] = []
+        # Хэш последнего значения каждого ключа, известного этой реплике
+        self._known: "OrderedDict[str, bytes]" = OrderedDict()
+        self._saves: Dict[str, asyncio.Task] = {}
+        self.round_trips = 0
+        self.restored = 0
+
+    def register(self, slot: StateSlot):
+        """Добавляет часть состояния"""
+        self.slots.append(slot)
+
+    def _keys(self, update: Update) -> List[Tuple[StateSlot, Hashable, str]]:
+        keys = []
+        for slot in self.slots:
+            owner = slot.key_of(update)
+            if owner is not None:
+                keys.append((slot, owner, f"{self.prefix}:{slot.name}:{owner}"))
+        return keys
+
+    async def load(self, update: Update) -> List[Tuple[StateSlot, Hashable, str]]:
+        """
+        Загружает состояние обновления в локальные хранилища
+
+        Returns:
+            List[Tuple[StateSlot, Hashable, str]]: Части состояния обновления для save
+        """
+        keys = self._keys(update)
+        if not keys:
+            return keys
+        # Запись предыдущего обновления этого владельца должна завершиться до чтения
+        pending = [self._saves[key] for _, _, key in keys if key in self._saves]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        try:
+            values = await self.backend.get_many([key for _, _, key in keys])
+        except Exception as e:
+            # Без общего хранилища обновление обрабатывается с локальной копией состояния
+            logger.error(f"Ошибка при чтении общего состояния: {e}")
+            return keys
+        self.round_trips += 1
+        for (slot, owner, key), value in zip(keys, values):
+            if value is None:
+                continue
+            digest = _digest(value)
+            # Локальная копия могла быть вытеснена, тогда ее нужно восстановить даже без изменений
+            if digest == self._known.get(key) and slot.snapshot(owner) is not None:
+                continue
+            slot.restore(owner, json.loads(value))
+            self._remember(key, digest)
+            self.restored += 1
+        return keys
+
+    def _remember(self, key: str, digest: bytes):
+        self._known[key] = digest
+        self._known.move_to_end(key)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    def save(self, keys: List[Tuple[StateSlot, Hashable, str]]):
+        """Записывает в фоне части состояния, измененные при обработке обновления"""
+        changed = {}
+        for slot, owner, key in keys:
+            snapshot = slot.snapshot(owner)
+            if snapshot is None:
+                continue
+            value = _encode(snapshot)
+            digest = _digest(value)
+            if digest != self._known.get(key):
+                changed[key] = value
+                self._remember(key, digest)
+        if not changed:
+            return
+
+        task = asyncio.create_task(self._write(changed))
+        for key in changed:
+            self._saves[key] = task
+        task.add_done_callback(lambda done: self._forget(changed, done))
+
+    async def _write(self, values: Dict[str, bytes]):
+        try:
+            await self.backend.set_many(values, self.ttl)
+            self.round_trips += 1
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении общего состояния: {e}")
+            # Следующее сохранение запишет эти значения заново
+            for key in values:
+                self._known.pop(key, None)
+
+    def _forget(self, values: Dict[str, bytes], task: asyncio.Task):
+        for key in values:
+            if self._saves.get(key) is task:
+                del self._saves[key]
+
+    async def flush(self):
+        """Дожидается фоновых записей"""
+        if self._saves:
+            await asyncio.gather(*set(self._saves.values()), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает статистику синхронизации"""
+        return {"round_trips": self.round_trips, "restored": self.restored, "keys": len(self._known)}
+
+    async def close(self):
+        """Дожидается записей и закрывает хранилище"""
+        await self.flush()
+        await self.backend.close()
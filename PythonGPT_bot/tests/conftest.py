@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули бота импортируются из его каталога, как при запуске main.py
+sys.path.insert(0, BOT_DIR)
+os.chdir(BOT_DIR)
+
+# Файлы, которые модули открывают при импорте, создаются во временном каталоге
+_files = tempfile.mkdtemp(prefix="gptbot-tests-")
+os.environ.setdefault("UPDATE_LOG_PATH", os.path.join(_files, "updates.sqlite3"))
+os.environ.setdefault("PERSISTENCE_PATH", os.path.join(_files, "state.sqlite3"))
+os.environ.setdefault("QUIZ_DB_PATH", os.path.join(_files, "quiz_bank.sqlite3"))
+os.environ.setdefault("MEDIA_INDEX_PATH", os.path.join(_files, "media_index.json"))
+os.environ.setdefault("FACTS_DATA_PATH", os.path.join(_files, "facts.bin"))
+os.environ.setdefault("FACTS_INDEX_PATH", os.path.join(_files, "facts.idx"))
+os.environ.setdefault("CHATGPT_TOKEN", "test")
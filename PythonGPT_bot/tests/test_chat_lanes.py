@@ -0,0 +1,123 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import Application
+
+from chat_lanes import ChatLaneProcessor
+from update_log import DurableApplication, UpdateLog
+
+
+def make_update(update_id: int, chat_id: int = 1) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": str(update_id)
+        }
+    }, None)
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_updates_of_one_chat_run_in_order():
+    async def scenario():
+        lanes = ChatLaneProcessor(workers=4, depth=10)
+        finished = []
+
+        async def handle(update, delay):
+            await asyncio.sleep(delay)
+            finished.append(update.update_id)
+
+        await asyncio.gather(*(
+            lanes.process_update(update, handle(update, delay))
+            for update, delay in [
+                (make_update(1, chat_id=1), 0.03),
+                (make_update(2, chat_id=2), 0.01),
+                (make_update(3, chat_id=1), 0.0),
+                (make_update(4, chat_id=2), 0.0)
+            ]
+        ))
+        return finished
+
+    finished = asyncio.run(scenario())
+
+    assert finished.index(1) < finished.index(3)
+    assert finished.index(2) < finished.index(4)
+    # Второй чат не ждет медленное обновление первого
+    assert finished.index(4) < finished.index(1)
+
+
+def test_full_lane_rejects_update():
+    async def scenario():
+        lanes = ChatLaneProcessor(workers=4, depth=1)
+        dropped = []
+        lanes.on_drop = lambda update: dropped.append(update.update_id)
+        release = asyncio.Event()
+
+        async def handle():
+            await release.wait()
+
+        tasks = [asyncio.create_task(lanes.process_update(make_update(update_id), handle()))
+                 for update_id in (1, 2)]
+        await settle()
+        await lanes.process_update(make_update(3), handle())
+        release.set()
+        await asyncio.gather(*tasks)
+        return dropped, lanes.stats()
+
+    dropped, stats = asyncio.run(scenario())
+
+    assert dropped == [3]
+    assert stats["rejected"] == 1
+    assert stats["processed"] == 2
+
+
+def test_merged_updates_are_marked_after_carrier(tmp_path, monkeypatch):
+    async def scenario():
+        lanes = ChatLaneProcessor(workers=4, depth=3)
+        lanes.can_coalesce = lambda update: update.update_id > 1
+        update_log = UpdateLog(str(tmp_path / "updates.sqlite3"))
+        application = (
+            Application.builder()
+            .token("123:test")
+            .application_class(DurableApplication, kwargs={"update_log": update_log})
+            .concurrent_updates(lanes)
+            .build()
+        )
+        handled = {}
+
+        async def process_update(self, update):
+            handled[update.update_id] = lanes.text_of(update)
+            # Пока общее обновление обрабатывается, присоединенные еще не отмечены
+            handled["pending"] = update_log.stats()["pending"]
+
+        monkeypatch.setattr(Application, "process_update", process_update)
+        release = asyncio.Event()
+
+        async def busy():
+            await release.wait()
+
+        updates = [make_update(update_id) for update_id in range(1, 5)]
+        for update in updates:
+            update_log.append(update)
+        first = asyncio.create_task(lanes.process_update(updates[0], busy()))
+        await settle()
+        carrier = asyncio.create_task(lanes.process_update(updates[1], application.process_update(updates[1])))
+        await settle()
+        for update in updates[2:]:
+            await lanes.process_update(update, application.process_update(update))
+        release.set()
+        await asyncio.gather(first, carrier)
+        update_log.mark_processed(1)
+        return handled, update_log.stats()["pending"]
+
+    handled, pending = asyncio.run(scenario())
+
+    assert handled[2] == "2\n3\n4"
+    assert handled["pending"] == 4
+    assert pending == 0
@@ -0,0 +1,89 @@
+import asyncio
+
+from gpt_service import context_window
+from gpt_service.context_window import ContextWindow, count_message_tokens
+from gpt_service.conversations import Conversation
+
+
+class FakeEngine:
+    def __init__(self, answer="краткое содержание"):
+        self.answer = answer
+        self.requests = []
+
+    async def complete(self, messages, **kwargs):
+        self.requests.append(messages)
+        return self.answer
+
+
+def make_conversation(count):
+    conversation = Conversation()
+    conversation.set_prompt("Ты помощник")
+    for number in range(count):
+        conversation.add("user" if number % 2 == 0 else "assistant", f"Сообщение номер {number} " * 5)
+    return conversation
+
+
+def test_split_keeps_system_and_latest_messages_within_budget():
+    conversation = make_conversation(10)
+    per_message = count_message_tokens(conversation.messages[1])
+    system = count_message_tokens(conversation.messages[0])
+    window = ContextWindow(budget=system + per_message * 3)
+
+    head, start = window.split(conversation.messages)
+
+    assert head == 1
+    assert start == len(conversation.messages) - 3
+
+
+def test_split_always_keeps_last_message():
+    conversation = make_conversation(3)
+    window = ContextWindow(budget=1)
+
+    head, start = window.split(conversation.messages)
+
+    assert (head, start) == (1, len(conversation.messages) - 1)
+
+
+def test_build_folds_overflow_into_summary(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(context_window, "get_engine", lambda: engine)
+    conversation = make_conversation(10)
+    per_message = count_message_tokens(conversation.messages[1])
+    system = count_message_tokens(conversation.messages[0])
+    window = ContextWindow(budget=system + per_message * 4)
+    latest = conversation.messages[-4:]
+
+    async def scenario():
+        sent = window.build(conversation)
+        await conversation.summary_task
+        rebuilt = window.build(conversation)
+        if conversation.summary_task is not None:
+            await conversation.summary_task
+        return sent, rebuilt
+
+    sent, rebuilt = asyncio.run(scenario())
+
+    assert sent[0]["content"] == "Ты помощник"
+    assert sent[1:] == latest
+    assert "Сообщение номер 0" in engine.requests[0][1]["content"]
+    assert conversation.summary == "краткое содержание"
+    assert rebuilt[1]["role"] == "system"
+    assert "краткое содержание" in rebuilt[1]["content"]
+    assert rebuilt[-1] == sent[-1]
+
+
+def test_summary_is_dropped_when_history_was_reset(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(context_window, "get_engine", lambda: engine)
+    conversation = make_conversation(10)
+    window = ContextWindow(budget=1)
+
+    async def scenario():
+        window.build(conversation)
+        task = conversation.summary_task
+        conversation.messages[1:] = []
+        await task
+
+    asyncio.run(scenario())
+
+    assert conversation.summary == ""
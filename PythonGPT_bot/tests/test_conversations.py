@@ -0,0 +1,68 @@
+import json
+
+from gpt_service import conversations as conversations_module
+from gpt_service.conversations import ConversationStore, rollback_request
+
+
+def test_idle_conversations_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(conversations_module.time, "monotonic", lambda: now[0])
+    store = ConversationStore(ttl=60)
+    store.reset(1, "промпт").add("user", "вопрос")
+    store.get(2)
+
+    now[0] += 30
+    store.get(2)
+    now[0] += 40
+    # Первый диалог простаивал 70 секунд, второй — 40
+    store.get(3)
+
+    assert 1 not in store
+    assert 2 in store
+    assert store.get(1).messages == []
+
+
+def test_least_recent_conversation_is_evicted_over_limit():
+    store = ConversationStore(max_conversations=2)
+    store.get(1)
+    store.get(2)
+    store.get(1)
+    store.get(3)
+
+    assert len(store) == 2
+    assert 1 in store and 3 in store
+    assert 2 not in store
+
+
+def test_snapshot_round_trip():
+    store = ConversationStore()
+    conversation = store.reset(1, "промпт")
+    conversation.add("user", "вопрос")
+    conversation.add("assistant", "ответ")
+    conversation.summary = "кратко"
+
+    snapshot = json.loads(json.dumps(store.snapshot(1)))
+    restored = ConversationStore()
+    restored.restore(1, snapshot)
+
+    assert store.snapshot(2) is None
+    assert restored.get(1).messages == conversation.messages
+    assert restored.get(1).summary == "кратко"
+    # Восстановленная история не связана со снимком
+    snapshot["messages"].append({"role": "user", "content": "еще"})
+    assert len(restored.get(1).messages) == 3
+
+
+def test_rollback_keeps_messages_that_existed_before_request():
+    store = ConversationStore()
+    conversation = store.reset(1, "промпт")
+    conversation.add("user", "старый вопрос")
+    existing = list(conversation.messages)
+    conversation.add("user", "новый вопрос")
+    conversation.add("system", "результаты поиска")
+    # Пока шел запрос, начало истории было свернуто
+    del conversation.messages[1]
+
+    rollback_request(conversation, existing)
+
+    assert conversation.messages == [{"role": "system", "content": "промпт"}]
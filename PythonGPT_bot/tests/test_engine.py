@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+from gpt_service.engine import CompletionEngine
+from gpt_service.streaming import StreamingMessage
+
+
+def make_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    def __init__(self, parts):
+        self.parts = parts
+        self.response = self
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for part in self.parts:
+            # None — модель долго генерирует следующий фрагмент
+            await asyncio.sleep(0 if part is not None else 10)
+            yield make_chunk(part)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.parts = ["раз", "два", "три"]
+        self.streams = []
+
+    async def create(self, stream=False, **kwargs):
+        if stream:
+            self.streams.append(FakeStream(self.parts))
+            return self.streams[-1]
+        await self.release.wait()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ответ"))])
+
+
+def make_engine(max_in_flight=1):
+    engine = CompletionEngine("test", max_in_flight=max_in_flight)
+    completions = FakeCompletions()
+    engine.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return engine, completions
+
+
+def test_requests_over_limit_wait_in_queue():
+    async def scenario():
+        engine, completions = make_engine(max_in_flight=1)
+        tasks = [asyncio.create_task(engine.complete([])) for _ in range(3)]
+        await asyncio.sleep(0)
+        during = engine.stats()
+        completions.release.set()
+        answers = await asyncio.gather(*tasks)
+        after = engine.stats()
+        await engine.close()
+        return during, answers, after
+
+    during, answers, after = asyncio.run(scenario())
+
+    assert during == {"in_flight": 1, "queued": 2, "requests": 1, "waited": 2}
+    assert answers == ["ответ"] * 3
+    assert after == {"in_flight": 0, "queued": 0, "requests": 3, "waited": 2}
+
+
+def test_closed_stream_releases_slot_and_connection():
+    async def scenario():
+        engine, completions = make_engine()
+        stream = engine.stream([])
+        first = await stream.__anext__()
+        during = engine.stats()["in_flight"]
+        await stream.aclose()
+        return first, during, engine.stats()["in_flight"], completions.streams[0].closed
+
+    first, during, after, closed = asyncio.run(scenario())
+
+    assert (first, during, after, closed) == ("раз", 1, 0, True)
+
+
+def test_cancelled_consume_releases_stream_slot():
+    async def scenario():
+        engine, completions = make_engine()
+        completions.parts = ["раз", None]
+        streamer = StreamingMessage(SimpleNamespace(), parse_mode=None)
+        task = asyncio.create_task(streamer.consume(engine.stream([])))
+        await asyncio.sleep(0.01)
+        during = engine.stats()["in_flight"]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Место освобождено сразу, без сборки мусора
+        return during, engine.stats()["in_flight"], completions.streams[0].closed
+
+    assert asyncio.run(scenario()) == (1, 0, True)
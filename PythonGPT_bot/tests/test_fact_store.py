@@ -0,0 +1,115 @@
+import asyncio
+
+from osnov_servis.fact_store import FactStore, build_store
+
+
+def make_store(tmp_path, facts):
+    seed = tmp_path / "facts.txt"
+    seed.write_text("\n".join(facts), encoding="utf-8")
+    return FactStore(str(tmp_path / "facts.bin"), str(tmp_path / "facts.idx"), str(seed))
+
+
+def test_build_store_skips_empty_lines_and_duplicates(tmp_path):
+    count = build_store(["Факт один", "", "  факт   ОДИН ", "Факт два"],
+                        str(tmp_path / "facts.bin"), str(tmp_path / "facts.idx"))
+
+    assert count == 2
+
+
+def test_get_reads_facts_by_number(tmp_path):
+    store = make_store(tmp_path, ["Первый", "Второй — с юникодом ✨", "Третий"])
+
+    assert len(store) == 3
+    assert store.get(1) == "Второй — с юникодом ✨"
+    store.close()
+
+
+def test_user_sees_every_fact_before_repeats(tmp_path):
+    facts = [f"Факт {number}" for number in range(300)]
+    store = make_store(tmp_path, facts)
+
+    first_round = [store.random_fact(user_id=1) for _ in range(300)]
+    next_fact = store.random_fact(user_id=1)
+
+    assert sorted(first_round) == sorted(facts)
+    assert next_fact in facts
+    store.close()
+
+
+def test_few_seen_facts_are_kept_sparse(tmp_path):
+    store = make_store(tmp_path, [f"Факт {number}" for number in range(100000)])
+
+    for _ in range(10):
+        store.random_fact(user_id=1)
+    assert isinstance(store._seen[1], set)
+
+    for _ in range(400):
+        store.random_fact(user_id=1)
+    # 410 номеров во множестве заняли бы больше, чем маска на 100 000 фактов
+    assert isinstance(store._seen[1], bytearray)
+    assert len(store._seen[1]) == 12500
+    store.close()
+
+
+def test_least_recent_users_are_forgotten(tmp_path):
+    seed = tmp_path / "facts.txt"
+    seed.write_text("А\nБ\nВ", encoding="utf-8")
+    store = FactStore(str(tmp_path / "facts.bin"), str(tmp_path / "facts.idx"), str(seed), max_users=2)
+
+    for user_id in (1, 2, 1, 3):
+        store.random_fact(user_id)
+
+    assert list(store._seen) == [1, 3]
+    store.close()
+
+
+def test_grow_appends_new_facts_and_extends_masks(tmp_path):
+    store = make_store(tmp_path, [f"Факт {number}" for number in range(16)])
+    for _ in range(16):
+        store.random_fact(user_id=1)
+
+    async def generator(count):
+        return ["Новый факт", "факт 3", "Новый  ФАКТ", "Еще один факт"]
+
+    added = asyncio.run(store.grow(generator))
+
+    assert added == 2
+    assert len(store) == 18
+    # Новые факты пользователь еще не видел
+    assert {store.random_fact(user_id=1) for _ in range(2)} == {"Новый факт", "Еще один факт"}
+    store.close()
+
+    reopened = FactStore(store.data_path, store.index_path)
+    assert reopened.get(17) == "Еще один факт"
+    reopened.close()
+
+
+def test_bytes_left_by_interrupted_append_are_dropped(tmp_path):
+    store = make_store(tmp_path, ["один", "два"])
+    # Процесс упал после записи текстов, но до записи индекса
+    with open(store.data_path, "ab") as data:
+        data.write("мусор".encode("utf-8"))
+    with open(store.index_path, "ab") as index:
+        index.write(b"\x01\x02")
+
+    assert store.add(["три"]) == 1
+    assert [store.get(number) for number in range(store.count)] == ["один", "два", "три"]
+    store.close()
+
+
+def test_failed_append_does_not_remember_facts(tmp_path, monkeypatch):
+    store = make_store(tmp_path, ["один"])
+
+    def failing_append(encoded):
+        raise OSError("диск заполнен")
+
+    monkeypatch.setattr(store, "_append", failing_append)
+    try:
+        store.add(["два"])
+    except OSError:
+        pass
+    monkeypatch.undo()
+
+    assert store.add(["два", "два"]) == 1
+    assert store.count == 2
+    store.close()
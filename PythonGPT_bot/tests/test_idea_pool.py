@@ -0,0 +1,98 @@
+import asyncio
+
+from osnov_servis import idea_pool as idea_pool_module
+from osnov_servis.idea_pool import IdeaPool
+
+
+def make_pool(**kwargs) -> IdeaPool:
+    async def generator(category):
+        return None
+
+    return IdeaPool(generator, **kwargs)
+
+
+def test_user_does_not_see_idea_twice():
+    async def scenario():
+        pool = make_pool(size=10, low_water=0)
+        for number in range(3):
+            pool.add("it", f"идея {number}")
+        first = [pool.next_idea("it", 1) for _ in range(4)]
+        second = pool.next_idea("it", 2)
+        pool.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    # Пользователь проходит пул по порядку, каждую идею один раз
+    assert first == ["идея 0", "идея 1", "идея 2", None]
+    # Позиция у каждого пользователя своя
+    assert second == "идея 0"
+
+
+def test_stale_ideas_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(idea_pool_module.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        pool = make_pool(max_age=60, low_water=0)
+        pool.add("it", "старая идея")
+        now[0] += 61
+        pool.add("it", "новая идея")
+        ideas = [pool.next_idea("it", 1), pool.next_idea("it", 1)]
+        pool.close()
+        return ideas, pool.stats()["ideas"]
+
+    ideas, total = asyncio.run(scenario())
+
+    assert ideas == ["новая идея", None]
+    assert total == 1
+
+
+def test_duplicates_are_not_added():
+    pool = make_pool()
+
+    assert pool.add("it", "Сервис доставки") is not None
+    assert pool.add("it", "  сервис   ДОСТАВКИ ") is None
+    assert pool.add("retail", "Сервис доставки") is not None
+    assert pool.add("it", "   ") is None
+
+
+def test_pool_is_capped_at_twice_the_size():
+    pool = make_pool(size=3)
+    for number in range(10):
+        pool.add("it", f"идея {number}")
+
+    assert pool.stats()["ideas"] == 6
+    # Вытесненная идея может быть добавлена снова
+    assert pool.add("it", "идея 0") is not None
+
+
+def test_miss_generates_once_and_refills_afterwards():
+    calls = []
+
+    async def generator(category):
+        calls.append("refill")
+        return f"идея {len(calls)}"
+
+    async def streamer(category):
+        calls.append("stream")
+        yield "новая "
+        yield "идея"
+
+    async def scenario():
+        pool = IdeaPool(generator, streamer, size=2, concurrency=1)
+        assert pool.next_idea("it", 1) is None
+        # Пока идет потоковая генерация, пополнение не запускается
+        assert calls == []
+        text = "".join([delta async for delta in pool.stream_new("it", 1)])
+        await asyncio.gather(*pool._refills.values())
+        return text, pool.stats()
+
+    text, stats = asyncio.run(scenario())
+
+    assert text == "новая идея"
+    assert calls[0] == "stream"
+    assert calls.count("refill") >= 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.0
+    assert stats["latency_p50"] >= 0.0
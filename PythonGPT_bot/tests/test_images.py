@@ -0,0 +1,83 @@
+import asyncio
+from io import BytesIO
+
+from PIL import Image
+
+from gpt_service import gpt as gpt_module
+from gpt_service.conversations import ConversationStore
+from gpt_service.images import ImagePipeline, prepare_image
+
+
+class RecordingEngine:
+    def __init__(self):
+        self.requests = []
+
+    async def complete(self, messages, **kwargs):
+        self.requests.append(messages)
+        return f"ответ {len(self.requests)}"
+
+
+def make_image(width, height):
+    output = BytesIO()
+    Image.new("RGBA", (width, height), (255, 0, 0, 128)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_prepare_image_downscales_to_jpeg():
+    jpeg = prepare_image(make_image(3000, 1500), max_edge=1024)
+
+    with Image.open(BytesIO(jpeg)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (1024, 512)
+
+
+def setup_gpt(monkeypatch, single_call):
+    engine = RecordingEngine()
+    pipeline = ImagePipeline()
+
+    async def fake_base64(image_url, image_key=None):
+        return image_key, "aW1hZ2U="
+
+    async def no_search(text):
+        return None
+
+    monkeypatch.setattr(gpt_module, "MULTIMODAL_SINGLE_CALL", single_call)
+    monkeypatch.setattr(gpt_module, "image_pipeline", pipeline)
+    monkeypatch.setattr(gpt_module, "conversations", ConversationStore())
+    monkeypatch.setattr(gpt_module, "get_engine", lambda: engine)
+    monkeypatch.setattr(gpt_module, "get_image_base64", fake_base64)
+    monkeypatch.setattr(gpt_module, "fetch_search_context", no_search)
+    return engine, pipeline
+
+
+def test_answers_are_not_cached_as_image_descriptions(monkeypatch):
+    engine, pipeline = setup_gpt(monkeypatch, single_call=True)
+
+    async def scenario():
+        await gpt_module.gpt("Что не так с моим кодом?", "url", chat_id=1, image_key="photo")
+        await gpt_module.gpt("Переведи текст", "url", chat_id=2, image_key="photo")
+
+    asyncio.run(scenario())
+
+    assert pipeline.get_description("photo") is None
+    second_request = engine.requests[1]
+    assert "Что не так" not in str(second_request)
+    assert "ответ 1" not in str(second_request)
+
+
+def test_neutral_description_is_shared_between_chats(monkeypatch):
+    engine, pipeline = setup_gpt(monkeypatch, single_call=False)
+
+    async def scenario():
+        await gpt_module.gpt("Что не так с моим кодом?", "url", chat_id=1, image_key="photo")
+        await gpt_module.gpt("Переведи текст", "url", chat_id=2, image_key="photo")
+
+    asyncio.run(scenario())
+
+    # Одно описание по DESCRIBE_PROMPT и два ответа текстовой модели
+    assert len(engine.requests) == 3
+    assert gpt_module.DESCRIBE_PROMPT in str(engine.requests[0])
+    assert pipeline.get_description("photo") == "ответ 1"
+    second_answer_request = engine.requests[2]
+    assert "Что не так" not in str(second_answer_request)
+    assert "Переведи текст" in second_answer_request[-1]["content"]
@@ -0,0 +1,65 @@
+import asyncio
+import os
+
+from media import MediaRegistry
+
+
+def write_image(directory, name, content):
+    path = os.path.join(directory, name + ".jpg")
+    with open(path, "wb") as file:
+        file.write(content)
+    return path
+
+
+def make_registry(tmp_path, names):
+    images = tmp_path / "images"
+    images.mkdir()
+    registry = MediaRegistry(str(tmp_path / "index.json"), str(images))
+    for name in names:
+        path = write_image(str(images), name, name.encode() * 10)
+        stat = os.stat(path)
+        registry._index[f"1:{name}"] = {
+            "file_id": f"id-{name}", "mtime": stat.st_mtime_ns, "size": stat.st_size, "sha1": ""
+        }
+    return registry, str(images)
+
+
+def test_validate_drops_changed_and_missing_images(tmp_path):
+    registry, images = make_registry(tmp_path, ["gpt", "talk", "quiz"])
+    os.remove(os.path.join(images, "talk.jpg"))
+    write_image(images, "quiz", b"new content")
+
+    assert registry.validate() == 2
+    assert list(registry._index) == ["1:gpt"]
+    assert MediaRegistry(str(tmp_path / "index.json"), images)._index.keys() == {"1:gpt"}
+
+
+def test_entry_replaced_during_check_is_kept(tmp_path):
+    registry, images = make_registry(tmp_path, ["gpt"])
+    write_image(images, "gpt", b"changed")
+    index = dict(registry._index)
+    stale, touched = registry._check(index)
+
+    # Пока шла проверка, send_photo загрузил изображение заново
+    fresh = {"file_id": "id-new", "mtime": 0, "size": 7, "sha1": ""}
+    registry._index["1:gpt"] = fresh
+
+    assert registry._apply(index, stale, touched) == 0
+    assert registry._index["1:gpt"] is fresh
+
+
+def test_watch_applies_changes_on_event_loop(tmp_path):
+    registry, images = make_registry(tmp_path, ["gpt"])
+    os.remove(os.path.join(images, "gpt.jpg"))
+
+    async def scenario():
+        task = asyncio.create_task(registry.watch(interval=0.01))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not registry._index:
+                break
+        task.cancel()
+
+    asyncio.run(scenario())
+
+    assert registry._index == {}
@@ -0,0 +1,80 @@
+import asyncio
+
+from osnov_servis.session import Mode, SessionStore
+from persistence import SQLitePersistence
+
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    sessions = SessionStore()
+    session = sessions.enter(5, Mode.TALK)
+    session.persona = "talk_hardy"
+
+    async def save():
+        persistence = SQLitePersistence(path, sessions=sessions)
+        await persistence.get_user_data()
+        await persistence.update_user_data(1, {"quiz_score": 3, "current_question": {"id": 7}})
+        await persistence.update_user_data(2, {"quiz_score": 1})
+        await persistence.update_chat_data(5, {"note": "x"})
+        await persistence.update_conversation("quiz_conversation", (5, 1), 1)
+        await persistence.update_conversation("quiz_conversation", (6, 2), 0)
+        await persistence.drop_user_data(2)
+        await persistence.update_conversation("quiz_conversation", (6, 2), None)
+        await persistence.flush()
+
+    async def load(restored_sessions):
+        persistence = SQLitePersistence(path, sessions=restored_sessions)
+        result = (
+            await persistence.get_user_data(),
+            await persistence.get_chat_data(),
+            await persistence.get_conversations("quiz_conversation")
+        )
+        await persistence.flush()
+        return result
+
+    asyncio.run(save())
+    restored = SessionStore()
+    users, chats, conversations = asyncio.run(load(restored))
+
+    assert users == {1: {"quiz_score": 3, "current_question": {"id": 7}}}
+    assert chats == {5: {"note": "x"}}
+    assert conversations == {(5, 1): 1}
+    assert restored.snapshot(5) == ("talk", "talk_hardy", None)
+
+
+def test_changes_in_one_interval_are_written_together(tmp_path):
+    async def scenario():
+        persistence = SQLitePersistence(str(tmp_path / "state.sqlite3"))
+        for user_id in range(50):
+            await persistence.update_user_data(user_id, {"n": user_id})
+        await persistence._flush_task
+        stats = persistence.stats()
+        await persistence.flush()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert stats["flushes"] == 1
+    assert stats["rows_written"] == 50
+
+
+def test_failed_write_keeps_newer_changes(tmp_path):
+    async def scenario():
+        persistence = SQLitePersistence(str(tmp_path / "state.sqlite3"))
+        write = persistence._write
+
+        def failing_write(*args):
+            persistence._write = write
+            raise OSError("диск занят")
+
+        persistence._write = failing_write
+        await persistence.update_user_data(1, {"version": 1})
+        await persistence._flush_task
+        await persistence.update_user_data(1, {"version": 2})
+        await persistence._flush_task
+        return persistence
+
+    persistence = asyncio.run(scenario())
+
+    restarted = SQLitePersistence(persistence.path)
+    assert asyncio.run(restarted.get_user_data()) == {1: {"version": 2}}
@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from osnov_servis.question_bank import QuestionBank, validate_question
+
+
+def make_record(number, topic="science"):
+    return {
+        "question": f"Вопрос {number} по теме {topic}?",
+        "options": [f"Вариант {number}-{index}" for index in range(4)],
+        "correct": number % 4,
+        "explanation": "Объяснение.",
+        "fun_fact": "Факт."
+    }
+
+
+def make_generator():
+    counter = itertools.count()
+
+    async def generate(topic):
+        return make_record(next(counter), topic)
+
+    return generate
+
+
+def test_add_skips_duplicates_ignoring_case_and_spaces(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"))
+    record = make_record(1)
+    duplicate = dict(record, question="  вопрос 1 ПО теме science? ", options=list(reversed(record["options"])))
+
+    assert bank.add("science", record) is not None
+    assert bank.add("science", duplicate) is None
+    assert bank.count("science") == 1
+    bank.close()
+
+
+def test_next_question_does_not_repeat_for_user(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"), low_water=0)
+    for number in range(3):
+        bank.add("science", make_record(number))
+
+    seen = [bank.next_question("science", user_id=1)["id"] for _ in range(3)]
+
+    assert len(set(seen)) == 3
+    assert bank.next_question("science", user_id=1) is None
+    assert bank.next_question("science", user_id=2)["id"] == seen[0]
+    bank.close()
+
+
+def test_take_generates_when_bank_is_empty_and_refills_in_background(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"), generator=make_generator(), low_water=2, batch=5)
+
+    async def scenario():
+        record = await bank.take("history", user_id=1)
+        await asyncio.gather(*bank._refills.values())
+        return record
+
+    record = asyncio.run(scenario())
+
+    assert record["id"] is not None
+    assert bank.count("history") == 6
+    assert bank.unseen_count("history", 1) == 5
+    bank.close()
+
+
+def test_schema_version_change_rebuilds_bank(tmp_path):
+    path = str(tmp_path / "bank.sqlite3")
+    bank = QuestionBank(path)
+    bank.add("science", make_record(1))
+    bank._db.execute("PRAGMA user_version = 1")
+    bank.close()
+
+    assert QuestionBank(path).count("science") == 0
+
+
+def test_validate_question_normalizes_record():
+    data = dict(make_record(2), question="  Вопрос?  ", extra="лишнее поле")
+
+    record = validate_question(data)
+
+    assert record["question"] == "Вопрос?"
+    assert "extra" not in record
+    assert record["correct"] == 2
+
+
+@pytest.mark.parametrize("change", [
+    {"options": ["a", "b", "c"]},
+    {"options": ["a", "b", "c", "A"]},
+    {"options": ["a", "b", "c", " "]},
+    {"correct": 4},
+    {"correct": True},
+    {"correct": "1"},
+    {"explanation": ""},
+    {"question": None},
+])
+def test_validate_question_rejects_invalid_fields(change):
+    with pytest.raises(ValueError):
+        validate_question(dict(make_record(1), **change))
+
+
+def test_validate_question_rejects_missing_fields():
+    record = make_record(1)
+    del record["fun_fact"]
+
+    with pytest.raises(ValueError, match="fun_fact"):
+        validate_question(record)
+
+
+def test_generated_question_comes_from_tool_call(monkeypatch):
+    from osnov_servis import quiz
+
+    def response(arguments):
+        call = SimpleNamespace(function=SimpleNamespace(arguments=arguments))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(tool_calls=[call]))])
+
+    class FakeEngine:
+        def __init__(self, arguments):
+            self.arguments = arguments
+
+        async def create(self, messages, **kwargs):
+            assert kwargs["tool_choice"]["function"]["name"] == "save_quiz_question"
+            return response(self.arguments)
+
+    monkeypatch.setattr(quiz, "get_engine", lambda: FakeEngine(json.dumps(make_record(3), ensure_ascii=False)))
+    assert asyncio.run(quiz.generate_quiz_question("science"))["correct"] == 3
+
+    monkeypatch.setattr(quiz, "get_engine", lambda: FakeEngine("{не json"))
+    assert asyncio.run(quiz.generate_quiz_question("science")) is None
+
+
+def test_prefetched_duplicate_is_marked_seen(tmp_path, monkeypatch):
+    from osnov_servis import quiz
+
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"))
+    existing = bank.add("science", make_record(1))
+    bank.add("science", make_record(2))
+
+    class Prefetcher:
+        def __init__(self):
+            self.records = [make_record(1), make_record(1)]
+
+        async def claim(self, chat_id, topic):
+            return self.records.pop(0)
+
+        def schedule(self, chat_id, user_id, topic):
+            pass
+
+    monkeypatch.setattr(quiz, "question_bank", bank)
+    monkeypatch.setattr(quiz, "prefetcher", Prefetcher())
+    query = SimpleNamespace(message=SimpleNamespace(chat_id=5), from_user=SimpleNamespace(id=7))
+
+    first = asyncio.run(quiz.get_question(query, "science", {}))
+    # Тот же вопрос предзагружен снова: пользователь получает другой из банка
+    second = asyncio.run(quiz.get_question(query, "science", {}))
+
+    assert first["id"] == existing
+    assert second["question"] == make_record(2)["question"]
+    assert not bank.has_unseen("science", 7)
+    bank.close()
@@ -0,0 +1,85 @@
+import asyncio
+
+from osnov_servis.question_bank import QuestionBank
+from osnov_servis.quiz_prefetch import QuizPrefetcher
+
+
+def make_record(number):
+    return {
+        "question": f"Вопрос {number}?",
+        "options": [f"Вариант {number}-{index}" for index in range(4)],
+        "correct": 0,
+        "explanation": "Объяснение.",
+        "fun_fact": "Факт."
+    }
+
+
+def make_bank(tmp_path, delay=0.0, records=None):
+    numbers = iter(records or range(100))
+
+    async def generate(topic):
+        await asyncio.sleep(delay)
+        return make_record(next(numbers))
+
+    return QuestionBank(str(tmp_path / "bank.sqlite3"), generator=generate)
+
+
+def test_claimed_prefetch_is_a_hit(tmp_path):
+    prefetcher = QuizPrefetcher(make_bank(tmp_path))
+
+    async def scenario():
+        prefetcher.schedule(1, 1, "science")
+        return await prefetcher.claim(1, "science")
+
+    assert asyncio.run(scenario())["question"] == "Вопрос 0?"
+    assert prefetcher.stats()["hits"] == 1
+
+
+def test_finished_prefetch_goes_to_bank_on_topic_change(tmp_path):
+    bank = make_bank(tmp_path)
+    prefetcher = QuizPrefetcher(bank)
+
+    async def scenario():
+        prefetcher.schedule(1, 1, "science")
+        await asyncio.sleep(0.01)
+        prefetcher.schedule(1, 1, "history")
+        prefetcher.close()
+
+    asyncio.run(scenario())
+
+    stats = prefetcher.stats()
+    assert bank.count("science") == 1
+    assert stats["banked"] == 1
+    assert stats["wasted"] == 1
+    assert stats["wasted_tokens"] == 0
+
+
+def test_duplicate_prefetch_counts_wasted_tokens(tmp_path):
+    bank = make_bank(tmp_path, records=[7])
+    bank.add("science", make_record(7))
+    prefetcher = QuizPrefetcher(bank)
+
+    async def scenario():
+        bank.mark_seen(1, 1)
+        prefetcher.schedule(1, 1, "science")
+        await asyncio.sleep(0.01)
+        prefetcher.cancel(1)
+
+    asyncio.run(scenario())
+
+    assert prefetcher.stats()["wasted"] == 1
+    assert prefetcher.stats()["wasted_tokens"] > 0
+
+
+def test_expired_prefetch_is_banked(tmp_path):
+    bank = make_bank(tmp_path)
+    prefetcher = QuizPrefetcher(bank, ttl=0.02)
+
+    async def scenario():
+        prefetcher.schedule(1, 1, "science")
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+
+    assert bank.count("science") == 1
+    assert prefetcher.stats()["pending"] == 0
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from osnov_servis.router import ModeFilter, ModeRouter
+from osnov_servis.session import Mode, SessionStore
+
+
+def text_update(chat_id, text="A"):
+    chat = Chat(chat_id, "private")
+    return Update(1, message=Message(1, datetime.now(), chat, from_user=User(chat_id, "u", False), text=text))
+
+
+def test_mode_filter_matches_only_active_mode():
+    sessions = SessionStore()
+    quiz_filter = ModeFilter(sessions, Mode.QUIZ)
+
+    assert not quiz_filter.check_update(text_update(1))
+    assert 1 not in sessions._sessions
+
+    sessions.enter(1, Mode.QUIZ)
+    assert quiz_filter.check_update(text_update(1))
+
+    sessions.enter(1, Mode.TALK)
+    assert not quiz_filter.check_update(text_update(1))
+
+
+def test_router_dispatches_by_mode_and_kind():
+    sessions = SessionStore()
+    router = ModeRouter(sessions)
+    calls = []
+
+    def handler(name):
+        async def handle(update, context):
+            calls.append(name)
+        return handle
+
+    router.register(Mode.GPT, text=handler("gpt"))
+    router.register(Mode.TALK, text=handler("talk"))
+    router.set_default(handler("default"))
+
+    async def scenario():
+        await router.dispatch(text_update(1), None)
+        sessions.enter(1, Mode.GPT)
+        await router.dispatch(text_update(1), None)
+        sessions.enter(1, Mode.TALK)
+        await router.dispatch(text_update(1), None)
+
+    asyncio.run(scenario())
+
+    assert calls == ["default", "gpt", "talk"]
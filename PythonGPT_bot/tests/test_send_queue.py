@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from send_queue import PRIORITY_FINAL, PRIORITY_STATUS, SendQueue, TokenBucket
+
+
+def test_bucket_allows_burst_then_limits_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=3)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+
+    # 3 токена сразу, еще 2 — по 1/20 с
+    assert 0.08 <= elapsed < 0.5
+
+
+def test_bucket_serves_higher_priority_first():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=1)
+        await bucket.acquire()
+        order = []
+
+        async def take(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        await asyncio.gather(take("status", PRIORITY_STATUS), take("final", PRIORITY_FINAL))
+        return order
+
+    assert asyncio.run(scenario()) == ["final", "status"]
+
+
+def test_pause_blocks_tokens():
+    async def scenario():
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.1)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.09
+
+
+def make_callback(results):
+    calls = []
+
+    async def callback(*args, **kwargs):
+        calls.append(time.monotonic())
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return callback, calls
+
+
+def test_retry_after_pauses_whole_bot():
+    async def scenario():
+        queue = SendQueue(global_rate=1000, chat_rate=1000, chat_burst=10)
+        await queue.initialize()
+        flooded, _ = make_callback([RetryAfter(0.2), {"ok": 1}])
+        other, other_calls = make_callback([{"ok": 2}])
+        started = time.monotonic()
+        first = asyncio.create_task(queue.process_request(flooded, (), {}, "sendMessage", {"chat_id": 1}, None))
+        await asyncio.sleep(0.05)
+        second = await queue.process_request(other, (), {}, "sendMessage", {"chat_id": 2}, None)
+        return await first, second, other_calls[0] - started, queue.retries
+
+    first, second, other_delay, retries = asyncio.run(scenario())
+
+    assert first == {"ok": 1} and second == {"ok": 2}
+    assert other_delay >= 0.19
+    assert retries == 1
+
+
+def test_requests_without_chat_respect_pause():
+    async def scenario():
+        queue = SendQueue()
+        await queue.initialize()
+        callback, calls = make_callback([RetryAfter(0.1), True])
+        started = time.monotonic()
+        result = await queue.process_request(callback, (), {}, "answerCallbackQuery", {}, None)
+        return result, calls[1] - started
+
+    result, delay = asyncio.run(scenario())
+
+    assert result is True
+    assert delay >= 0.09
+
+
+def test_pending_edits_of_one_message_are_merged():
+    async def scenario():
+        queue = SendQueue(global_rate=1000, chat_rate=1, chat_burst=1)
+        await queue.initialize()
+        sent = []
+
+        def edit(text):
+            async def callback(*args, **kwargs):
+                sent.append(text)
+                return text
+            data = {"chat_id": 1, "message_id": 5}
+            return queue.process_request(callback, (), {}, "editMessageText", data, None)
+
+        # Первая правка забирает единственный токен, две следующие ждут
+        results = await asyncio.gather(edit("a"), edit("b"), edit("c"))
+        return results, sent, queue.merged
+
+    results, sent, merged = asyncio.run(scenario())
+
+    assert sent == ["a", "c"]
+    assert results == ["a", "c", "c"]
+    assert merged == 1
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import queue
+
+from telegram import Update
+
+from sharding import ShardRouter
+from update_log import UpdateLog
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "text": str(update_id)
+        }
+    }, None)
+
+
+def ids(worker_queue: queue.Queue) -> list:
+    result = []
+    while not worker_queue.empty():
+        result.append(json.loads(worker_queue.get_nowait())["update_id"])
+    return result
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_full_worker_queue_does_not_block_other_shards(tmp_path):
+    async def scenario():
+        journal = UpdateLog(str(tmp_path / "ingress.sqlite3"))
+        # Первый обработчик завис: в его очередь помещается только одно обновление
+        queues = [queue.Queue(1), queue.Queue()]
+        router = ShardRouter(queues, journal, buffer_size=2)
+        router.start()
+        for update_id in range(1, 9):
+            await router.route(make_update(update_id, update_id % 2))
+        await settle()
+        others = ids(queues[1])
+
+        # Обработчик ожил: обновления из журнала дочитываются по порядку
+        stalled = []
+        while len(stalled) < 4:
+            if not queues[0].empty():
+                update_id = json.loads(queues[0].get_nowait())["update_id"]
+                stalled.append(update_id)
+                router.acknowledge(update_id)
+            await asyncio.sleep(0.01)
+        await router.close()
+        return others, stalled
+
+    others, stalled = asyncio.run(scenario())
+
+    assert others == [1, 3, 5, 7]
+    assert stalled == [2, 4, 6, 8]
+
+
+def test_unacknowledged_updates_are_resent(tmp_path):
+    path = str(tmp_path / "ingress.sqlite3")
+
+    async def first_run():
+        journal = UpdateLog(path)
+        worker_queue = queue.Queue()
+        router = ShardRouter([worker_queue], journal)
+        router.start()
+        for update_id in (1, 2, 3):
+            await router.route(make_update(update_id, 7))
+        # Повтор от Telegram в журнал не попадает
+        await router.route(make_update(2, 7))
+        await settle()
+        sent = ids(worker_queue)
+        router.acknowledge(1)
+
+        # Обработчик упал, не записав обновления 2 и 3: после перезапуска они передаются снова
+        router.restart(0)
+        await settle()
+        resent = ids(worker_queue)
+        router.acknowledge(2)
+        await router.close()
+        journal.close()
+        return sent, resent
+
+    async def second_run():
+        # Процесс приема перезапущен: неподтвержденное обновление дочитывается из журнала
+        worker_queue = queue.Queue()
+        router = ShardRouter([worker_queue], UpdateLog(path))
+        router.start()
+        await settle()
+        await router.close()
+        return ids(worker_queue)
+
+    sent, resent = asyncio.run(first_run())
+
+    assert sent == [1, 2, 3]
+    assert resent == [2, 3]
+    assert asyncio.run(second_run()) == [3]
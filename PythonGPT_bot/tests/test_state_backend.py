@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from telegram import Update
+from telegram.ext import CommandHandler, ConversationHandler
+
+from state_backend import ConversationStates, InMemoryBackend, RedisBackend, SharedState, StateBackend, StateSlot, chat_key
+
+ANSWERING = 1
+
+
+def make_update(update_id: int, chat_id: int = 10, user_id: int = 20) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "text": "ответ"
+        }
+    }, None)
+
+
+class Replica:
+    """Локальные хранилища одной реплики бота"""
+
+    def __init__(self, backend: StateBackend):
+        async def callback(update, context):
+            return ANSWERING
+
+        self.sessions = {}
+        self.quiz = ConversationHandler(
+            entry_points=[CommandHandler("quiz", callback)],
+            states={ANSWERING: [CommandHandler("quiz", callback)]},
+            fallbacks=[],
+            name="quiz_conversation"
+        )
+        conversations = ConversationStates([self.quiz])
+        self.state = SharedState(backend)
+        self.state.register(StateSlot("session", chat_key, self.sessions.get, self.sessions.__setitem__))
+        self.state.register(StateSlot("conversation", ConversationStates.key_of,
+                                      conversations.snapshot, conversations.restore))
+
+    async def process(self, update: Update, change):
+        keys = await self.state.load(update)
+        change(self)
+        self.state.save(keys)
+        await self.state.flush()
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StateBackend()
+
+
+def test_conversation_started_on_one_replica_continues_on_another():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        first = Replica(RedisBackend(client=fakeredis.FakeAsyncRedis(server=server)))
+        second = Replica(RedisBackend(client=fakeredis.FakeAsyncRedis(server=server)))
+
+        def start_quiz(replica):
+            replica.sessions[10] = ["quiz", None, None]
+            replica.quiz._conversations[(10, 20)] = ANSWERING
+
+        def end_quiz(replica):
+            replica.sessions[10] = ["menu", None, None]
+            del replica.quiz._conversations[(10, 20)]
+
+        await first.process(make_update(1), start_quiz)
+        observed = {}
+        await second.process(make_update(2), lambda replica: observed.update(
+            session=replica.sessions.get(10), state=replica.quiz._conversations.get((10, 20))))
+        await second.process(make_update(3), end_quiz)
+        await first.process(make_update(4), lambda replica: None)
+        await first.state.close()
+        await second.state.close()
+        return observed, first
+
+    observed, first = asyncio.run(scenario())
+
+    assert observed == {"session": ["quiz", None, None], "state": ANSWERING}
+    # Завершение разговора на второй реплике видно первой
+    assert first.sessions[10] == ["menu", None, None]
+    assert (10, 20) not in first.quiz._conversations
+
+
+def test_unchanged_state_is_not_written_again():
+    async def scenario():
+        replica = Replica(InMemoryBackend())
+        await replica.process(make_update(1), lambda r: r.sessions.__setitem__(10, ["gpt", None, None]))
+        written = replica.state.round_trips
+        await replica.process(make_update(2), lambda r: None)
+        return written, replica.state.round_trips
+
+    written, total = asyncio.run(scenario())
+
+    # Второе обновление только читает состояние
+    assert total == written + 1
@@ -0,0 +1,155 @@
+import asyncio
+
+from gpt_service import gpt as gpt_module
+from gpt_service import gpt_class
+from gpt_service import streaming
+from gpt_service.conversations import ConversationStore
+from gpt_service.streaming import EMPTY_ANSWER, StreamingMessage
+
+
+class FakeBot:
+    rate_limiter = None
+
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+class FakeMessage:
+    chat_id = 1
+    message_id = 10
+
+    def __init__(self):
+        self.bot = FakeBot()
+
+    def get_bot(self):
+        return self.bot
+
+
+async def chunks(parts, delay=0.0):
+    for part in parts:
+        await asyncio.sleep(delay)
+        yield part
+
+
+def test_disabled_streaming_makes_only_final_edit(monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_RESPONSES", False)
+    message = FakeMessage()
+    streamer = StreamingMessage(message, parse_mode=None)
+
+    text = asyncio.run(streamer.consume(chunks(["x" * 50, "y" * 50])))
+
+    assert text == "x" * 50 + "y" * 50
+    assert message.bot.edits == [text]
+
+
+def test_intermediate_edits_wait_for_interval():
+    message = FakeMessage()
+    streamer = StreamingMessage(message, parse_mode=None, interval=0.05)
+
+    asyncio.run(streamer.consume(chunks(["x" * 30] * 4, delay=0.03)))
+
+    assert 1 < len(message.bot.edits) < 5
+    assert message.bot.edits[-1] == "x" * 120
+
+
+def test_empty_answer_is_replaced():
+    message = FakeMessage()
+    streamer = StreamingMessage(message, parse_mode=None)
+
+    asyncio.run(streamer.consume(chunks([])))
+
+    assert message.bot.edits == [EMPTY_ANSWER]
+
+
+def test_failed_stream_removes_question_from_history(monkeypatch):
+    store = ConversationStore()
+    conversation = store.reset(1, "Ты помощник")
+    conversation.add("user", "старый вопрос")
+    conversation.add("assistant", "старый ответ")
+    before = list(conversation.messages)
+
+    class FailingEngine:
+        async def stream(self, messages, **kwargs):
+            yield "нача"
+            raise RuntimeError("обрыв соединения")
+
+    async def no_search(text):
+        return None
+
+    monkeypatch.setattr(gpt_module, "conversations", store)
+    monkeypatch.setattr(gpt_module, "get_engine", lambda: FailingEngine())
+    monkeypatch.setattr(gpt_module, "fetch_search_context", no_search)
+
+    async def scenario():
+        async for _ in gpt_module.gpt_stream("новый вопрос", chat_id=1):
+            pass
+
+    try:
+        asyncio.run(scenario())
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("ошибка потока должна передаваться вызывающему")
+
+    assert conversation.messages == before
+
+
+def test_empty_answer_is_not_stored(monkeypatch):
+    store = ConversationStore()
+    conversation = store.reset(1, "Ты помощник")
+    before = list(conversation.messages)
+
+    class EmptyEngine:
+        async def complete(self, messages, **kwargs):
+            return None
+
+        async def stream(self, messages, **kwargs):
+            return
+            yield
+
+    async def no_search(text):
+        return None
+
+    monkeypatch.setattr(gpt_module, "conversations", store)
+    monkeypatch.setattr(gpt_module, "get_engine", lambda: EmptyEngine())
+    monkeypatch.setattr(gpt_module, "fetch_search_context", no_search)
+
+    async def scenario():
+        answer = await gpt_module.gpt("вопрос", chat_id=1)
+        async for _ in gpt_module.gpt_stream("вопрос", chat_id=1):
+            pass
+        return answer
+
+    assert asyncio.run(scenario()) == EMPTY_ANSWER
+    assert conversation.messages == before
+
+
+def test_talk_stream_rolls_back_on_cancel(monkeypatch):
+    service = gpt_class.ChatGptService("test")
+    conversation = service.conversations.reset(1, "Ты персонаж")
+    before = list(conversation.messages)
+
+    class SlowEngine:
+        async def stream(self, messages, **kwargs):
+            yield "Прив"
+            await asyncio.sleep(10)
+            yield "ет"
+
+    monkeypatch.setattr(gpt_class, "get_engine", lambda: SlowEngine())
+
+    async def scenario():
+        async def consume():
+            async for _ in service.stream_message(1, "привет"):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert conversation.messages == before
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from gpt_service.stt import FakeSpeechBackend, SpeechBackend
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SpeechBackend()
+
+
+def test_fake_backend_collects_stats():
+    backend = FakeSpeechBackend()
+    pcm = b"\x01\x00" * 16000
+
+    async def scenario():
+        return await backend.recognize(pcm, 16000, 2), await backend.recognize(pcm, 16000, 2)
+
+    first, second = asyncio.run(scenario())
+
+    assert first == second
+    assert first in FakeSpeechBackend.PHRASES
+    stats = backend.stats()
+    assert stats["calls"] == 2
+    assert stats["audio_seconds"] == 2.0
+    assert stats["errors"] == 0
+
+
+def test_stats_are_logged_on_close(monkeypatch, caplog):
+    from gpt_service import stt
+
+    monkeypatch.setattr(stt, "STT_BACKEND", "fake")
+    monkeypatch.setattr(stt, "_backend", None)
+    asyncio.run(stt.get_speech_backend().recognize(b"\x00\x00" * 16000, 16000, 2))
+
+    with caplog.at_level("INFO", logger=stt.__name__):
+        stt.close_speech_backend()
+
+    assert "'backend': 'fake'" in caplog.text
+    assert "'calls': 1" in caplog.text
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from gpt_service import tts
+from gpt_service.tts import MAX_FRAGMENT_LENGTH, MIN_FRAGMENT_LENGTH, SpeechSynthesizer, split_sentences
+
+
+def test_short_sentences_are_joined():
+    text = "Привет! Как дела? Это предложение достаточно длинное, чтобы стоять отдельно."
+
+    fragments = split_sentences(text)
+
+    assert fragments == ["Привет! Как дела? Это предложение достаточно длинное, чтобы стоять отдельно."]
+    assert " ".join(fragments) == text
+
+
+def test_long_sentence_is_cut_at_commas_and_spaces():
+    clause = "слово " * 20
+    text = ", ".join([clause.strip()] * 6) + "."
+
+    fragments = split_sentences(text)
+
+    assert len(fragments) > 1
+    assert all(len(fragment) <= MAX_FRAGMENT_LENGTH for fragment in fragments)
+    assert " ".join(fragments).split() == text.split()
+
+
+def test_text_without_spaces_is_cut_at_max_length():
+    fragments = split_sentences("а" * (MAX_FRAGMENT_LENGTH * 2 + 10))
+
+    assert [len(fragment) for fragment in fragments] == [MAX_FRAGMENT_LENGTH, MAX_FRAGMENT_LENGTH, 10]
+
+
+def test_whitespace_only_text_has_no_fragments():
+    assert split_sentences("  \n\t ") == []
+
+
+@pytest.fixture
+def synthesizer(monkeypatch):
+    calls = []
+
+    def fake_synthesize(text):
+        calls.append(text)
+        return text.encode("utf-8")
+
+    class FakeTranscoder:
+        async def to_voice(self, data, input_format):
+            return b"ogg:" + data
+
+    monkeypatch.setattr(SpeechSynthesizer, "_synthesize_sync", staticmethod(fake_synthesize))
+    monkeypatch.setattr(tts, "transcoder", FakeTranscoder())
+    synthesizer = SpeechSynthesizer(workers=2, cache_size=2)
+    synthesizer.calls = calls
+    yield synthesizer
+    synthesizer.close()
+
+
+def test_voice_is_cached_by_normalized_text(synthesizer):
+    text = "Первое предложение достаточно длинное для фрагмента. Второе тоже длинное, как и первое."
+
+    first = asyncio.run(synthesizer.synthesize(text))
+    second = asyncio.run(synthesizer.synthesize("  " + text.upper() + " "))
+
+    assert first == second
+    assert first.startswith(b"ogg:")
+    assert len(synthesizer.calls) == 2
+    assert synthesizer.hits == 1
+
+
+def test_phrases_are_reused_across_answers(synthesizer):
+    phrase = "Эта фраза встречается в разных ответах и длиннее минимума."
+    assert len(phrase) >= MIN_FRAGMENT_LENGTH
+
+    asyncio.run(synthesizer.synthesize(phrase + " Первый ответ заканчивается так, совсем по-другому."))
+    asyncio.run(synthesizer.synthesize(phrase + " А второй ответ заканчивается иначе, но тоже длинно."))
+
+    assert synthesizer.calls.count(phrase) == 1
+
+
+def test_caches_keep_only_recent_entries(synthesizer):
+    for number in range(3):
+        asyncio.run(synthesizer.synthesize_phrase(f"фраза {number}"))
+    asyncio.run(synthesizer.synthesize_phrase("фраза 0"))
+
+    assert len(synthesizer._phrases) == 2
+    assert synthesizer.calls == ["фраза 0", "фраза 1", "фраза 2", "фраза 0"]
+
+
+def test_empty_text_is_rejected(synthesizer):
+    with pytest.raises(ValueError):
+        asyncio.run(synthesizer.synthesize(" "))
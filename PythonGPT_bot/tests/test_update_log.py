@@ -0,0 +1,135 @@
+import asyncio
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from telegram import Chat, Message, Update, User
+
+from update_log import DurableUpdateQueue, UpdateLog
+
+
+def make_update(update_id, text="привет"):
+    chat = Chat(1, "private")
+    message = Message(update_id, datetime.now(), chat, from_user=User(1, "u", False), text=text)
+    return Update(update_id, message=message)
+
+
+def make_log(tmp_path, **kwargs):
+    return UpdateLog(str(tmp_path / "updates.sqlite3"), **kwargs)
+
+
+def test_duplicate_updates_are_rejected(tmp_path):
+    log = make_log(tmp_path)
+
+    assert log.append(make_update(10))
+    assert not log.append(make_update(10))
+    assert log.stats()["duplicates"] == 1
+    log.close()
+
+
+def test_unprocessed_updates_are_replayed_in_order(tmp_path):
+    log = make_log(tmp_path)
+    for update_id in (12, 10, 11):
+        log.append(make_update(update_id, text=f"текст {update_id}"))
+    log.mark_processed(11)
+    log.close()
+
+    restarted = make_log(tmp_path)
+    application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+
+    assert restarted.replay(application) == 2
+    replayed = [application.update_queue.get_nowait() for _ in range(2)]
+    assert [update.update_id for update in replayed] == [10, 12]
+    assert replayed[1].message.text == "текст 12"
+    restarted.close()
+
+
+def test_prune_removes_only_old_processed_updates(tmp_path):
+    log = make_log(tmp_path, retention=0.05)
+    log.append(make_update(1))
+    log.append(make_update(2))
+    log.mark_processed(1)
+    time.sleep(0.06)
+
+    log.prune()
+
+    assert log._db.execute("SELECT update_id FROM updates").fetchall() == [(2,)]
+    log.close()
+
+
+def test_update_ids_restarting_from_lower_number_are_accepted(tmp_path):
+    log = make_log(tmp_path, retention=0.05)
+    for update_id in range(100, 105):
+        log.append(make_update(update_id))
+        log.mark_processed(update_id)
+    time.sleep(0.06)
+    log.close()
+
+    # После простоя Telegram начал нумерацию заново, в том числе с уже встречавшихся номеров
+    restarted = make_log(tmp_path, retention=0.05)
+    assert restarted.append(make_update(7))
+    assert restarted.append(make_update(101))
+    assert restarted.stats()["pending"] == 2
+    restarted.close()
+
+
+def test_old_unpruned_row_does_not_hide_new_update(tmp_path):
+    log = make_log(tmp_path, retention=0.05, prune_every=1000)
+    log.append(make_update(5, text="старое"))
+    log.mark_processed(5)
+    time.sleep(0.06)
+
+    assert log.append(make_update(5, text="новое"))
+    application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+    log.replay(application)
+    assert application.update_queue.get_nowait().message.text == "новое"
+    log.close()
+
+
+def test_durable_queue_logs_and_skips_duplicates(tmp_path):
+    log = make_log(tmp_path)
+
+    async def scenario():
+        queue = DurableUpdateQueue(log)
+        await queue.put(make_update(1))
+        await queue.put(make_update(1))
+        await queue.put("не обновление")
+        return queue.qsize()
+
+    assert asyncio.run(scenario()) == 2
+    assert log.stats()["received"] == 1
+    log.close()
+
+
+def test_marks_are_written_in_one_batch_off_the_loop(tmp_path):
+    log = make_log(tmp_path, flush_interval=0.01)
+    queue = DurableUpdateQueue(log)
+
+    def processed():
+        return log._db.execute("SELECT COUNT(*) FROM updates WHERE processed = 1").fetchone()[0]
+
+    async def scenario():
+        for update_id in (1, 2, 3, 2):
+            await queue.put(make_update(update_id))
+        for update_id in (1, 2, 3):
+            log.mark_processed(update_id)
+        before = processed()
+        await log._flush_task
+        return before, processed()
+
+    before, after = asyncio.run(scenario())
+
+    assert queue.qsize() == 3
+    assert (before, after) == (0, 3)
+    log.close()
+
+
+def test_pending_filters_and_limits_by_shard(tmp_path):
+    log = make_log(tmp_path)
+    for update_id in range(1, 11):
+        log.append(make_update(update_id), shard=update_id % 2)
+
+    pending = log.pending(None, shard=0, limit=2, exclude={2})
+
+    assert [update.update_id for update in pending] == [4, 6]
+    log.close()
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from gpt_service.web_search import FakeSearchBackend, SearchBackend, SearchService, normalize_query
+
+
+class FailingBackend(SearchBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, max_results):
+        self.calls += 1
+        raise ConnectionError("нет сети")
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SearchBackend()
+
+
+def test_normalize_query():
+    assert normalize_query("  Ёлка, ЦЕНЫ?!  2024 ") == "елка цены 2024"
+
+
+def test_repeated_query_is_served_from_cache():
+    backend = FakeSearchBackend()
+    service = SearchService(backend)
+
+    async def scenario():
+        first = await service.search("Погода в Москве", 3)
+        second = await service.search("погода в москве!", 3)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first == second
+    assert len(first) == 3
+    assert backend.calls == 1
+    assert (service.hits, service.misses) == (1, 1)
+
+
+def test_concurrent_queries_share_one_backend_call():
+    backend = FakeSearchBackend(delay=0.05)
+    service = SearchService(backend)
+
+    async def scenario():
+        return await asyncio.gather(*(service.search("курс доллара") for _ in range(10)))
+
+    results = asyncio.run(scenario())
+
+    assert backend.calls == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_expired_entry_is_fetched_again():
+    backend = FakeSearchBackend()
+    service = SearchService(backend, ttl=0)
+
+    async def scenario():
+        await service.search("новости")
+        await service.search("новости")
+
+    asyncio.run(scenario())
+
+    assert backend.calls == 2
+
+
+def test_backend_errors_are_not_cached():
+    backend = FailingBackend()
+    service = SearchService(backend)
+
+    async def scenario():
+        return await service.search("новости"), await service.search("новости")
+
+    assert asyncio.run(scenario()) == ([], [])
+    assert backend.calls == 2
+
+
+def test_timeout_returns_empty_results():
+    service = SearchService(FakeSearchBackend(delay=0.2), timeout=0.01)
+
+    assert asyncio.run(service.search("медленный запрос")) == []
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from telegram import Update
+from telegram.ext import Application
+
+from chat_lanes import ChatLaneProcessor
+from state_backend import SharedState
+
+logger = logging.getLogger(__name__)
+
+# Файл журнала полученных обновлений
+UPDATE_LOG_PATH = os.getenv("UPDATE_LOG_PATH", "resources/updates.sqlite3")
+# Сколько хранить обработанные обновления для отсева повторов (секунды)
+UPDATE_LOG_RETENTION = float(os.getenv("UPDATE_LOG_RETENTION", "86400"))
+# Через сколько обработанных обновлений журнал очищается от старых записей
+UPDATE_LOG_PRUNE_EVERY = int(os.getenv("UPDATE_LOG_PRUNE_EVERY", "1000"))
+# Как часто отметки об обработке записываются в журнал одной транзакцией (секунды)
+UPDATE_LOG_FLUSH_INTERVAL = float(os.getenv("UPDATE_LOG_FLUSH_INTERVAL", "0.5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS updates (
+    update_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    received REAL NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    shard INTEGER
+);
+CREATE INDEX IF NOT EXISTS updates_pending ON updates (processed, update_id);
+"""
+
+# Номер обработчика нужен только журналу процесса приема в многопроцессном режиме
+SHARD_INDEX = "CREATE INDEX IF NOT EXISTS updates_shard_pending ON updates (shard, processed, update_id)"
+
+
+class UpdateLog:
+    """
+    Журнал полученных обновлений в SQLite (WAL).
+
+    Каждое обновление записывается до обработки и отмечается после нее.
+    Telegram считает обновления доставленными после следующего getUpdates,
+    а при остановке PTB отбрасывает очередь, поэтому необработанные
+    обновления из журнала повторно ставятся в очередь при запуске. Повторы
+    отсеиваются по update_id среди записей не старше retention: Telegram
+    хранит недоставленные обновления не дольше суток, а после долгого
+    простоя может начать нумерацию заново с меньшего номера, поэтому более
+    старая запись с тем же update_id повтором не считается.
+
+    Отметки об обработке копятся в памяти и записываются пачкой в потоке
+    раз в flush_interval, поэтому обработка обновления не ждет SQLite. Если
+    процесс упадет до записи, эти обновления будут повторены при запуске.
+    """
+
+    def __init__(self, path: str = UPDATE_LOG_PATH, retention: float = UPDATE_LOG_RETENTION,
+                 prune_every: int = UPDATE_LOG_PRUNE_EVERY, flush_interval: float = UPDATE_LOG_FLUSH_INTERVAL):
+        """
+        Args:
+            path (str): Путь к файлу журнала
+            retention (float): Время хранения обработанных обновлений в секундах
+            prune_every (int): Количество обработанных обновлений между очистками
+            flush_interval (float): Период записи отметок об обработке в секундах
+        """
+        self.path = path
+        self.retention = retention
+        self.prune_every = prune_every
+        self.flush_interval = flush_interval
+        # Соединение используется и из event loop, и из потоков записи
+        self._lock = threading.Lock()
+        self._marks: List[int] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._since_prune = 0
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(updates)")}
+        if "shard" not in columns:
+            # Журнал создан до появления многопроцессного режима
+            self._db.execute("ALTER TABLE updates ADD COLUMN shard INTEGER")
+        self._db.execute(SHARD_INDEX)
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        # Обновления, восстановленные при запуске, и время начала их обработки
+        self._replaying: set = set()
+        self._replay_total = 0
+        self._replay_started: Optional[float] = None
+        # После простоя в журнале могут остаться записи старше retention
+        self.prune()
+
+    def append(self, update: Update, shard: int = None) -> bool:
+        """
+        Записывает полученное обновление
+
+        Args:
+            update (Update): Обновление
+            shard (int, optional): Номер процесса-обработчика в многопроцессном режиме
+
+        Returns:
+            bool: False, если обновление с таким update_id уже было
+        """
+        now = time.time()
+        payload = update.to_json()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO updates (update_id, payload, received, shard) VALUES (?, ?, ?, ?)",
+                (update.update_id, payload, now, shard)
+            )
+            if not cursor.rowcount:
+                # Запись старше retention осталась от прежней нумерации и заменяется новым обновлением
+                cursor = self._db.execute(
+                    "UPDATE updates SET payload = ?, received = ?, processed = 0, shard = ? "
+                    "WHERE update_id = ? AND received < ?",
+                    (payload, now, shard, update.update_id, now - self.retention)
+                )
+        if not cursor.rowcount:
+            self.duplicates += 1
+            return False
+        self.received += 1
+        return True
+
+    def mark_processed(self, update_id: int):
+        """Отмечает обновление как обработанное; запись в журнал выполняется в фоне"""
+        self._marks.append(update_id)
+        self.processed += 1
+        if update_id in self._replaying:
+            self._replaying.discard(update_id)
+            if not self._replaying:
+                elapsed = time.monotonic() - self._replay_started
+                rate = self._replay_total / elapsed if elapsed else float("inf")
+                logger.info(f"Накопленные обновления обработаны: {self._replay_total} за {elapsed:.2f} с "
+                            f"({rate:.1f} обн/с)")
+        if self._flush_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (обслуживание, тесты) отметка записывается сразу
+            self.flush_marks()
+            return
+        self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        marks, self._marks = self._marks, []
+        self._flush_task = None
+        try:
+            await asyncio.to_thread(self._write_marks, marks)
+        except Exception as e:
+            logger.error(f"Ошибка при записи отметок в журнал обновлений: {e}")
+            # Отметки будут записаны вместе со следующими
+            self._marks[:0] = marks
+
+    def _write_marks(self, marks: List[int]):
+        if not marks:
+            return
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("UPDATE updates SET processed = 1 WHERE update_id = ?",
+                                     [(update_id,) for update_id in marks])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self._since_prune += len(marks)
+        if self._since_prune >= self.prune_every:
+            self._since_prune = 0
+            self.prune()
+
+    def flush_marks(self):
+        """Сразу записывает накопленные отметки об обработке"""
+        marks, self._marks = self._marks, []
+        self._write_marks(marks)
+
+    def pending(self, bot, shard: int = None, limit: int = None, exclude: Set[int] = frozenset()) -> list:
+        """
+        Возвращает необработанные обновления в порядке update_id
+
+        Args:
+            bot (Bot): Бот, к которому привязываются восстановленные обновления
+            shard (int, optional): Только обновления этого процесса-обработчика
+            limit (int, optional): Максимальное количество обновлений
+            exclude (Set[int]): update_id, которые нужно пропустить
+        """
+        self.flush_marks()
+        query = "SELECT update_id, payload FROM updates WHERE processed = 0"
+        params: list = []
+        if shard is not None:
+            query += " AND shard = ?"
+            params.append(shard)
+        query += " ORDER BY update_id"
+        if limit is not None:
+            # Пропущенные строки не входят в limit, поэтому читается с запасом
+            query += " LIMIT ?"
+            params.append(limit + len(exclude))
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        updates = [
+            Update.de_json(json.loads(payload), bot)
+            for update_id, payload in rows if update_id not in exclude
+        ]
+        return updates if limit is None else updates[:limit]
+
+    def replay(self, application: Application) -> int:
+        """
+        Ставит необработанные обновления в очередь приложения
+
+        Returns:
+            int: Количество восстановленных обновлений
+        """
+        updates = self.pending(application.bot)
+        for update in updates:
+            # Запись уже есть в журнале, поэтому обновление ставится в очередь напрямую
+            application.update_queue.put_nowait(update)
+        self._replaying = {update.update_id for update in updates}
+        self._replay_total = len(updates)
+        self._replay_started = time.monotonic()
+        if updates:
+            logger.info(f"Восстановлено необработанных обновлений: {len(updates)}")
+        return len(updates)
+
+    def prune(self):
+        """Удаляет обработанные обновления старше retention"""
+        deadline = time.time() - self.retention
+        with self._lock:
+            self._db.execute("DELETE FROM updates WHERE processed = 1 AND received < ?", (deadline,))
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает статистику журнала"""
+        self.flush_marks()
+        with self._lock:
+            pending = self._db.execute("SELECT COUNT(*) FROM updates WHERE processed = 0").fetchone()[0]
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "pending": pending,
+            "replaying": len(self._replaying)
+        }
+
+    def close(self):
+        """Записывает накопленные отметки и закрывает журнал"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush_marks()
+        with self._lock:
+            self._db.close()
+
+
+class DurableUpdateQueue(asyncio.Queue):
+    """Очередь обновлений приложения, которая записывает каждое обновление в журнал"""
+
+    def __init__(self, update_log: UpdateLog):
+        """
+        Args:
+            update_log (UpdateLog): Журнал обновлений
+        """
+        super().__init__()
+        self.update_log = update_log
+
+    async def put(self, item: object):
+        """Записывает обновление в журнал и ставит в очередь, если оно новое"""
+        # Запись в SQLite выполняется вне event loop
+        if isinstance(item, Update) and not await asyncio.to_thread(self.update_log.append, item):
+            logger.debug(f"Повторное обновление {item.update_id} пропущено")
+            return
+        await super().put(item)
+
+
+class DurableApplication(Application):
+    """
+    Приложение, которое отмечает обновления в журнале после обработки
+    и синхронизирует состояние чата с общим хранилищем вокруг обработки
+    """
+
+    def __init__(self, *, update_log: UpdateLog, shared_state: SharedState = None, **kwargs):
+        super().__init__(**kwargs)
+        self.update_log = update_log
+        self.shared_state = shared_state
+
+    async def process_update(self, update: object):
+        state_keys = None
+        try:
+            if self.shared_state is not None and isinstance(update, Update):
+                state_keys = await self.shared_state.load(update)
+            await super().process_update(update)
+        finally:
+            if state_keys:
+                self.shared_state.save(state_keys)
+            # Обновление, вызвавшее ошибку, тоже отмечается, чтобы не повторять его при каждом запуске
+            if isinstance(update, Update):
+                self.update_log.mark_processed(update.update_id)
+                # Присоединенные тексты обработаны вместе с этим обновлением
+                if isinstance(self.update_processor, ChatLaneProcessor):
+                    for update_id in self.update_processor.merged_into(update.update_id):
+                        self.update_log.mark_processed(update_id)
+
+
+update_log = UpdateLog()
@@ -2,6 +2,8 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, BotCom
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
+from media import media_registry
+from registry import resource_registry
 
 
 # конвертирует объект user в строку
@@ -43,10 +45,9 @@ async def send_text_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE,
     return await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
 
 
-# посылает в чат фото
+# посылает в чат фото (после первой загрузки - по file_id)
 async def send_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, name: str) -> Message:
-    with open('resources/images/' + name + ".jpg", 'rb') as photo:
-        return await context.bot.send_photo(chat_id=update.effective_chat.id, photo=photo)
+    return await media_registry.send_photo(context.bot, update.effective_chat.id, name)
 
 
 # отображает команду и главное меню
@@ -62,17 +63,11 @@ async def hide_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await context.bot.set_chat_menu_button(menu_button=MenuButtonDefault(), chat_id=update.effective_chat.id)
 
 
-# загружает сообщение из папки  /resources/messages/
+# возвращает сообщение из папки  /resources/messages/ (загружено в память)
 def load_message(name):
-    with open("resources/messages/" + name + ".txt", "r", encoding="utf8") as file:
-        return file.read()
+    return resource_registry.get("messages", name)
 
 
-# загружает промпт из папки  /resources/messages/
+# возвращает промпт из папки  /resources/prompts/ (загружен в память)
 def load_prompt(name):
-    with open("resources/prompts/" + name + ".txt", "r", encoding="utf8") as file:
-        return file.read()
-
-
-class Dialog:
-    pass
\ No newline at end of file
+    return resource_registry.get("prompts", name)
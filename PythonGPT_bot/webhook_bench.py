@@ -0,0 +1,126 @@
+"""
+Нагрузочный стенд для вебхука: отправляет синтетические обновления Telegram
+на запущенный в режиме webhook бот и считает количество обновлений в секунду.
+
+Пример:
+    python webhook_bench.py --url http://127.0.0.1:8443/telegram --secret $WEBHOOK_SECRET --count 2000
+"""
+import argparse
+import asyncio
+import time
+from itertools import count
+
+import httpx
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Номера обновлений не повторяются между прогонами: бот отсеивает уже полученные update_id
+_update_ids = count(time.time_ns() // 1000)
+
+
+def make_update(chat_id: int, text: str) -> dict:
+    """
+    Создает синтетическое обновление с текстовым сообщением
+
+    Args:
+        chat_id (int): ID чата и пользователя
+        text (str): Текст сообщения
+
+    Returns:
+        dict: Обновление в формате Bot API
+    """
+    update_id = next(_update_ids)
+    user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text
+        }
+    }
+
+
+def percentile(values: list, q: float) -> float:
+    """Возвращает перцентиль q (0..1) отсортированного списка"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(url: str, secret: str, total: int, concurrency: int, chats: int, text: str,
+              start_id: int = None) -> dict:
+    """
+    Отправляет total обновлений в concurrency потоков
+
+    Args:
+        start_id (int, optional): Номер первого обновления, по умолчанию зависит от текущего времени
+
+    Returns:
+        dict: Статистика прогона
+    """
+    global _update_ids
+    if start_id is not None:
+        _update_ids = count(start_id)
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(make_update(1_000_000 + i % chats, text))
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=update, headers={SECRET_HEADER: secret})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        # Запрос с неверным секретом должен быть отклонен
+        response = await client.post(url, json=make_update(1, text), headers={SECRET_HEADER: secret + "x"})
+        rejected = response.status_code == 403
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "updates": total,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "statuses": statuses,
+        "wrong_secret_rejected": rejected
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд для вебхука бота")
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram", help="Адрес вебхука")
+    parser.add_argument("--secret", required=True, help="Значение WEBHOOK_SECRET")
+    parser.add_argument("--count", type=int, default=1000, help="Количество обновлений")
+    parser.add_argument("--concurrency", type=int, default=32, help="Количество одновременных запросов")
+    parser.add_argument("--chats", type=int, default=100, help="Количество разных чатов")
+    parser.add_argument("--text", default="/start", help="Текст сообщений")
+    parser.add_argument("--start-id", type=int, default=None,
+                        help="Номер первого обновления (по умолчанию — по текущему времени)")
+    args = parser.parse_args()
+
+    stats = asyncio.run(run(args.url, args.secret, args.count, args.concurrency, args.chats, args.text,
+                            args.start_id))
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()